@@ -1,9 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
-from pathlib import Path
 
 load_dotenv()
 
@@ -31,6 +29,9 @@ from routes.analyze import router as analyze_router
 from routes.headline import router as headline_router
 from routes.competitor import router as competitor_router
 from routes.queue import router as queue_router
+from routes.metrics import router as metrics_router
+from routes.events import router as events_router
+from routes.retention import router as retention_router
 
 app.include_router(templates_router)
 app.include_router(assets_router)
@@ -40,23 +41,83 @@ app.include_router(analyze_router)
 app.include_router(headline_router)
 app.include_router(competitor_router)
 app.include_router(queue_router)
+app.include_router(metrics_router)
+app.include_router(events_router)
+app.include_router(retention_router)
 
-# Ensure data directories exist
-data_dir = Path(os.getenv("DATA_DIR", "./data"))
-(data_dir / "templates").mkdir(parents=True, exist_ok=True)
-(data_dir / "assets" / "backgrounds").mkdir(parents=True, exist_ok=True)
-(data_dir / "assets" / "fonts").mkdir(parents=True, exist_ok=True)
-(data_dir / "assets" / "overlays").mkdir(parents=True, exist_ok=True)
-(data_dir / "assets" / "subjects").mkdir(parents=True, exist_ok=True)
-(data_dir / "assets" / "keeper").mkdir(parents=True, exist_ok=True)
-(data_dir / "outputs").mkdir(parents=True, exist_ok=True)
+# Serve static files (assets and outputs) through the storage backend -
+# flat URLs, sharded on disk; asset filenames are aliases onto
+# content-addressed blobs
+from services.static_files import StorageStaticFiles, asset_file, output_etag
+from services.storage import storage
 
-# Serve static files (assets and outputs)
-app.mount("/static/assets", StaticFiles(directory=data_dir / "assets"), name="assets")
-app.mount("/static/outputs", StaticFiles(directory=data_dir / "outputs"), name="outputs")
+static_root = storage.cache_root
+app.mount("/static/assets", StorageStaticFiles(directory=static_root, resolve=asset_file), name="assets")
+app.mount(
+    "/static/blobs",
+    StorageStaticFiles(directory=static_root, resolve=storage.get_blob_path, immutable=True),
+    name="blobs",
+)
+app.mount(
+    "/static/derived",
+    StorageStaticFiles(directory=static_root, resolve=storage.derivatives.served_path, immutable=True),
+    name="derived",
+)
+app.mount(
+    "/static/outputs",
+    StorageStaticFiles(
+        directory=static_root,
+        resolve=storage.get_output_path,
+        on_access=storage.output_catalog.touch,
+        etag=output_etag,
+        versioned=True,
+    ),
+    name="outputs",
+)
+app.mount(
+    "/static/thumbs",
+    StorageStaticFiles(
+        directory=static_root,
+        resolve=storage.get_output_thumbnail,
+        on_access=storage.output_catalog.touch,
+        versioned=True,
+    ),
+    name="thumbs",
+)
+
+from services.change_feed import change_feed
+from services.scheduler import scheduler
+from services.gemini_client import gemini
+from services.warm_pool import warm_pool
+from services.retention import retention
+from services.queue_archive import queue_archive
+from services.render_pool import render_pool
+from services.async_storage import async_storage
+
+
+@app.on_event("startup")
+async def start_services():
+    change_feed.start()
+    await render_pool.start()
+    await scheduler.start()
+    await warm_pool.start()
+    await retention.start()
+    await queue_archive.start()
+
+
+@app.on_event("shutdown")
+async def stop_services():
+    await scheduler.stop()
+    await warm_pool.stop()
+    await retention.stop()
+    await queue_archive.stop()
+    await render_pool.stop()
+    change_feed.stop()
+    await gemini.close()
+    async_storage.shutdown()
 
 
 @app.get("/health")
 def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint, with disk usage of the data directory."""
+    return {"status": "healthy", "disk": retention.disk_usage()}
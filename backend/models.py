@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Literal
 from datetime import datetime
 
@@ -127,9 +127,13 @@ class GenerateRequest(BaseModel):
     data: dict
     variants: int = 1
     webhook_url: Optional[str] = None
+    priority: Literal["ui", "api", "backfill"] = "api"
+    client_id: Optional[str] = None  # defaults to X-Client-ID header or caller IP
+    timeout_seconds: Optional[int] = Field(None, ge=1)  # per-attempt deadline; defaults to JOB_TIMEOUT_SECONDS
 
 
 class GenerateResponse(BaseModel):
     job_id: str
     status: str
     outputs: list[dict] = []
+    deduplicated: bool = False  # True when an existing job answered the request
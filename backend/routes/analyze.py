@@ -20,11 +20,12 @@ class AnalysisContext(BaseModel):
 class AnalyzeRequest(BaseModel):
     image: str  # base64 encoded PNG
     context: Optional[AnalysisContext] = None
+    force_refresh: bool = False  # skip the analysis cache
 
 
 @router.post("")
 async def analyze_thumbnail(request: AnalyzeRequest):
-    """Analyze a thumbnail image for CTR optimization."""
+    """Analyze a thumbnail image for CTR optimization (cached per image and context)."""
     # 1. Check if analyzer is available (API key configured)
     if not thumbnail_analyzer.is_available():
         raise HTTPException(
@@ -61,6 +62,7 @@ async def analyze_thumbnail(request: AnalyzeRequest):
             competitors=context.competitors if context.competitors else None,
             video_title=context.video_title if context.video_title else None,
             target_emotion=context.target_emotion if context.target_emotion != "curiosity" else None,
+            force_refresh=request.force_refresh,
         )
     except Exception as e:
         raise HTTPException(
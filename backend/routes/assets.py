@@ -1,11 +1,18 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+import os
+
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File
+from services.async_storage import async_storage
+from services.static_files import conditional_response, content_etag
 from services.storage import storage
+from services.uploads import UploadRejected, UploadTooLarge, stage_upload, validate_asset
 
 router = APIRouter(prefix="/api/assets", tags=["assets"])
 
 
 VALID_ASSET_TYPES = ["backgrounds", "fonts", "overlays", "subjects", "keeper"]
+MAX_UPLOAD_BYTES = int(float(os.getenv("ASSET_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+# Allowance for multipart boundaries and headers when checking Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
 
 
 @router.get("")
@@ -27,25 +34,52 @@ def list_assets(asset_type: str):
 
 
 @router.post("/{asset_type}")
-async def upload_asset(asset_type: str, file: UploadFile = File(...)):
+async def upload_asset(request: Request, asset_type: str, file: UploadFile = File(...)):
     if asset_type not in VALID_ASSET_TYPES:
         raise HTTPException(status_code=400, detail="Invalid asset type")
+    if not storage.valid_name(file.filename):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    content_length = request.headers.get("content-length")
+    if content_length:
+        if not content_length.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+            raise HTTPException(status_code=413, detail="Upload too large")
 
-    content = await file.read()
-    result = storage.save_asset(asset_type, file.filename, content)
-    return result
+    # Copy, validate and move into place off the event loop
+    try:
+        staged = await async_storage.run(
+            stage_upload, file.file, storage.asset_store.blobs_dir, MAX_UPLOAD_BYTES
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        await async_storage.run(validate_asset, asset_type, file.filename, staged.path)
+        return await async_storage.save_staged_asset(
+            asset_type, file.filename, staged.path, staged.digest, staged.size
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    finally:
+        staged.discard()
 
 
 @router.delete("/{asset_type}/{filename}")
-def delete_asset(asset_type: str, filename: str):
+def delete_asset(asset_type: str, filename: str, force: bool = False):
+    used_by = storage.asset_references().get((asset_type, filename), [])
+    if used_by and not force:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": f"Asset is used by {len(used_by)} template(s)", "templates": used_by},
+        )
     if not storage.delete_asset(asset_type, filename):
         raise HTTPException(status_code=404, detail="Asset not found")
     return {"status": "deleted"}
 
 
 @router.get("/{asset_type}/{filename}")
-def get_asset(asset_type: str, filename: str):
+def get_asset(request: Request, asset_type: str, filename: str):
     path = storage.get_asset_path(asset_type, filename)
     if not path:
         raise HTTPException(status_code=404, detail="Asset not found")
-    return FileResponse(path)
+    return conditional_response(path, request.headers, etag=content_etag(str(path)))
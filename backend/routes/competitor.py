@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 
+from services.async_storage import async_storage
 from services.competitor_analyzer import competitor_analyzer
 
 router = APIRouter(prefix="/api/competitor", tags=["competitor"])
@@ -33,7 +34,7 @@ async def analyze_channel(request: AnalyzeChannelRequest):
 @router.get("/niche/{niche}")
 async def get_niche_profile(niche: str):
     """Get a stored niche profile."""
-    profile = competitor_analyzer.load_niche_profile(niche)
+    profile = await async_storage.run(competitor_analyzer.load_niche_profile, niche)
     if not profile:
         raise HTTPException(status_code=404, detail=f"Niche profile '{niche}' not found")
     return profile
@@ -42,4 +43,4 @@ async def get_niche_profile(niche: str):
 @router.get("/niches")
 async def list_niches():
     """List all available niche profiles."""
-    return {"niches": competitor_analyzer.list_niches()}
+    return {"niches": await async_storage.run(competitor_analyzer.list_niches)}
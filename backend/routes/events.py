@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Request, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional, Literal
+import json
+
+from services.events import event_bus
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    topic: Optional[Literal["generate", "queue"]] = None,
+    job_id: Optional[str] = None,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events stream of job progress.
+
+    Filter with `topic` and/or `job_id`. Reconnecting clients resume via the
+    standard Last-Event-ID header (sent automatically by EventSource) or the
+    `last_event_id` query parameter.
+    """
+    if last_event_id is None and last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+
+    async def stream():
+        # Tell the client how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        async for event in event_bus.subscribe(last_event_id, topic=topic, job_id=job_id):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield (
+                f"id: {event['id']}\n"
+                f"event: {event['event']}\n"
+                f"data: {json.dumps(event, default=str)}\n\n"
+            )
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
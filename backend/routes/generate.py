@@ -1,62 +1,206 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request
 from typing import Optional
+import asyncio
 import uuid
-import httpx
 import base64
 
 from models import GenerateRequest, GenerateResponse, Template
-from services.storage import storage
-from services.renderer import renderer
+from services.async_storage import async_storage
+from services.render_pool import render_pool, RenderTimeout
 from services.imagen import imagen
+from services.scheduler import scheduler, QueueFullError
+from services.events import event_bus
+from services.warm_pool import warm_pool
+from services.idempotency import idempotency_index, request_fingerprint, is_deterministic
+from services.queue_manager import QueueJob, queue_manager
+from services.queue_archive import queue_archive
+import services.pipeline  # registers the "generate" job handler
 
 router = APIRouter(prefix="/api/generate", tags=["generate"])
 
-# Simple in-memory job tracking
-jobs: dict[str, dict] = {}
+# How long a retry waits for an identical request that is still being queued
+RESERVATION_WAIT_SECONDS = 5
+
+# Queue job status -> generate API status
+GENERATE_STATUS = {
+    "queued": "processing",
+    "processing": "processing",
+    "pending": "complete",
+    "approved": "complete",
+    "failed": "error",
+    "dead": "error",
+    "cancelled": "cancelled",
+}
 
 
 @router.post("", response_model=GenerateResponse)
 async def generate_thumbnail(
     request: GenerateRequest,
-    background_tasks: BackgroundTasks,
+    http_request: Request,
 ):
     # Validate template exists
-    template = storage.get_template(request.template_id)
+    template = await async_storage.get_template(request.template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
-    # Create job
-    job_id = str(uuid.uuid4())[:8]
-    jobs[job_id] = {
-        "status": "processing",
-        "outputs": [],
-        "error": None,
-    }
-
-    # Run generation in background
-    background_tasks.add_task(
-        _generate_task,
-        job_id,
-        template,
-        request,
+    # Answer retries from the job that already handled them. Explicit
+    # Idempotency-Key headers always apply; fixed-background templates are
+    # deterministic, so identical requests are deduplicated automatically.
+    fingerprint = await async_storage.run(request_fingerprint, template, request)
+    dedup_keys = []
+    idempotency_key = http_request.headers.get("Idempotency-Key")
+    if idempotency_key:
+        dedup_keys.append(f"key:{idempotency_key}")
+    if is_deterministic(template):
+        dedup_keys.append(f"fp:{fingerprint}")
+
+    reserved = []
+    try:
+        for key in dedup_keys:
+            existing = await _reserve_key(key, fingerprint)
+            if existing:
+                for held in reserved:
+                    await async_storage.run(idempotency_index.assign, held, existing.job_id)
+                return existing
+            reserved.append(key)
+        job = await _submit(template, request, http_request)
+    except BaseException:
+        # Free the keys for a retry (those still unassigned, i.e. ours)
+        for key in reserved:
+            await async_storage.run(idempotency_index.discard, key, "")
+        raise
+
+    for key in reserved:
+        await async_storage.run(idempotency_index.assign, key, job.id)
+
+    event_bus.publish(
+        "generate", job.id, "queued",
+        template_id=template.id,
+        episode_id=request.episode_id,
+        variants=request.variants,
+        priority=request.priority,
     )
 
-    return GenerateResponse(job_id=job_id, status="processing")
+    return GenerateResponse(job_id=job.id, status="processing")
 
 
-@router.get("/{job_id}/status", response_model=GenerateResponse)
-def get_job_status(job_id: str):
-    if job_id not in jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
+async def _submit(template: Template, request: GenerateRequest, http_request: Request) -> QueueJob:
+    # Queue the job (bounded, prioritised, fair per client); any worker
+    # process sharing the queue may run it
+    client_id = (
+        request.client_id
+        or http_request.headers.get("X-Client-ID")
+        or (http_request.client.host if http_request.client else "anonymous")
+    )
+    try:
+        job = await scheduler.submit(
+            template.id,
+            request.episode_id,
+            request.data,
+            priority=request.priority,
+            client_id=client_id,
+            source="ui" if request.priority == "ui" else "api",
+            params={
+                "variants": request.variants,
+                "webhook_url": request.webhook_url,
+                "timeout_seconds": request.timeout_seconds,
+            },
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return job
+
+
+async def _reserve_key(key: str, fingerprint: str) -> Optional[GenerateResponse]:
+    """
+    Reserve a dedup key for this request, or return the job already holding it.
+
+    None means the key is now ours. A key held by a request that is still
+    being queued is waited on briefly; after that the client is told to retry.
+    """
+    deadline = asyncio.get_running_loop().time() + RESERVATION_WAIT_SECONDS
+    while True:
+        record = await async_storage.run(idempotency_index.reserve, key, fingerprint)
+        if not record:
+            return None
+
+        if key.startswith("key:") and record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request",
+            )
+
+        if not record.job_id:
+            if asyncio.get_running_loop().time() >= deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="An identical request is still being queued",
+                    headers={"Retry-After": "1"},
+                )
+            await asyncio.sleep(0.05)
+            continue
+
+        existing = await _reusable_job(record.job_id)
+        if existing:
+            return existing
+        # Only drop the record if nobody has replaced it meanwhile
+        await async_storage.run(idempotency_index.discard, key, record.job_id)
+
+
+async def _reusable_job(job_id: str) -> Optional[GenerateResponse]:
+    """The job as a dedup answer, unless it failed or its outputs are gone."""
+    job = await async_storage.run(queue_manager.get_job, job_id)
+    if not job or GENERATE_STATUS[job.status] in ("error", "cancelled"):
+        return None
 
-    job = jobs[job_id]
+    # Outputs deleted since the job ran, or overwritten by a later render of
+    # the same episode and template, cannot be reused
+    names = [o["filename"] for o in job.outputs]
+    hashes = await async_storage.output_hashes(names)
+    exists = await async_storage.outputs_exist(names)
+    for output in job.outputs:
+        name = output["filename"]
+        if not exists[name] or not output.get("hash") or hashes[name] != output["hash"]:
+            return None
+
+    return _response(job, deduplicated=True)
+
+
+def _response(job: QueueJob, deduplicated: bool = False) -> GenerateResponse:
     return GenerateResponse(
-        job_id=job_id,
-        status=job["status"],
-        outputs=job["outputs"],
+        job_id=job.id,
+        status=GENERATE_STATUS[job.status],
+        outputs=job.outputs,
+        deduplicated=deduplicated,
     )
 
 
+@router.get("/{job_id}/status", response_model=GenerateResponse)
+async def get_job_status(job_id: str):
+    job = await async_storage.run(queue_manager.get_job, job_id)
+    if not job:
+        # Finished jobs are moved to the archive after QUEUE_ARCHIVE_DAYS
+        job = await async_storage.run(queue_archive.find, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _response(job)
+
+
+@router.post("/{job_id}/cancel", response_model=GenerateResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; a render in progress is killed."""
+    job = await scheduler.cancel_job(job_id)
+    if not job:
+        if not await async_storage.run(queue_manager.get_status, job_id):
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return _response(job)
+
+
 from pydantic import BaseModel
 
 class PreviewRequest(BaseModel):
@@ -67,16 +211,18 @@ class PreviewRequest(BaseModel):
 @router.post("/preview")
 async def preview_thumbnail(request: PreviewRequest):
     """Generate a preview without saving to outputs"""
-    template = storage.get_template(request.template_id)
+    template = await async_storage.get_template(request.template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
     try:
-        image_bytes = renderer.render(template, request.data, request.background_override)
+        image_bytes = await render_pool.render(template, request.data, request.background_override)
         return {
             "image": base64.b64encode(image_bytes).decode("utf-8"),
             "format": "png",
         }
+    except RenderTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -98,7 +244,7 @@ async def generate_background(request: GenerateBackgroundRequest):
         )
 
     try:
-        image_bytes = imagen.generate(
+        image_bytes = await imagen.generate(
             prompt=request.prompt,
             negative_prompt=request.negative_prompt,
             width=request.width,
@@ -110,7 +256,7 @@ async def generate_background(request: GenerateBackgroundRequest):
 
         # Save to backgrounds folder with unique name
         filename = f"ai-bg-{uuid.uuid4().hex[:8]}.png"
-        result = storage.save_asset("backgrounds", filename, image_bytes)
+        result = await async_storage.save_asset("backgrounds", filename, image_bytes)
 
         return {
             "success": True,
@@ -122,65 +268,22 @@ async def generate_background(request: GenerateBackgroundRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def _generate_task(
-    job_id: str,
-    template: Template,
-    request: GenerateRequest,
-):
-    try:
-        outputs = []
+class WarmPoolRequest(BaseModel):
+    template_id: str
+    episodes: list[dict]  # upcoming episode data, same shape as GenerateRequest.data
 
-        for i in range(request.variants):
-            background_override = None
-            if template.background.mode == "ai" and imagen.is_available():
-                prompt = template.background.ai_config.prompt_template.format(
-                    **request.data
-                )
-                bg_bytes = imagen.generate(
-                    prompt=prompt,
-                    negative_prompt=template.background.ai_config.negative_prompt,
-                    width=template.canvas.width,
-                    height=template.canvas.height,
-                )
 
-                if bg_bytes:
-                    bg_filename = f"_temp_{job_id}_{i}.png"
-                    storage.save_asset("backgrounds", bg_filename, bg_bytes)
-                    background_override = bg_filename
-
-            image_bytes = renderer.render(template, request.data, background_override)
-
-            variant_suffix = f"-{i+1}" if request.variants > 1 else ""
-            filename = f"{request.episode_id}-{template.id}{variant_suffix}.png"
-            result = storage.save_output(filename, image_bytes)
-
-            outputs.append({
-                "path": result["path"],
-                "filename": result["filename"],
-                "size": "youtube",
-                "dimensions": [template.canvas.width, template.canvas.height],
-            })
-
-            if background_override and background_override.startswith("_temp_"):
-                storage.delete_asset("backgrounds", background_override)
-
-        jobs[job_id]["status"] = "complete"
-        jobs[job_id]["outputs"] = outputs
-
-        if request.webhook_url:
-            async with httpx.AsyncClient() as client:
-                try:
-                    await client.post(
-                        request.webhook_url,
-                        json={
-                            "job_id": job_id,
-                            "status": "complete",
-                            "outputs": outputs,
-                        },
-                    )
-                except Exception as e:
-                    print(f"Webhook error: {e}")
+@router.post("/warm", status_code=202)
+async def warm_backgrounds(request: WarmPoolRequest):
+    """Queue AI backgrounds for upcoming episodes so their jobs skip Imagen latency"""
+    if not warm_pool.enabled:
+        raise HTTPException(status_code=503, detail="Warm pool disabled. Set WARM_POOL_ENABLED=true.")
+
+    template = await async_storage.get_template(request.template_id)
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if template.background.mode != "ai":
+        raise HTTPException(status_code=400, detail="Template does not use AI backgrounds")
+
+    return {"queued": await asyncio.to_thread(warm_pool.schedule, template, request.episodes)}
 
-    except Exception as e:
-        jobs[job_id]["status"] = "error"
-        jobs[job_id]["error"] = str(e)
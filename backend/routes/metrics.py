@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+
+from services.scheduler import scheduler
+from services.rate_limiter import rate_limiter
+from services.warm_pool import warm_pool
+from services.retention import retention
+from services.queue_archive import queue_archive
+from services.render_pool import render_pool
+from services.change_feed import change_feed
+from services.analysis_cache import analysis_cache
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+# A plain def, so FastAPI runs it in its threadpool - the rate limiter and
+# warm pool budgets read SQLite
+@router.get("")
+def get_metrics():
+    """Runtime metrics for the generation pipeline (this process; queue counts are global)."""
+    return {
+        "scheduler": scheduler.metrics(),
+        "render_pool": render_pool.metrics(),
+        "gemini": rate_limiter.metrics(),
+        "warm_pool": warm_pool.metrics(),
+        "retention": retention.metrics(),
+        "queue_archive": queue_archive.metrics(),
+        "change_feed": change_feed.metrics(),
+        "analysis_cache": analysis_cache.metrics(),
+    }
@@ -1,21 +1,98 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import Optional
+import json
+import re
+from services.static_files import conditional_response
 from services.storage import storage
+from services.zip_stream import stream_zip
 
 router = APIRouter(prefix="/api/outputs", tags=["outputs"])
 
 
 @router.get("")
-def list_outputs():
-    return storage.list_outputs()
+def list_outputs(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    episode_id: Optional[str] = None,
+    template_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+):
+    """List outputs newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    try:
+        items, next_cursor = storage.list_outputs(
+            limit=limit,
+            cursor=cursor,
+            episode_id=episode_id,
+            template_id=template_id,
+            job_id=job_id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/export")
+def export_outputs(
+    episode_id: Optional[str] = None,
+    template_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """
+    Stream a ZIP of every output matching the filters (job_id is the batch
+    id), plus a manifest.json describing them. `since` is an ISO date or
+    datetime. The archive is built while it is sent.
+    """
+    if not any((episode_id, template_id, job_id, since)):
+        raise HTTPException(status_code=400, detail="Pass episode_id, template_id, job_id or since")
+    if since:
+        try:
+            since = datetime.fromisoformat(since).isoformat()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid since date")
+
+    filters = {"episode_id": episode_id, "template_id": template_id, "job_id": job_id, "created_after": since}
+    manifest = []
+
+    def files():
+        for record, path in storage.iter_output_files(**filters):
+            storage.output_catalog.touch(record["filename"])
+            manifest.append({
+                key: record[key]
+                for key in ("filename", "episode_id", "template_id", "job_id", "size", "hash", "created_at")
+            })
+            yield record["filename"], path
+
+    def extra():
+        yield "manifest.json", json.dumps({"filters": filters, "outputs": manifest}, indent=2).encode("utf-8")
+
+    label = "-".join(v for v in (episode_id, template_id, job_id) if v) or f"since-{since[:10]}"
+    label = re.sub(r"[^A-Za-z0-9._-]", "_", label)
+    return StreamingResponse(
+        stream_zip(files(), extra()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{label}-outputs.zip"'},
+    )
 
 
 @router.get("/{filename}")
-def get_output(filename: str):
+def get_output(request: Request, filename: str):
     path = storage.get_output_path(filename)
     if not path:
         raise HTTPException(status_code=404, detail="Output not found")
-    return FileResponse(path)
+    storage.output_catalog.touch(filename)
+    return conditional_response(path, request.headers, etag=storage.output_hash(filename))
+
+
+@router.get("/{filename}/thumbnail")
+def get_output_thumbnail(request: Request, filename: str):
+    """Small WebP of the output for galleries"""
+    path = storage.get_output_thumbnail(filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Output not found")
+    return conditional_response(path, request.headers, etag=path.stem)
 
 
 @router.delete("/{filename}")
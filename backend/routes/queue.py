@@ -1,46 +1,178 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from dataclasses import asdict
+from datetime import datetime
+from typing import Literal, Optional
 
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+
+from services.async_storage import async_storage
+from services.queue_archive import queue_archive
 from services.queue_manager import queue_manager
+from services.scheduler import QueueFullError, scheduler
 
 router = APIRouter(prefix="/api/queue", tags=["queue"])
 
+QueueStatus = Literal["queued", "processing", "pending", "approved", "failed", "dead", "cancelled"]
+
 
 class QueueSettingsRequest(BaseModel):
     auto_approve: bool
 
 
+class BulkRequest(BaseModel):
+    job_ids: list[str] = Field(..., min_length=1, max_length=5000)
+
+
+def _check_date(value: Optional[str], name: str) -> Optional[str]:
+    if value:
+        try:
+            datetime.fromisoformat(value.removesuffix("Z"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {name}")
+    return value
+
+
 @router.get("")
-async def get_queue():
-    """Get all queue items."""
-    jobs = queue_manager.get_all_jobs()
-    return {"jobs": [j.__dict__ for j in jobs]}
+async def get_queue(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[list[QueueStatus]] = Query(None),
+    source: Optional[Literal["ui", "api"]] = None,
+    template_id: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+):
+    """
+    List queue jobs newest first. Pass `next_cursor` back as `cursor` for
+    the next page; `status` may be repeated.
+    """
+    try:
+        jobs, next_cursor = await async_storage.run(
+            queue_manager.query,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            source=source,
+            template_id=template_id,
+            created_after=_check_date(created_after, "created_after"),
+            created_before=_check_date(created_before, "created_before"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    counts = await async_storage.run(queue_manager.status_counts)
+    return {"jobs": [asdict(j) for j in jobs], "next_cursor": next_cursor, "counts": counts}
+
+
+@router.get("/archive")
+async def get_archive(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[list[QueueStatus]] = Query(None),
+    source: Optional[Literal["ui", "api"]] = None,
+    template_id: Optional[str] = None,
+    episode_id: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+):
+    """
+    List archived (finished, older) jobs newest first, paged like
+    GET /api/queue. Narrow by created_after/created_before where possible:
+    each archived month in range is decompressed to answer.
+    """
+    try:
+        jobs, next_cursor = await async_storage.run(
+            queue_archive.query,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            source=source,
+            template_id=template_id,
+            episode_id=episode_id,
+            created_after=_check_date(created_after, "created_after"),
+            created_before=_check_date(created_before, "created_before"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"jobs": [asdict(j) for j in jobs], "next_cursor": next_cursor}
+
+
+@router.get("/archive/{job_id}")
+async def get_archived_job(job_id: str):
+    """Look up one archived job."""
+    job = await async_storage.run(queue_archive.find, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found in the archive")
+    return asdict(job)
+
+
+@router.post("/bulk/approve")
+async def bulk_approve(request: BulkRequest):
+    """Approve many pending jobs in one transaction."""
+    approved = await async_storage.run(queue_manager.approve_jobs, request.job_ids)
+    ids = {job.id for job in approved}
+    return {"approved": [job.id for job in approved], "skipped": [i for i in request.job_ids if i not in ids]}
+
+
+@router.post("/bulk/delete")
+async def bulk_delete(request: BulkRequest):
+    """Delete many jobs in one transaction. Running jobs are skipped."""
+    deleted = await async_storage.run(queue_manager.delete_jobs, request.job_ids)
+    ids = set(deleted)
+    return {"deleted": deleted, "skipped": [i for i in request.job_ids if i not in ids]}
+
+
+@router.post("/bulk/retry")
+async def bulk_retry(request: BulkRequest):
+    """
+    Put many failed, dead-lettered or cancelled jobs back in the queue with
+    fresh attempts. Subject to the same queue limits as new jobs (429).
+    """
+    try:
+        retried = await scheduler.retry(request.job_ids)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    ids = {job.id for job in retried}
+    return {"retried": [job.id for job in retried], "skipped": [i for i in request.job_ids if i not in ids]}
 
 
 @router.post("/{job_id}/approve")
 async def approve_job(job_id: str):
     """Approve a pending job."""
-    if not queue_manager.approve_job(job_id):
+    if not await async_storage.run(queue_manager.approve_job, job_id):
         raise HTTPException(status_code=404, detail="Job not found or not pending")
     return {"status": "approved"}
 
 
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    job = await scheduler.cancel_job(job_id)
+    if not job:
+        if not await async_storage.run(queue_manager.get_status, job_id):
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return asdict(job)
+
+
 @router.delete("/{job_id}")
 async def delete_job(job_id: str):
-    """Delete a job."""
-    if not queue_manager.delete_job(job_id):
+    """Delete a job. A running job has to be cancelled first."""
+    if not await async_storage.run(queue_manager.delete_job, job_id):
+        if await async_storage.run(queue_manager.get_status, job_id) == "processing":
+            raise HTTPException(status_code=409, detail="Job is running; cancel it first")
         raise HTTPException(status_code=404, detail="Job not found")
     return {"status": "deleted"}
 
 
 @router.patch("/settings")
 async def update_settings(request: QueueSettingsRequest):
-    """Update queue settings."""
-    queue_manager.set_auto_approve(request.auto_approve)
-    return {"auto_approve": queue_manager.auto_approve}
+    """Update queue settings (shared by every API and worker process)."""
+    await async_storage.run(queue_manager.set_auto_approve, request.auto_approve)
+    return {"auto_approve": request.auto_approve}
 
 
 @router.get("/settings")
 async def get_settings():
     """Get queue settings."""
-    return {"auto_approve": queue_manager.auto_approve}
+    return {"auto_approve": await async_storage.run(lambda: queue_manager.auto_approve)}
+
@@ -0,0 +1,21 @@
+from dataclasses import asdict
+
+from fastapi import APIRouter
+
+from services.retention import retention
+
+router = APIRouter(prefix="/api/retention", tags=["retention"])
+
+
+@router.get("")
+async def retention_report():
+    """Dry run: what a retention sweep would remove right now."""
+    report = await retention.sweep(dry_run=True)
+    return asdict(report)
+
+
+@router.post("/run")
+async def run_retention(dry_run: bool = False):
+    """Run a retention sweep now."""
+    report = await retention.sweep(dry_run=dry_run)
+    return asdict(report)
@@ -0,0 +1,177 @@
+"""
+Analysis Cache Service
+
+Remembers thumbnail analyses, so analyzing the same image again with the
+same context - the UI re-analyzing an unchanged preview, or a client
+re-submitting a thumbnail - is answered from disk instead of by another
+Gemini call.
+
+Entries are keyed by a perceptual hash of the image, a hash of the
+context fields, and the prompt version. The perceptual hash is a 256-bit
+difference hash, which survives re-encoding and rescaling: a lookup
+takes entries for the same context whose hash is within
+ANALYSIS_CACHE_MAX_DISTANCE bits. The hash alone can't see a changed
+word or text colour, so each entry also keeps a 32x18 colour
+signature, and a match must be within ANALYSIS_CACHE_TOLERANCE levels of
+it everywhere.
+
+Entries live in SQLite (data/analysis_cache.db), shared by every
+process, expire after ANALYSIS_CACHE_TTL_SECONDS (0 turns the cache
+off), and the least recently used go beyond ANALYSIS_CACHE_MAX_ENTRIES.
+"""
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from services.storage import storage
+
+# The hash compares HASH_SIZE x HASH_SIZE neighbouring pixels
+HASH_SIZE = 16
+SIGNATURE_SIZE = (32, 18)
+
+
+def fingerprint(image_bytes: bytes) -> tuple[str, bytes]:
+    """
+    Difference hash of an image (whether each pixel of a small grayscale
+    copy is darker than its right neighbour), as hex, plus its colour
+    signature (the image averaged down to SIGNATURE_SIZE, as RGB bytes).
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEGs can decode straight at a reduced size
+        image.draft("RGB", (SIGNATURE_SIZE[0] * 8, SIGNATURE_SIZE[1] * 8))
+        image = image.convert("RGB")
+        signature = image.resize(SIGNATURE_SIZE, Image.BOX).tobytes()
+        pixels = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).tobytes()
+    bits = 0
+    for y in range(HASH_SIZE):
+        row = y * (HASH_SIZE + 1)
+        for x in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[row + x] < pixels[row + x + 1])
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}", signature
+
+
+def _signature_distance(a: bytes, b: bytes) -> int:
+    if len(a) != len(b):
+        return 255
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def context_key(context: dict, prompt_version: str) -> str:
+    """Hash of everything besides the image that shapes an analysis."""
+    encoded = json.dumps({"context": context, "prompt": prompt_version}, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Persistent, TTL-limited LRU of analysis results."""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None else float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "604800"))
+        )
+        self.max_entries = max_entries or int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+        self.max_distance = int(os.getenv("ANALYSIS_CACHE_MAX_DISTANCE", "8"))
+        self.tolerance = int(os.getenv("ANALYSIS_CACHE_TOLERANCE", "8"))
+        self.db_path = Path(db_path or storage.data_dir / "analysis_cache.db")
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS analyses (
+                    image_hash  TEXT NOT NULL,
+                    context_key TEXT NOT NULL,
+                    signature   BLOB NOT NULL,
+                    result      TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    used_at     REAL NOT NULL,
+                    PRIMARY KEY (image_hash, context_key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_context ON analyses (context_key);
+                CREATE INDEX IF NOT EXISTS idx_analyses_used ON analyses (used_at);
+                """
+            )
+
+        # Metrics (this process)
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, image_hash: str, signature: bytes, context: str) -> Optional[dict]:
+        """The cached analysis of this image (or a near-identical one) and context, with cached_at, or None."""
+        now = time.time()
+        target = int(image_hash, 16)
+        best, best_distance = None, self.max_distance + 1
+        with self._lock, self._conn:
+            for candidate, stored in self._conn.execute(
+                "SELECT image_hash, signature FROM analyses WHERE context_key = ? AND created_at > ?",
+                (context, now - self.ttl_seconds),
+            ):
+                distance = (int(candidate, 16) ^ target).bit_count()
+                if distance < best_distance and _signature_distance(signature, stored) <= self.tolerance:
+                    best, best_distance = candidate, distance
+            if best is None:
+                self._misses += 1
+                return None
+            row = self._conn.execute(
+                "UPDATE analyses SET used_at = ? WHERE image_hash = ? AND context_key = ? RETURNING result, created_at",
+                (now, best, context),
+            ).fetchone()
+        self._hits += 1
+        result = json.loads(row[0])
+        result["cached_at"] = row[1]
+        return result
+
+    def put(self, image_hash: str, signature: bytes, context: str, result: dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (image_hash, context_key, signature, result, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (image_hash, context, signature, json.dumps(result, separators=(",", ":")), now, now),
+            )
+            self._conn.execute("DELETE FROM analyses WHERE created_at <= ?", (now - self.ttl_seconds,))
+            # Evict the least recently used beyond the bound
+            self._conn.execute(
+                "DELETE FROM analyses WHERE rowid IN ("
+                "SELECT rowid FROM analyses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM analyses").rowcount
+
+    def metrics(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+# Singleton instance
+analysis_cache = AnalysisCache()
@@ -0,0 +1,223 @@
+"""
+Asset Store Service
+
+Content-addressed blob store for uploaded assets. Each distinct file is
+stored once under its SHA-256 (key assets/_blobs/<ab>/<sha256><ext> in the
+storage backend),
+and the filenames templates refer to are aliases onto those blobs.
+Uploading identical content under several names costs one copy, and
+overwriting a name simply repoints the alias - the hash, and therefore
+the blob's URL, changes with the content.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from services.storage_backends import StorageBackend
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS aliases (
+    asset_type TEXT NOT NULL,
+    filename   TEXT NOT NULL,
+    hash       TEXT NOT NULL,
+    ext        TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (asset_type, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_aliases_hash ON aliases (hash);
+CREATE TABLE IF NOT EXISTS pins (
+    hash       TEXT NOT NULL,
+    ext        TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# A pin older than this was left by a crashed link() and no longer protects its blob
+PIN_SECONDS = 3600
+
+
+def blob_name(digest: str, ext: str) -> str:
+    return f"{digest}{ext}"
+
+
+class AssetStore:
+    """SHA-256 blob store with filename aliases, indexed in SQLite."""
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        db_path: Path,
+        on_collect: Optional[Callable[[str], None]] = None,
+        can_collect: Optional[Callable[[], bool]] = None,
+    ):
+        self.backend = backend
+        # Local directory uploads are staged in before they're stored
+        self.blobs_dir = backend.cache_root / "assets" / "_blobs"
+        self.on_collect = on_collect
+        # Whether this index is still the one the backend belongs to - alias
+        # counts are only complete then, so blobs are only deleted then
+        self.can_collect = can_collect
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        # Other processes may hold the write lock while collecting a blob
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    # Blobs
+
+    @staticmethod
+    def blob_key(digest: str, ext: str) -> str:
+        return f"assets/_blobs/{digest[:2]}/{blob_name(digest, ext)}"
+
+    def blob_path(self, digest: str, ext: str) -> Optional[Path]:
+        """A local copy of the blob, or None if it isn't stored."""
+        return self.backend.local_path(self.blob_key(digest, ext))
+
+    def _collect(self, digest: str, ext: str):
+        """
+        Delete a blob once no alias points at it.
+
+        The count and the delete happen under the database write lock, so
+        no alias or pin can be added in between, in any process. link()
+        pins the blob before checking whether it is stored, so it either
+        keeps the blob alive or finds it gone and writes it again.
+        """
+        if self.can_collect and not self.can_collect():
+            print(f"Asset store: keeping blob {digest}{ext}, the backend is indexed elsewhere")
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT (SELECT COUNT(*) FROM aliases WHERE hash = ? AND ext = ?) + "
+                    "(SELECT COUNT(*) FROM pins WHERE hash = ? AND ext = ? AND created_at > ?)",
+                    (digest, ext, digest, ext, time.time() - PIN_SECONDS),
+                ).fetchone()
+                if row[0] == 0:
+                    self.backend.delete(self.blob_key(digest, ext))
+                    if self.on_collect:
+                        self.on_collect(digest)
+                self._conn.execute("DELETE FROM pins WHERE created_at <= ?", (time.time() - PIN_SECONDS,))
+            finally:
+                self._conn.commit()
+
+    # Aliases
+
+    def put(self, asset_type: str, filename: str, content: bytes) -> dict:
+        """Store content and point (asset_type, filename) at it."""
+        digest = hashlib.sha256(content).hexdigest()
+        return self.link(asset_type, filename, digest, len(content), content=content)
+
+    def link(
+        self,
+        asset_type: str,
+        filename: str,
+        digest: str,
+        size: int,
+        content: Optional[bytes] = None,
+        source: Optional[Path] = None,
+    ) -> dict:
+        """
+        Point an alias at a blob, writing the blob from `content` or moving
+        it from `source` if it isn't stored yet.
+        """
+        ext = Path(filename).suffix.lower()
+        key = self.blob_key(digest, ext)
+        previous = self.resolve(asset_type, filename)
+        record = {
+            "asset_type": asset_type,
+            "filename": filename,
+            "hash": digest,
+            "ext": ext,
+            "size": size,
+            "created_at": datetime.now().isoformat(),
+        }
+        # Pin the blob first: from here a concurrent _collect can't delete
+        # it, and one that already ran has finished deleting
+        with self._lock, self._conn:
+            pin = self._conn.execute(
+                "INSERT INTO pins (hash, ext, created_at) VALUES (?, ?, ?)", (digest, ext, time.time())
+            ).lastrowid
+        try:
+            if not self.backend.exists(key):
+                if content is not None:
+                    self.backend.write_bytes(key, content)
+                elif source is not None:
+                    self.backend.write_file(key, Path(source))
+            elif source is not None and Path(source).exists():
+                # Already stored - the staged copy is a duplicate
+                os.unlink(source)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO aliases (asset_type, filename, hash, ext, size, created_at) "
+                    "VALUES (:asset_type, :filename, :hash, :ext, :size, :created_at)",
+                    record,
+                )
+                self._conn.execute("DELETE FROM pins WHERE rowid = ?", (pin,))
+        except BaseException:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM pins WHERE rowid = ?", (pin,))
+            raise
+        if previous and (previous["hash"], previous["ext"]) != (digest, ext):
+            self._collect(previous["hash"], previous["ext"])
+        return record
+
+    def resolve(self, asset_type: str, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM aliases WHERE asset_type = ? AND filename = ?",
+                (asset_type, filename),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def delete(self, asset_type: str, filename: str) -> bool:
+        record = self.resolve(asset_type, filename)
+        if not record:
+            return False
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM aliases WHERE asset_type = ? AND filename = ?",
+                (asset_type, filename),
+            )
+        self._collect(record["hash"], record["ext"])
+        return True
+
+    def list(self, asset_type: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM aliases WHERE asset_type = ? ORDER BY filename", (asset_type,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def alias_counts(self) -> dict[str, int]:
+        """hash -> number of aliases pointing at it."""
+        with self._lock:
+            rows = self._conn.execute("SELECT hash, COUNT(*) FROM aliases GROUP BY hash").fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def stats(self) -> dict:
+        with self._lock:
+            aliases, logical = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM aliases"
+            ).fetchone()
+            blobs, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "
+                "(SELECT hash, MAX(size) AS size FROM aliases GROUP BY hash, ext)"
+            ).fetchone()
+        return {
+            "aliases": aliases,
+            "blobs": blobs,
+            "logical_bytes": logical,
+            "stored_bytes": stored,
+        }
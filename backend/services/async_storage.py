@@ -0,0 +1,85 @@
+"""
+Async Storage Service
+
+Awaitable wrappers around StorageService for async routes. Every call runs
+on a dedicated I/O thread pool (STORAGE_IO_THREADS, default 8), so a slow
+disk or bucket stalls only the requests that are waiting on it - never the
+event loop - and storage work can't starve the default thread pool used
+by sync routes and renders.
+
+Sync code (renderer, workers, sync routes) keeps using `storage` directly.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from models import Template
+from services.storage import StorageService, storage
+
+
+class AsyncStorageService:
+    """StorageService methods as coroutines, run on a dedicated I/O pool."""
+
+    def __init__(self, service: StorageService, threads: int = 8):
+        self.service = service
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="storage-io")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run any blocking file/storage call on the I/O pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # Templates
+
+    async def get_template(self, template_id: str) -> Optional[Template]:
+        return await self.run(self.service.get_template, template_id)
+
+    async def list_templates(self) -> list[Template]:
+        return await self.run(self.service.list_templates)
+
+    # Assets
+
+    async def list_assets(self, asset_type: str) -> list[dict]:
+        return await self.run(self.service.list_assets, asset_type)
+
+    async def save_asset(self, asset_type: str, filename: str, content: bytes) -> dict:
+        return await self.run(self.service.save_asset, asset_type, filename, content)
+
+    async def save_staged_asset(self, asset_type: str, filename: str, source: Path, digest: str, size: int) -> dict:
+        return await self.run(self.service.save_staged_asset, asset_type, filename, source, digest, size)
+
+    async def get_asset_path(self, asset_type: str, filename: str) -> Optional[Path]:
+        return await self.run(self.service.get_asset_path, asset_type, filename)
+
+    # Outputs
+
+    async def save_output(self, filename: str, content: bytes, **metadata) -> dict:
+        return await self.run(self.service.save_output, filename, content, **metadata)
+
+    async def get_output_path(self, filename: str) -> Optional[Path]:
+        return await self.run(self.service.get_output_path, filename)
+
+    async def outputs_exist(self, filenames: list[str]) -> dict[str, bool]:
+        return await self.run(self.service.outputs_exist, filenames)
+
+    async def output_hashes(self, filenames: list[str]) -> dict[str, Optional[str]]:
+        return await self.run(self.service.output_hashes, filenames)
+
+
+# Singleton instance
+async_storage = AsyncStorageService(storage, threads=int(os.getenv("STORAGE_IO_THREADS", "8")))
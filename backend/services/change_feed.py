@@ -0,0 +1,254 @@
+"""
+Change Feed Service
+
+An append-only log in SQLite (data/feed.db) that every API and worker
+process sharing the data directory - all on one host - writes to and
+tails. It carries:
+- job progress events, so /api/events streams every job whichever
+  process runs it, and event ids mean the same thing on every process
+- cache invalidations: a process that changes something the others
+  cache (a template) publishes it, and the others drop their copy
+
+Each process tails the log on one thread, every CHANGE_FEED_POLL_SECONDS
+or as soon as it writes itself, and hands new rows to the listeners of
+their channel. Writes go through the same thread: publish() only queues
+the change, so callers on the event loop never wait on SQLite's write
+lock. Row ids increase across all processes. Only the newest
+CHANGE_FEED_HISTORY rows are kept.
+
+Set CHANGE_FEED_DB to an empty value to keep events in-process (a single
+API process only).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel    TEXT NOT NULL,
+    origin     TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_channel ON changes (channel, id);
+"""
+
+# How often a process trims the log
+PRUNE_SECONDS = 30
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ChangeFeed:
+    """Cross-process log of events and cache invalidations."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        default = str(Path(os.getenv("DATA_DIR", "./data")) / "feed.db")
+        self.db_path = (db_path if db_path is not None else os.getenv("CHANGE_FEED_DB", default)) or None
+        self.poll_seconds = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "0.2"))
+        self.history = int(os.getenv("CHANGE_FEED_HISTORY", "10000"))
+        # Identifies this process's own rows
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # channel -> [(callback, include_own)]
+        self._listeners: dict[str, list[tuple[Callable[[int, dict], None], bool]]] = {}
+        self._thread: Optional[threading.Thread] = None
+        # (channel, encoded payload, created_at) waiting for the feed thread to write
+        self._outbox: list[tuple[str, str, float]] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._last_id = 0
+
+        # Metrics
+        self._published = 0
+        self._received = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.db_path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the module never touches disk
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = _connect(self.db_path)
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # Writing
+
+    def publish(self, channel: str, payload: dict):
+        """
+        Append a change; listeners in every process see it. While the feed
+        thread runs, this only queues the change for it to write (ids are
+        assigned then), so it never blocks.
+        """
+        encoded = json.dumps(payload, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._thread:
+                self._outbox.append((channel, encoded, time.time()))
+            else:
+                # Not tailing (a CLI, or before start) - write straight away
+                self._connection().execute(
+                    "INSERT INTO changes (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (channel, self.origin, encoded, time.time()),
+                )
+                self._published += 1
+        # Write and deliver our own rows without waiting for the next poll
+        self._wakeup.set()
+
+    def _flush(self, conn: sqlite3.Connection):
+        """Write queued changes in one transaction (feed thread)."""
+        with self._lock:
+            outbox, self._outbox = self._outbox, []
+        if not outbox:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO changes (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+                [(channel, self.origin, encoded, created_at) for channel, encoded, created_at in outbox],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Keep them, in order, for the next round
+            with self._lock:
+                self._outbox[:0] = outbox
+            raise
+        self._published += len(outbox)
+
+    # Reading
+
+    def read(self, channel: str, after_id: int, limit: int = 10000) -> list[tuple[int, dict]]:
+        """Changes on a channel after after_id, oldest first."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, payload FROM changes WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+                (channel, after_id, limit),
+            ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def first_id(self) -> Optional[int]:
+        """Oldest id still in the log; anything before it was trimmed."""
+        with self._lock:
+            return self._connection().execute("SELECT MIN(id) FROM changes").fetchone()[0]
+
+    def last_id(self) -> int:
+        with self._lock:
+            row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    # Listening
+
+    def subscribe(self, channel: str, callback: Callable[[int, dict], None], include_own: bool = False):
+        """
+        Call callback(id, payload) on the feed thread for each new change on
+        channel. Changes this process published are skipped unless
+        include_own - a process updates its own caches as it writes.
+        """
+        self._listeners.setdefault(channel, []).append((callback, include_own))
+
+    def _tail(self):
+        conn = _connect(self.db_path)
+        pruned_at = time.monotonic()
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                self._flush(conn)
+            except sqlite3.Error as e:
+                print(f"Change feed: write failed, retrying: {e}")
+            try:
+                rows = conn.execute(
+                    "SELECT id, channel, origin, payload FROM changes WHERE id > ? ORDER BY id LIMIT 1000",
+                    (self._last_id,),
+                ).fetchall()
+                if time.monotonic() - pruned_at > PRUNE_SECONDS:
+                    pruned_at = time.monotonic()
+                    conn.execute(
+                        "DELETE FROM changes WHERE id <= (SELECT MAX(id) FROM changes) - ?", (self.history,)
+                    )
+            except sqlite3.Error as e:
+                print(f"Change feed: read failed: {e}")
+                continue
+
+            for change_id, channel, origin, payload in rows:
+                self._last_id = change_id
+                listeners = [cb for cb, own in self._listeners.get(channel, ()) if own or origin != self.origin]
+                if not listeners:
+                    continue
+                self._received += 1
+                decoded = json.loads(payload)
+                for callback in listeners:
+                    try:
+                        callback(change_id, decoded)
+                    except Exception as e:
+                        print(f"Change feed: {channel} listener failed: {e}")
+            if len(rows) == 1000:
+                # More to read - don't wait for the next poll
+                self._wakeup.set()
+        try:
+            self._flush(conn)
+        except sqlite3.Error as e:
+            print(f"Change feed: {len(self._outbox)} changes not written on shutdown: {e}")
+        conn.close()
+
+    def start(self):
+        """Start tailing the log (idempotent). Only changes from now on are delivered."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._tail, name="change-feed", daemon=True)
+        self._last_id = self.last_id()
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join(5)
+            with self._lock:
+                self._thread = None
+                # Anything published while the thread was finishing
+                outbox, self._outbox = self._outbox, []
+                if outbox:
+                    with self._connection() as conn:
+                        conn.executemany(
+                            "INSERT INTO changes (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+                            [(channel, self.origin, encoded, created_at) for channel, encoded, created_at in outbox],
+                        )
+                    self._published += len(outbox)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None,
+            "last_id": self._last_id,
+            "published": self._published,
+            "unwritten": len(self._outbox),
+            "received": self._received,
+        }
+
+
+# Singleton instance
+change_feed = ChangeFeed()
@@ -7,19 +7,14 @@ Uses Gemini 3.0 Flash Vision to read text from thumbnails.
 
 import os
 import json
-import asyncio
 import httpx
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 from dataclasses import dataclass, asdict
 
-try:
-    from google import genai
-    from google.genai import types
-    HAS_GENAI = True
-except ImportError:
-    HAS_GENAI = False
+from services.gemini_client import gemini, types, USE_NEW_SDK
+from services.storage_backends import atomic_write
 
 
 @dataclass
@@ -45,47 +40,46 @@ class CompetitorAnalyzer:
     """Analyzes competitor thumbnails to extract niche patterns."""
 
     def __init__(self):
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         self.youtube_api_key = os.getenv("YOUTUBE_API_KEY")
         self.data_dir = Path("./data/analytics/niche-profiles")
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.client = None
         self.model_name = "gemini-2.0-flash"  # Gemini 3.0 Flash
 
-    def _get_client(self):
-        """Get or create Gemini client."""
-        if not self.client and self.gemini_api_key and HAS_GENAI:
-            self.client = genai.Client(api_key=self.gemini_api_key)
-        return self.client
-
     def is_available(self) -> bool:
         """Check if the service is available."""
-        return bool(self.gemini_api_key and HAS_GENAI)
+        return gemini.is_available() and USE_NEW_SDK
 
-    async def extract_hook_from_thumbnail(self, thumbnail_url: str) -> Optional[str]:
+    async def extract_hook_from_thumbnail(
+        self,
+        thumbnail_url: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ) -> Optional[str]:
         """
         Extract hook text from a thumbnail image using Gemini Vision.
 
         Args:
             thumbnail_url: URL of the thumbnail image
+            http_client: Optional shared client so batch runs reuse connections
 
         Returns:
             Extracted hook text or None if extraction failed
         """
-        client = self._get_client()
-        if not client:
+        if not self.is_available():
             return None
 
         try:
             # Download the image
-            async with httpx.AsyncClient() as http_client:
+            if http_client:
                 response = await http_client.get(thumbnail_url)
-                if response.status_code != 200:
-                    return None
-                image_bytes = response.content
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(thumbnail_url)
+            if response.status_code != 200:
+                return None
+            image_bytes = response.content
 
             # Call Gemini Vision
-            result = client.models.generate_content(
+            result = await gemini.generate_content(
                 model=self.model_name,
                 contents=[
                     types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
@@ -225,11 +219,11 @@ class CompetitorAnalyzer:
         videos = await self.fetch_channel_videos(channel_id, max_videos)
 
         hooks = []
-        for video in videos:
-            hook = await self.extract_hook_from_thumbnail(video["thumbnail_url"])
-            if hook:
-                hooks.append(hook)
-            await asyncio.sleep(0.1)  # Rate limiting
+        async with httpx.AsyncClient() as http_client:
+            for video in videos:
+                hook = await self.extract_hook_from_thumbnail(video["thumbnail_url"], http_client)
+                if hook:
+                    hooks.append(hook)
 
         patterns = self._analyze_hooks(hooks)
 
@@ -245,8 +239,7 @@ class CompetitorAnalyzer:
     def save_niche_profile(self, niche: str, profile: NicheProfile):
         """Save a niche profile to disk."""
         path = self.data_dir / f"{niche.lower().replace(' ', '-')}.json"
-        with open(path, "w") as f:
-            json.dump(asdict(profile), f, indent=2)
+        atomic_write(path, json.dumps(asdict(profile), indent=2).encode("utf-8"))
 
     def load_niche_profile(self, niche: str) -> Optional[dict]:
         """Load a niche profile from disk."""
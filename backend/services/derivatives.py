@@ -0,0 +1,240 @@
+"""
+Asset Derivative Service
+
+Normalized copies of uploaded assets, built once so renders don't pay for
+decoding, converting and resizing raw uploads every time:
+- backgrounds: RGB variants resized to each size a template draws them at
+- subjects and overlays: RGBA conversions of the upload
+- every image: a small WebP gallery thumbnail
+- outputs: a WebP gallery thumbnail, built the first time it's requested
+- fonts: family, style and metrics parsed from the font file
+
+Derivatives are keyed by the source blob's SHA-256 and stored under
+data/assets/_derived/<ab>/, so they never go stale - new content means a
+new hash. They are built in a worker pool when an asset is saved, or on
+first use for sizes nobody asked for yet. Built images are lossless and
+made with the same conversions the renderer used, so renders come out
+pixel-identical.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageFont
+
+THUMBNAIL_SIZE = (320, 320)
+# Output gallery cards are wider than asset tiles
+GALLERY_SIZE = (480, 480)
+DEFAULT_CANVAS = (1280, 720)
+
+
+class DerivativeStore:
+    """Hash-keyed derivative files plus a small decoded-image cache."""
+
+    def __init__(self, derived_dir: Path, threads: int = 2, cache_size: int = 32):
+        self.derived_dir = Path(derived_dir)
+        self.derived_dir.mkdir(parents=True, exist_ok=True)
+        self.threads = threads
+        self.cache_size = cache_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cache: OrderedDict[tuple, Image.Image] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Paths
+
+    def path(self, digest: str, kind: str, ext: str = ".png") -> Path:
+        return self.derived_dir / digest[:2] / f"{digest}-{kind}{ext}"
+
+    def thumbnail_name(self, digest: str) -> Optional[str]:
+        """Filename of the gallery thumbnail under /static/derived, if built."""
+        path = self.path(digest, "thumb", ".webp")
+        return path.name if path.is_file() else None
+
+    def thumbnail_names(self, digests: list[str]) -> dict[str, Optional[str]]:
+        """thumbnail_name for many blobs, listing each shard directory once."""
+        shards: dict[str, set[str]] = {}
+        for digest in digests:
+            shards.setdefault(digest[:2], set())
+        for shard, names in shards.items():
+            try:
+                with os.scandir(self.derived_dir / shard) as entries:
+                    names.update(entry.name for entry in entries)
+            except FileNotFoundError:
+                pass
+        names = {}
+        for digest in digests:
+            name = self.path(digest, "thumb", ".webp").name
+            names[digest] = name if name in shards[digest[:2]] else None
+        return names
+
+    def served_path(self, name: str) -> Optional[Path]:
+        """Resolve a /static/derived filename."""
+        if "/" in name or len(name) < 2:
+            return None
+        path = self.derived_dir / name[:2] / name
+        return path if path.is_file() else None
+
+    def _save(self, path: Path, image: Image.Image, **params):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, **params)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    # Image derivatives
+
+    def image(
+        self,
+        source: Path,
+        digest: str,
+        mode: str,
+        size: Optional[tuple[int, int]] = None,
+        resample: Optional[int] = None,
+    ) -> Image.Image:
+        """
+        `Image.open(source).convert(mode)`, resized to `size` if given, served
+        from the derivative cache when possible.
+
+        The returned image is shared - treat it as read-only.
+        """
+        kind = self._kind(mode, size, resample)
+        key = (digest, kind)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        path = self.path(digest, kind)
+        if path.is_file():
+            with Image.open(path) as img:
+                image = img.convert(mode) if img.mode != mode else img.copy()
+        else:
+            image = self._build(source, path, mode, size, resample)
+
+        with self._lock:
+            self._cache[key] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return image
+
+    def ensure(
+        self,
+        source: Path,
+        digest: str,
+        mode: str,
+        size: Optional[tuple[int, int]] = None,
+        resample: Optional[int] = None,
+    ):
+        """Build an image derivative if it doesn't exist yet, without caching it."""
+        path = self.path(digest, self._kind(mode, size, resample))
+        if not path.is_file():
+            self._build(source, path, mode, size, resample)
+
+    @staticmethod
+    def _kind(mode: str, size: Optional[tuple[int, int]], resample: Optional[int]) -> str:
+        kind = mode.lower()
+        if size:
+            kind += f"-{size[0]}x{size[1]}" + (f"-r{resample}" if resample is not None else "")
+        return kind
+
+    def _build(self, source, path, mode, size, resample) -> Image.Image:
+        with Image.open(source) as img:
+            image = img.convert(mode)
+        if size:
+            image = image.resize(size, resample) if resample is not None else image.resize(size)
+        # Fast, lossless encode - these are read back far more than written
+        self._save(path, image, format="PNG", compress_level=1)
+        return image
+
+    def thumbnail(self, source: Path, digest: str, size: tuple[int, int] = THUMBNAIL_SIZE, kind: str = "thumb") -> Path:
+        path = self.path(digest, kind, ".webp")
+        if path.is_file():
+            return path
+        with Image.open(source) as img:
+            img.thumbnail(size, Image.LANCZOS)
+            thumb = img.convert("RGBA") if img.mode in ("RGBA", "LA", "P") else img.convert("RGB")
+        self._save(path, thumb, format="WEBP", quality=80)
+        return path
+
+    # Fonts
+
+    def font_info(self, source: Path, digest: str) -> Optional[dict]:
+        """Family, style and metrics for a font, parsed once and stored as JSON."""
+        path = self.path(digest, "font", ".json")
+        if path.is_file():
+            with open(path) as f:
+                return json.load(f)
+        try:
+            font = ImageFont.truetype(str(source), 100)
+        except OSError:
+            return None
+        family, style = font.getname()
+        ascent, descent = font.getmetrics()
+        info = {
+            "family": family,
+            "style": style,
+            # Per 100px of font size
+            "ascent": ascent,
+            "descent": descent,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(info, f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        return info
+
+    # Ingest
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="derive")
+        return self._executor
+
+    def submit(self, asset_type: str, source: Path, digest: str, variants: list[tuple] = ()):
+        """
+        Build an asset's derivatives in the background.
+
+        `variants` are extra (mode, size, resample) images to pre-build,
+        e.g. a background at the size a template draws it.
+        """
+        self._get_executor().submit(self._ingest, asset_type, source, digest, list(variants))
+
+    def _ingest(self, asset_type: str, source: Path, digest: str, variants: list[tuple]):
+        try:
+            if asset_type == "fonts":
+                self.font_info(source, digest)
+                return
+            self.thumbnail(source, digest)
+            if asset_type in ("subjects", "overlays"):
+                self.ensure(source, digest, "RGBA")
+            for mode, size, resample in variants:
+                self.ensure(source, digest, mode, size, resample)
+        except Exception as e:
+            print(f"Derivatives: failed to process {source.name}: {e}")
+
+    def remove(self, digest: str, kind: Optional[str] = None):
+        """Delete every derivative of a blob, or just those of one kind."""
+        shard = self.derived_dir / digest[:2]
+        if shard.is_dir():
+            for path in shard.glob(f"{digest}-{kind or '*'}.*"):
+                path.unlink(missing_ok=True)
+        if kind:
+            return
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == digest]:
+                del self._cache[key]
@@ -0,0 +1,167 @@
+"""
+Event Bus Service
+
+Publish/subscribe for job progress. Every event gets a monotonically
+increasing id and is kept in a bounded history, so streaming clients can
+reconnect with Last-Event-ID and pick up where they left off instead of
+polling.
+
+Events go through the change feed (data/feed.db), so subscribers in any
+API process see events from every process - jobs run wherever a worker
+claims them, and a reconnect may land on another process. The feed
+assigns the ids and keeps the history. Without the feed
+(CHANGE_FEED_DB="") the bus is in-process.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from services.change_feed import change_feed
+
+
+class EventBus:
+    """Bounded event history plus live fan-out to async subscribers."""
+
+    def __init__(self, history_size: Optional[int] = None):
+        self.history_size = history_size or int(os.getenv("EVENT_HISTORY_SIZE", "2000"))
+        self._history: deque[dict] = deque(maxlen=self.history_size)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        # (loop, queue) pairs - publish may be called from worker threads
+        self._subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self.shared = change_feed.enabled
+        if self.shared:
+            change_feed.subscribe("events", self._deliver, include_own=True)
+
+    def publish(self, topic: str, job_id: str, event: str, **data) -> dict:
+        """
+        Record an event and push it to every live subscriber.
+
+        Args:
+            topic: Event family ("generate" or "queue")
+            job_id: The job the event belongs to
+            event: State transition name (e.g. "queued", "rendering", "saved")
+            **data: Extra JSON-serialisable payload
+
+        Returns:
+            The published event (with the change feed, its id is assigned
+            when the feed thread writes it, and isn't set here)
+        """
+        message = {
+            "topic": topic,
+            "job_id": job_id,
+            "event": event,
+            "timestamp": time.time(),
+            "data": data,
+        }
+        if self.shared:
+            # Written and delivered by the feed thread, in id order with
+            # other processes' events - never blocks the caller
+            change_feed.publish("events", message)
+            return message
+
+        with self._lock:
+            message["id"] = self._next_id
+            self._next_id += 1
+            self._history.append(message)
+        self._deliver(message["id"], message)
+        return message
+
+    def _deliver(self, event_id: int, message: dict):
+        """Push an event to every live subscriber in this process."""
+        message["id"] = event_id
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # Subscriber's loop has shut down
+                with self._lock:
+                    self._subscribers.discard((loop, queue))
+
+    def _replay(self, last_event_id: int) -> tuple[list[dict], bool]:
+        """Events after last_event_id, and whether the history still covers it."""
+        if self.shared:
+            events = [dict(message, id=event_id) for event_id, message in change_feed.read("events", last_event_id)]
+            oldest = change_feed.first_id()
+            return events, oldest is None or last_event_id + 1 >= oldest
+        with self._lock:
+            events = [e for e in self._history if e["id"] > last_event_id]
+            oldest = self._history[0]["id"] if self._history else self._next_id
+        return events, last_event_id + 1 >= oldest
+
+    async def subscribe(
+        self,
+        last_event_id: Optional[int] = None,
+        topic: Optional[str] = None,
+        job_id: Optional[str] = None,
+        heartbeat: float = 15.0,
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield matching events, replaying history after last_event_id first.
+
+        Yields None every `heartbeat` seconds of silence so callers can send
+        keep-alives and notice disconnected clients. If the requested id has
+        already fallen out of history, a synthetic "reset" event is yielded
+        first, telling the client to refetch full state.
+        """
+        if self.shared:
+            change_feed.start()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        subscriber = (loop, queue)
+        # Register before replaying so nothing published in between is lost
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+        def matches(event: dict) -> bool:
+            return (
+                (topic is None or event["topic"] == topic)
+                and (job_id is None or event["job_id"] == job_id)
+            )
+
+        try:
+            seen = 0
+            if last_event_id is not None:
+                replay, complete = await asyncio.to_thread(self._replay, last_event_id)
+                if not complete:
+                    yield {
+                        "id": last_event_id,
+                        "topic": topic or "all",
+                        "job_id": job_id or "",
+                        "event": "reset",
+                        "timestamp": time.time(),
+                        "data": {},
+                    }
+                for event in replay:
+                    seen = event["id"]
+                    if matches(event):
+                        yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event["id"] <= seen or not matches(event):
+                    continue
+                yield event
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def last_event_id(self) -> int:
+        if self.shared:
+            return change_feed.last_id()
+        with self._lock:
+            return self._next_id - 1
+
+
+# Singleton instance
+event_bus = EventBus()
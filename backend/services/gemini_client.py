@@ -0,0 +1,169 @@
+"""
+Gemini Client Service
+
+One shared, async Gemini client for every service that talks to Google's
+models (Imagen backgrounds, thumbnail analysis, competitor hook
+extraction). Calls go through the SDK's async interface so a slow request
+never blocks the event loop, are bounded by a timeout, and are cancelled
+cleanly when the awaiting task is cancelled. The legacy SDK has no async
+interface, so its calls run on a dedicated thread pool instead.
+
+Every call is also metered by the process-wide rate limiter and circuit
+breaker (see services/rate_limiter.py).
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from services.rate_limiter import rate_limiter
+
+# Try the new google-genai package first, fall back to older one
+try:
+    from google import genai
+    from google.genai import types
+    USE_NEW_SDK = True
+except ImportError:
+    genai = None
+    types = None
+    USE_NEW_SDK = False
+
+try:
+    import google.generativeai as genai_old
+except ImportError:
+    genai_old = None
+
+# Rough token cost of one image part, used for TPM budgeting
+IMAGE_PART_TOKENS = 258
+
+
+def estimate_tokens(contents: list, config: Any = None) -> int:
+    """Estimate prompt plus maximum output tokens for TPM budgeting."""
+    tokens = 0
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+        else:
+            tokens += IMAGE_PART_TOKENS
+    return tokens + (getattr(config, "max_output_tokens", None) or 0)
+
+
+class GeminiClient:
+    """Process-wide Gemini client with timeouts and cancellation."""
+
+    def __init__(self):
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        self.timeout = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+        self._client = None
+        self._legacy_configured = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def is_available(self) -> bool:
+        """Check if an API key is configured."""
+        return bool(self.api_key)
+
+    def has_sdk(self) -> bool:
+        """Check if either Gemini SDK is installed."""
+        return USE_NEW_SDK or genai_old is not None
+
+    def _get_client(self):
+        """Get or create the shared SDK client (its HTTP session is reused)."""
+        if not self._client and self.api_key and USE_NEW_SDK:
+            self._client = genai.Client(
+                api_key=self.api_key,
+                http_options=types.HttpOptions(timeout=int(self.timeout * 1000)),
+            )
+        return self._client
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("GEMINI_THREADS", "4")),
+                thread_name_prefix="gemini",
+            )
+        return self._executor
+
+    async def generate_content(
+        self,
+        model: str,
+        contents: list,
+        config: Any = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Call models.generate_content without blocking the event loop.
+
+        Raises:
+            RuntimeError: If no client is configured
+            asyncio.TimeoutError: If the call exceeds the timeout
+        """
+        client = self._get_client()
+        if not client:
+            raise RuntimeError("Gemini client not configured")
+        estimated = estimate_tokens(contents, config)
+        async with rate_limiter.limit(model, tokens=estimated):
+            response = await asyncio.wait_for(
+                client.aio.models.generate_content(model=model, contents=contents, config=config),
+                timeout or self.timeout,
+            )
+        usage = getattr(response, "usage_metadata", None)
+        await rate_limiter.settle_tokens(model, estimated, getattr(usage, "total_token_count", 0) or 0)
+        return response
+
+    async def generate_images(
+        self,
+        model: str,
+        prompt: str,
+        config: Any = None,
+        timeout: Optional[float] = None,
+    ):
+        """Call models.generate_images without blocking the event loop."""
+        client = self._get_client()
+        if not client:
+            raise RuntimeError("Gemini client not configured")
+        async with rate_limiter.limit(model):
+            return await asyncio.wait_for(
+                client.aio.models.generate_images(model=model, prompt=prompt, config=config),
+                timeout or self.timeout,
+            )
+
+    def legacy(self):
+        """Return the configured legacy SDK module, or None if unavailable."""
+        if not genai_old or not self.api_key:
+            return None
+        if not self._legacy_configured:
+            genai_old.configure(api_key=self.api_key)
+            self._legacy_configured = True
+        return genai_old
+
+    async def run_blocking(
+        self,
+        fn: Callable,
+        *args,
+        rate_model: Optional[str] = None,
+        rate_tokens: int = 0,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ):
+        """Run a blocking SDK call on the Gemini thread pool, metered under rate_model."""
+        loop = asyncio.get_running_loop()
+        async with rate_limiter.limit(rate_model or "legacy", tokens=rate_tokens):
+            future = loop.run_in_executor(self._get_executor(), lambda: fn(*args, **kwargs))
+            return await asyncio.wait_for(future, timeout or self.timeout)
+
+    async def close(self):
+        """Release pooled connections and threads."""
+        if self._client:
+            aio = getattr(self._client, "aio", None)
+            aclose = getattr(aio, "aclose", None)
+            if aclose:
+                await aclose()
+            self._client = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Singleton instance
+gemini = GeminiClient()
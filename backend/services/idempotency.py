@@ -0,0 +1,157 @@
+"""
+Idempotency Service
+
+Maps idempotency keys and request fingerprints to the job that first
+handled them, so retried generate requests can be answered with the
+existing job instead of re-rendering (and re-firing webhooks).
+
+The index lives in SQLite (data/idempotency.db) so a retry is recognised
+whichever API process on this host it reaches. A request reserves its keys
+before submitting, so of two concurrent identical requests only one queues
+a job.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from models import GenerateRequest, Template
+from services.storage import storage
+
+# A reservation whose request died before queueing its job expires after this
+RESERVATION_SECONDS = 60
+
+
+@dataclass
+class IdempotencyRecord:
+    """The job a key resolved to, plus the fingerprint of the original request."""
+    job_id: str  # "" while the request holding the key is still submitting
+    fingerprint: str
+    created_at: float
+
+
+def request_fingerprint(template: Template, request: GenerateRequest) -> str:
+    """
+    Hash everything that determines the rendered output.
+
+    The template's version and updated_at stand in for the template
+    contents, so editing a template naturally invalidates old entries.
+    An asset can be re-uploaded under the same filename without touching
+    the template, so the assets' blob hashes are included too. Reads the
+    asset index, so call it off the event loop.
+    """
+    assets = {}
+    for asset_type, filename in storage.template_assets(template):
+        record = storage.asset_store.resolve(asset_type, filename)
+        assets[f"{asset_type}/{filename}"] = record["hash"] if record else None
+    payload = {
+        "template_id": template.id,
+        "template_version": template.version,
+        "template_updated_at": template.updated_at.isoformat(),
+        "assets": assets,
+        "episode_id": request.episode_id,
+        "data": request.data,
+        "variants": request.variants,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def is_deterministic(template: Template) -> bool:
+    """Fixed-background templates render the same image for the same data."""
+    return template.background.mode == "fixed"
+
+
+class IdempotencyIndex:
+    """Bounded, TTL-limited LRU of key -> job."""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+    ):
+        self.max_entries = max_entries or int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+        self.db_path = Path(db_path or storage.data_dir / "idempotency.db")
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS idempotency (
+                    key         TEXT PRIMARY KEY,
+                    job_id      TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    used_at     REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_idempotency_used ON idempotency (used_at);
+                """
+            )
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        """
+        Claim a key for a request about to queue its job.
+
+        Returns None if the key is now held by the caller (fill in the job
+        with assign(), or discard() it if the submit fails), otherwise the
+        record already holding it.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # Expired keys, and reservations never assigned a job, are free again
+            self._conn.execute(
+                "DELETE FROM idempotency WHERE key = ? AND "
+                "(created_at < ? OR (job_id = '' AND created_at < ?))",
+                (key, now - self.ttl_seconds, now - RESERVATION_SECONDS),
+            )
+            cursor = self._conn.execute(
+                "INSERT INTO idempotency (key, job_id, fingerprint, created_at, used_at) "
+                "VALUES (?, '', ?, ?, ?) ON CONFLICT (key) DO NOTHING",
+                (key, fingerprint, now, now),
+            )
+            if cursor.rowcount:
+                # Evict the least recently used keys beyond the bound
+                self._conn.execute(
+                    "DELETE FROM idempotency WHERE key IN ("
+                    "SELECT key FROM idempotency ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                return None
+            row = self._conn.execute(
+                "UPDATE idempotency SET used_at = ? WHERE key = ? "
+                "RETURNING job_id, fingerprint, created_at",
+                (now, key),
+            ).fetchone()
+        return IdempotencyRecord(job_id=row[0], fingerprint=row[1], created_at=row[2])
+
+    def assign(self, key: str, job_id: str):
+        """Point a reserved key at the job that now handles it."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE idempotency SET job_id = ?, used_at = ? WHERE key = ?",
+                (job_id, time.time(), key),
+            )
+
+    def discard(self, key: str, job_id: Optional[str] = None):
+        """Forget a key - only while it still points at job_id, if given."""
+        with self._lock, self._conn:
+            if job_id is None:
+                self._conn.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "DELETE FROM idempotency WHERE key = ? AND job_id = ?", (key, job_id)
+                )
+
+
+# Singleton instance
+idempotency_index = IdempotencyIndex()
@@ -1,48 +1,104 @@
-from PIL import Image, ImageDraw
-import io
-import os
+from PIL import Image
+from functools import lru_cache
 from typing import Optional
+import asyncio
+import io
+
+import numpy as np
+
+from services.gemini_client import gemini, types, USE_NEW_SDK
+from services.rate_limiter import CircuitOpenError, RateLimitExceeded
+
+
+# Rows darkened to black at the top and bottom edges of the fallback
+FALLBACK_EDGE_ROWS = 50
+
+
+@lru_cache(maxsize=8)
+def _fallback_gradient(width: int, height: int) -> Image.Image:
+    """Build the dark blue-gray fallback gradient with NumPy."""
+    t = np.arange(height, dtype=np.float64) / height
+    rows = np.stack([15 + t * 10, 15 + t * 12, 25 + t * 15], axis=1).astype(np.uint8)
 
-# Try the new google-genai package first, fall back to older one
-try:
-    from google import genai
-    from google.genai import types
-    USE_NEW_SDK = True
-except ImportError:
-    USE_NEW_SDK = False
-    try:
-        import google.generativeai as genai_old
-    except ImportError:
-        genai_old = None
+    # Black edge bands (vignette)
+    rows[:FALLBACK_EDGE_ROWS + 1] = 0
+    rows[max(height - FALLBACK_EDGE_ROWS, 0):] = 0
+
+    pixels = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+    return Image.fromarray(pixels, "RGB")
+
+
+@lru_cache(maxsize=8)
+def _fallback_png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    _fallback_gradient(width, height).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _decode_rgb(image_bytes: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
 
 
 class ImagenService:
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        self.client = None
-
-    def _get_client(self):
-        if not self.client and self.api_key:
-            if USE_NEW_SDK:
-                self.client = genai.Client(api_key=self.api_key)
-            else:
-                if genai_old:
-                    genai_old.configure(api_key=self.api_key)
-                    self.client = "legacy"
-        return self.client
+        self.model_name = "imagen-4.0-generate-001"
 
-    def generate(
+    async def generate(
         self,
         prompt: str,
         negative_prompt: str = "",
         width: int = 1280,
         height: int = 720,
     ) -> Optional[bytes]:
+        image_bytes, use_fallback, _ = await self._generate_remote(prompt, negative_prompt)
+        if use_fallback:
+            return self._generate_fallback(width, height)
+        return image_bytes
+
+    async def generate_image(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+        width: int = 1280,
+        height: int = 720,
+    ) -> Optional[Image.Image]:
+        """
+        Same as generate, but returns a decoded RGB image for the renderer.
+
+        The fallback comes straight from the decoded cache, skipping the
+        PNG encode/decode round-trip. Callers must not modify it in place.
+        """
+        image_bytes, use_fallback, _ = await self._generate_remote(prompt, negative_prompt)
+        if use_fallback:
+            return self.fallback_image(width, height)
+        if not image_bytes:
+            return None
+        return await asyncio.to_thread(_decode_rgb, image_bytes)
+
+    async def try_generate_image(
+        self,
+        prompt: str,
+        negative_prompt: str = "",
+    ) -> tuple[Optional[Image.Image], bool]:
+        """
+        Generate without the fallback, for speculative callers (the warm
+        pool). Returns (image or None, whether Imagen was actually called),
+        so the caller only counts calls that may have cost something.
+        """
+        image_bytes, _, called = await self._generate_remote(prompt, negative_prompt)
+        if not image_bytes:
+            return None, called
+        return await asyncio.to_thread(_decode_rgb, image_bytes), called
+
+    async def _generate_remote(self, prompt: str, negative_prompt: str) -> tuple[Optional[bytes], bool, bool]:
+        """
+        Call Imagen; returns (image bytes, whether to use the fallback
+        instead, whether the request reached Imagen).
+        """
         try:
-            client = self._get_client()
-            if not client:
+            if not gemini.is_available() or not gemini.has_sdk():
                 print("Imagen: No API key configured, using fallback")
-                return self._generate_fallback(width, height)
+                return None, True, False
 
             # Build full prompt
             full_prompt = prompt
@@ -51,8 +107,8 @@ class ImagenService:
 
             if USE_NEW_SDK:
                 # Use Imagen 4.0 for high-quality image generation
-                response = self.client.models.generate_images(
-                    model="imagen-4.0-generate-001",
+                response = await gemini.generate_images(
+                    model=self.model_name,
                     prompt=full_prompt,
                     config=types.GenerateImagesConfig(
                         number_of_images=1,
@@ -62,47 +118,37 @@ class ImagenService:
 
                 if response.generated_images:
                     image_bytes = response.generated_images[0].image.image_bytes
-                    return image_bytes
+                    return image_bytes, False, True
             else:
                 # Legacy SDK - Imagen not supported, use fallback
                 print("Imagen: Legacy SDK doesn't support image generation")
-                return self._generate_fallback(width, height)
+                return None, True, False
 
-            return None
+            return None, False, True
 
+        except (RateLimitExceeded, CircuitOpenError) as e:
+            # Refused before the request was sent
+            print(f"Imagen generation skipped: {e}")
+            return None, True, False
         except Exception as e:
             print(f"Imagen generation error: {e}")
-            # Return a fallback gradient background
-            return self._generate_fallback(width, height)
+            # Use a fallback gradient background
+            return None, True, True
 
     def _generate_fallback(self, width: int, height: int) -> bytes:
-        """Generate a dark gradient fallback background."""
-        img = Image.new("RGB", (width, height))
-        draw = ImageDraw.Draw(img)
-
-        # Create a dark gradient (top to bottom)
-        for y in range(height):
-            # Dark blue-gray gradient
-            r = int(15 + (y / height) * 10)
-            g = int(15 + (y / height) * 12)
-            b = int(25 + (y / height) * 15)
-            draw.line([(0, y), (width, y)], fill=(r, g, b))
-
-        # Add some subtle vignette effect
-        for i in range(50):
-            alpha = int(255 * (i / 50) * 0.3)
-            # Top
-            draw.rectangle([0, i, width, i + 1], fill=(0, 0, 0, alpha))
-            # Bottom
-            draw.rectangle([0, height - i - 1, width, height - i], fill=(0, 0, 0, alpha))
-
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-        return buffer.getvalue()
+        """Dark gradient fallback background as PNG bytes (cached per size)."""
+        return _fallback_png(width, height)
+
+    def fallback_image(self, width: int, height: int) -> Image.Image:
+        """Dark gradient fallback background as a decoded image (cached per size)."""
+        return _fallback_gradient(width, height)
 
     def is_available(self) -> bool:
-        return bool(self.api_key)
+        return gemini.is_available()
+
+    def can_generate(self) -> bool:
+        """An API key and an SDK that supports image generation (only the new one does)."""
+        return gemini.is_available() and USE_NEW_SDK
 
 
 # Singleton
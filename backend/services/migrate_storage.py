@@ -0,0 +1,51 @@
+"""
+Move existing flat outputs and assets into the sharded layout, and
+existing asset files into the content-addressed blob store.
+
+Usage (from backend/):
+    python -m services.migrate_storage           # migrate
+    python -m services.migrate_storage --dry-run # report only
+    python -m services.migrate_storage --copy-to-s3  # upload local data/ to S3
+
+Static URLs and API lookups keep working during and after the move, since
+lookups check both layouts and fall back from blob aliases to plain files.
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+from services.storage import ASSET_TYPES, storage
+from services.storage_backends import LocalBackend, S3Backend, copy_tree
+
+
+def copy_to_s3():
+    """Copy templates, assets and outputs from the local data dir to S3."""
+    data_dir = Path(os.getenv("DATA_DIR", "./data"))
+    prefixes = ("templates", "outputs", "assets/_blobs") + tuple(f"assets/{t}" for t in ASSET_TYPES)
+    copied = copy_tree(LocalBackend(data_dir), S3Backend.from_env(data_dir), prefixes)
+    print(f"Copied {copied} files to S3")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate data/ to the sharded layout")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would move")
+    parser.add_argument("--copy-to-s3", action="store_true", help="Copy local data/ to the S3_* bucket")
+    args = parser.parse_args()
+
+    if args.copy_to_s3:
+        copy_to_s3()
+        return
+
+    verb = "Would move" if args.dry_run else "Moved"
+    moved = storage.migrate_layout(dry_run=args.dry_run)
+    for directory, count in moved.items():
+        print(f"{verb} {count} files in {directory}")
+
+    ingested = storage.ingest_legacy_assets(dry_run=args.dry_run)
+    for asset_type, count in ingested.items():
+        print(f"{verb} {count} {asset_type} into the blob store")
+
+
+if __name__ == "__main__":
+    main()
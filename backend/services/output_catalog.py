@@ -0,0 +1,301 @@
+"""
+Output Catalog Service
+
+SQLite index of generated outputs, so listing, filtering and paginating
+outputs never has to glob or stat the outputs directory. StorageService
+keeps it in sync on save_output/delete_output; existing directories can
+be indexed with:
+
+    cd backend && python -m services.output_catalog rebuild
+"""
+
+import base64
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    filename    TEXT PRIMARY KEY,
+    episode_id  TEXT,
+    template_id TEXT,
+    job_id      TEXT,
+    size        INTEGER NOT NULL,
+    format      TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    last_accessed TEXT,
+    approved    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_outputs_created ON outputs (created_at DESC, filename DESC);
+CREATE INDEX IF NOT EXISTS idx_outputs_episode ON outputs (episode_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_outputs_template ON outputs (template_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_outputs_job ON outputs (job_id);
+"""
+
+COLUMNS = ("filename", "episode_id", "template_id", "job_id", "size", "format", "created_at")
+# Added after the first release; older databases are migrated on open
+ADDED_COLUMNS = {
+    "last_accessed": "TEXT",
+    "approved": "INTEGER NOT NULL DEFAULT 0",
+    # SHA-256 of the file, used for ETags and derivative keys
+    "hash": "TEXT",
+}
+
+
+def encode_cursor(created_at: str, filename: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{filename}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, filename = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, filename
+
+
+def parse_output_filename(filename: str, template_ids: list[str]) -> tuple[Optional[str], Optional[str]]:
+    """
+    Recover (episode_id, template_id) from an "{episode}-{template}[-N].ext" filename.
+
+    Episode ids may themselves contain hyphens, so the template id is matched
+    against the known templates (longest first).
+    """
+    stem = Path(filename).stem
+    for template_id in sorted(template_ids, key=len, reverse=True):
+        match = re.match(rf"^(.+)-{re.escape(template_id)}(?:-\d+)?$", stem)
+        if match:
+            return match.group(1), template_id
+    return None, None
+
+
+class OutputCatalog:
+    """Thread-safe SQLite catalog of outputs."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.is_new = not self.db_path.exists()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._touched: dict[str, str] = {}
+        self._touch_lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(outputs)")}
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE outputs ADD COLUMN {column} {definition}")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outputs_access "
+                "ON outputs (approved, COALESCE(last_accessed, created_at))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outputs_hash ON outputs (hash)")
+
+    def add(
+        self,
+        filename: str,
+        size: int,
+        created_at: Optional[str] = None,
+        episode_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ):
+        """Insert or replace an output record."""
+        record = (
+            filename,
+            episode_id,
+            template_id,
+            job_id,
+            size,
+            Path(filename).suffix.lstrip(".").lower() or "png",
+            created_at or datetime.now().isoformat(),
+            content_hash,
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO outputs ({', '.join(COLUMNS)}, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                record,
+            )
+
+    def set_hash(self, filename: str, content_hash: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE outputs SET hash = ? WHERE filename = ?", (content_hash, filename))
+
+    def remove(self, filename: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outputs WHERE filename = ?", (filename,))
+
+    def get(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM outputs WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def has_hash(self, content_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM outputs WHERE hash = ? LIMIT 1", (content_hash,)).fetchone()
+        return row is not None
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        episode_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+        created_after: Optional[str] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Page through outputs, newest first.
+
+        Returns:
+            (records, next_cursor) - next_cursor is None on the last page
+        """
+        clauses, params = [], []
+        if episode_id:
+            clauses.append("episode_id = ?")
+            params.append(episode_id)
+        if template_id:
+            clauses.append("template_id = ?")
+            params.append(template_id)
+        if job_id:
+            clauses.append("job_id = ?")
+            params.append(job_id)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if cursor:
+            created_at, filename = decode_cursor(cursor)
+            clauses.append("(created_at, filename) < (?, ?)")
+            params.extend([created_at, filename])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM outputs {where} ORDER BY created_at DESC, filename DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit + 1)).fetchall()
+
+        records = [dict(r) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = records[-1]
+            next_cursor = encode_cursor(last["created_at"], last["filename"])
+        return records, next_cursor
+
+    def iter_all(self, batch_size: int = 1000, **filters):
+        """Yield every (matching) record, newest first, without loading them all at once."""
+        cursor = None
+        while True:
+            records, cursor = self.query(limit=batch_size, cursor=cursor, **filters)
+            yield from records
+            if not cursor:
+                return
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def replace_all(self, records: list[tuple]):
+        """
+        Atomically replace the catalog contents with (COLUMNS-ordered, then
+        hash) records, keeping the access times and approvals of files that
+        remain, and their hashes where a record has none and the size is
+        unchanged.
+        """
+        with self._lock, self._conn:
+            kept = self._conn.execute(
+                "SELECT filename, size, last_accessed, approved, hash FROM outputs "
+                "WHERE last_accessed IS NOT NULL OR approved = 1 OR hash IS NOT NULL"
+            ).fetchall()
+            self._conn.execute("DELETE FROM outputs")
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO outputs ({', '.join(COLUMNS)}, hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            self._conn.executemany(
+                "UPDATE outputs SET last_accessed = ?, approved = ?, "
+                "hash = COALESCE(hash, CASE WHEN size = ? THEN ? END) WHERE filename = ?",
+                [(r["last_accessed"], r["approved"], r["size"], r["hash"], r["filename"]) for r in kept],
+            )
+
+    # Retention
+
+    def touch(self, filename: str):
+        """Note an access; buffered in memory until flush_access()."""
+        with self._touch_lock:
+            self._touched[filename] = datetime.now().isoformat()
+
+    def flush_access(self) -> int:
+        """Write buffered access times to the database."""
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "UPDATE outputs SET last_accessed = ? WHERE filename = ?",
+                    [(at, filename) for filename, at in touched.items()],
+                )
+        return len(touched)
+
+    def set_approved(self, filename: str, approved: bool = True):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outputs SET approved = ? WHERE filename = ?", (int(approved), filename)
+            )
+
+    def set_approved_many(self, filenames: list[str]):
+        if not filenames:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE outputs SET approved = 1 WHERE filename = ?", [(name,) for name in filenames]
+            )
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+
+    def iter_evictable(self, created_before: str, batch_size: int = 1000):
+        """
+        Yield unapproved records created before `created_before`, least
+        recently accessed (or created) first.
+        """
+        after = ("", "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT *, COALESCE(last_accessed, created_at) AS used_at FROM outputs "
+                    "WHERE approved = 0 AND created_at < ? "
+                    "AND (COALESCE(last_accessed, created_at), filename) > (?, ?) "
+                    "ORDER BY COALESCE(last_accessed, created_at), filename LIMIT ?",
+                    (created_before, *after, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after = (rows[-1]["used_at"], rows[-1]["filename"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from services.storage import storage
+
+    parser = argparse.ArgumentParser(description="Manage the output catalog")
+    parser.add_argument("command", choices=["rebuild", "count"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Indexed {storage.rebuild_output_catalog()} outputs")
+    else:
+        print(storage.output_catalog.count())
@@ -0,0 +1,147 @@
+"""
+Generation Pipeline
+
+The job handler the scheduler runs for "generate" queue jobs: background
+(warm pool or Imagen), render, save every variant, then record the
+outputs and deliver the webhook. It runs in whichever process claimed
+the job - the API or a standalone worker.py.
+
+Each stage starts with a cancellation checkpoint, renders run in the
+render pool (so a cancelled or overdue render's process is killed), and
+outputs saved by an attempt that doesn't complete are deleted again.
+"""
+
+import asyncio
+
+import httpx
+
+from services.async_storage import async_storage
+from services.events import event_bus
+from services.imagen import imagen
+from services.queue_manager import QueueJob, queue_manager
+from services.render_pool import render_pool
+from services.scheduler import JobCancelled, JobContext, LeaseLost, PermanentJobError, scheduler
+from services.storage import storage
+from services.warm_pool import warm_pool
+
+
+async def _uninterrupted(coro):
+    """Await coro to the end even if cancelled meanwhile (then re-raise), so a write is never left half done."""
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await task
+        raise
+
+
+async def run_generate(job: QueueJob, context: JobContext):
+    """Render all variants of a generate job and complete it."""
+    variants = job.params.get("variants", 1)
+    webhook_url = job.params.get("webhook_url")
+    try:
+        template = await async_storage.get_template(job.template_id)
+        if not template:
+            raise PermanentJobError(f"Template {job.template_id} not found")
+
+        outputs = []
+        event_bus.publish("generate", job.id, "started", variants=variants, attempt=job.attempts)
+
+        for i in range(variants):
+            await context.checkpoint()
+            background_image = None
+            if template.background.mode == "ai" and imagen.is_available():
+                try:
+                    prompt = template.background.ai_config.prompt_template.format(**job.data)
+                except KeyError as e:
+                    raise PermanentJobError(f"Missing data field {e} for the background prompt")
+                # Pre-generated backgrounds skip Imagen entirely
+                background_image = await warm_pool.take(template, prompt)
+                if background_image is not None:
+                    event_bus.publish("generate", job.id, "background_from_pool", variant=i + 1)
+                else:
+                    event_bus.publish("generate", job.id, "generating_background", variant=i + 1)
+                    # Decoded in memory and handed straight to the renderer
+                    background_image = await imagen.generate_image(
+                        prompt=prompt,
+                        negative_prompt=template.background.ai_config.negative_prompt,
+                        width=template.canvas.width,
+                        height=template.canvas.height,
+                    )
+
+            await context.checkpoint()
+            event_bus.publish("generate", job.id, "rendering", variant=i + 1)
+            image_bytes = await render_pool.render(
+                template, job.data, None, background_image, timeout=context.remaining()
+            )
+
+            await context.checkpoint()
+            variant_suffix = f"-{i+1}" if variants > 1 else ""
+            filename = f"{job.episode_id}-{template.id}{variant_suffix}.png"
+            # Outputs this attempt creates are removed if it doesn't complete;
+            # ones that already existed (an earlier job's) are left alone
+            existed = (await async_storage.outputs_exist([filename]))[filename]
+            if not existed:
+                context.on_cancel(lambda filename=filename: storage.delete_output(filename))
+            result = await _uninterrupted(async_storage.save_output(
+                filename,
+                image_bytes,
+                episode_id=job.episode_id,
+                template_id=template.id,
+                job_id=job.id,
+            ))
+
+            output = {
+                "path": result["path"],
+                "filename": result["filename"],
+                # Identifies this render - a later job may overwrite the file
+                "hash": result["hash"],
+                "size": "youtube",
+                "dimensions": [template.canvas.width, template.canvas.height],
+            }
+            outputs.append(output)
+            event_bus.publish("generate", job.id, "saved", variant=i + 1, output=output)
+    except (asyncio.CancelledError, JobCancelled):
+        if context.stopped_by == "deadline":
+            _publish_error(job, f"Deadline exceeded after {context.timeout:.0f}s", retryable=True)
+        raise
+    except Exception as e:
+        _publish_error(job, str(e), retryable=not isinstance(e, PermanentJobError))
+        raise
+
+    if not await async_storage.run(queue_manager.complete_job, job.id, outputs, job.lease_owner):
+        # Cancelled after the last checkpoint (raises, so the outputs are
+        # cleaned up), or the lease ran out and another worker owns the job
+        await context.checkpoint()
+        # Still processing, so under another worker's lease: its outputs
+        # share our filenames and must not be reclaimed
+        context.stop("lost")
+        raise LeaseLost("lost")
+    event_bus.publish("generate", job.id, "complete", outputs=outputs)
+
+    if webhook_url:
+        async with httpx.AsyncClient() as client:
+            try:
+                response = await client.post(
+                    webhook_url,
+                    json={
+                        "job_id": job.id,
+                        "status": "complete",
+                        "outputs": outputs,
+                    },
+                )
+                event_bus.publish(
+                    "generate", job.id, "webhook_delivered",
+                    status_code=response.status_code,
+                )
+            except Exception as e:
+                print(f"Webhook error: {e}")
+                event_bus.publish("generate", job.id, "webhook_failed", error=str(e))
+
+
+def _publish_error(job: QueueJob, error: str, retryable: bool):
+    retrying = retryable and job.attempts < job.max_attempts
+    event_bus.publish("generate", job.id, "error", error=error, attempt=job.attempts, retrying=retrying)
+
+
+scheduler.register("generate", run_generate)
@@ -0,0 +1,312 @@
+"""
+Queue Archive Service
+
+Keeps the hot queue (data/queue.db) down to active work. Approved,
+failed, dead and cancelled jobs that finished more than QUEUE_ARCHIVE_DAYS
+ago are moved into gzip-compressed JSON-lines segments under data/queue_archive/,
+partitioned by the month the job was created:
+
+    queue_archive/2024-06/20240712T030000-1a2b3c4d.jsonl.gz
+
+Segments are immutable: every archival run writes new ones, and
+compaction merges a month's segments into one (and vacuums queue.db).
+Nothing is ever appended or rewritten in place, so archiving, compaction
+and reads are safe across processes without locks; a job archived twice
+after a crash is deduplicated by id on read.
+
+The archived table in queue.db maps each archived job id to its month,
+so a lookup by id decompresses one month, and an unknown id none. It is
+also the record of what is archived: a job is indexed in the same
+transaction that deletes it from the queue, so a segment line without an
+index row (the job was retried meanwhile, or the process died between
+the two steps) is ignored.
+
+The archive can be paged through like the queue (newest first), and jobs
+looked up by id. Compact from the command line:
+
+    cd backend && python -m services.queue_archive compact
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, fields
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from services.output_catalog import decode_cursor, encode_cursor
+from services.queue_manager import QueueJob, queue_manager
+from services.storage import storage
+from services.storage_backends import atomic_write
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+JOB_FIELDS = [f.name for f in fields(QueueJob)]
+
+
+def _month(timestamp: str) -> str:
+    """Partition of a queue timestamp: "2024-06"."""
+    return timestamp[:7]
+
+
+def _record(job: QueueJob) -> dict:
+    # Shallow, unlike asdict(): the record is serialized straight away
+    return {name: getattr(job, name) for name in JOB_FIELDS}
+
+
+def _job(record: dict) -> QueueJob:
+    # Tolerate fields added or dropped since the segment was written
+    return QueueJob(**{k: v for k, v in record.items() if k in JOB_FIELDS})
+
+
+class QueueArchive:
+    """Time-partitioned, compressed archive of finished queue jobs."""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or storage.data_dir / "queue_archive")
+        self.archive_days = float(os.getenv("QUEUE_ARCHIVE_DAYS", "7"))
+        self.interval = float(os.getenv("QUEUE_ARCHIVE_INTERVAL_SECONDS", "3600"))
+        self._task: Optional[asyncio.Task] = None
+        self._archived = 0
+        self.last_run: Optional[str] = None
+        if self.months() and not queue_manager.archived_count():
+            self.reindex()
+
+    # Segments
+
+    def months(self) -> list[str]:
+        """Archived months, newest first."""
+        if not self.root.is_dir():
+            return []
+        return sorted((p.name for p in self.root.iterdir() if p.is_dir() and not p.name.startswith(".")), reverse=True)
+
+    def _segments(self, month: str) -> list[Path]:
+        directory = self.root / month
+        if not directory.is_dir():
+            return []
+        return sorted(p for p in directory.iterdir() if p.name.endswith(SEGMENT_SUFFIX) and not p.name.startswith("."))
+
+    def _write_segment(self, month: str, records: list[dict]) -> Path:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        path = self.root / month / f"{stamp}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        atomic_write(path, gzip.compress(lines.encode("utf-8"), compresslevel=6))
+        return path
+
+    def _read_month(self, month: str, segments: Optional[list[Path]] = None) -> dict[str, dict]:
+        """Every job archived for a month, by id (later segments win)."""
+        records: dict[str, dict] = {}
+        for path in segments if segments is not None else self._segments(month):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        records[record["id"]] = record
+            except FileNotFoundError:
+                # Merged away by a concurrent compaction; its jobs are in the new segment
+                continue
+        return records
+
+    def reindex(self) -> int:
+        """Index every job in the segments (archives written before the index existed)."""
+        months = {job_id: month for month in self.months() for job_id in self._read_month(month)}
+        queue_manager.index_archived(months)
+        indexed = queue_manager.archived_count()
+        print(f"Queue archive: indexed {indexed} archived jobs")
+        return indexed
+
+    # Archiving
+
+    def archive(self, older_than_days: Optional[float] = None, batch_size: int = 5000) -> int:
+        """Move finished jobs older than the cutoff out of the hot queue; returns the count."""
+        days = self.archive_days if older_than_days is None else older_than_days
+        cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat() + "Z"
+        total = 0
+        while True:
+            jobs = queue_manager.finished_jobs_before(cutoff, limit=batch_size)
+            if not jobs:
+                break
+            by_month: dict[str, list[dict]] = {}
+            for job in jobs:
+                by_month.setdefault(_month(job.created_at), []).append(_record(job))
+            # Written before the rows are deleted: a crash in between only
+            # leaves duplicates, which reads drop
+            for month, records in by_month.items():
+                self._write_segment(month, records)
+            archived = queue_manager.archive_jobs({job.id: _month(job.created_at) for job in jobs})
+            total += len(archived)
+            if len(jobs) < batch_size:
+                break
+        self._archived += total
+        self.last_run = datetime.now().isoformat()
+        if total:
+            print(f"Queue archive: archived {total} jobs")
+        return total
+
+    # Reading
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        status: Optional[list[str]] = None,
+        source: Optional[str] = None,
+        template_id: Optional[str] = None,
+        episode_id: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+    ) -> tuple[list[QueueJob], Optional[str]]:
+        """
+        Page through archived jobs, newest first. Only the months the
+        filters and cursor can match are decompressed.
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        after = decode_cursor(cursor) if cursor else None
+
+        def matches(record: dict) -> bool:
+            key = (record["created_at"], record["id"])
+            return (
+                (not status or record["status"] in status)
+                and (not source or record["source"] == source)
+                and (not template_id or record["template_id"] == template_id)
+                and (not episode_id or record["episode_id"] == episode_id)
+                and (not created_after or record["created_at"] >= created_after)
+                and (not created_before or record["created_at"] < created_before)
+                and (not after or key < after)
+            )
+
+        jobs: list[QueueJob] = []
+        for month in self.months():
+            if created_after and month < _month(created_after):
+                break
+            if (created_before and month > _month(created_before)) or (after and month > _month(after[0])):
+                continue
+            indexed = queue_manager.archived_ids(month)
+            records = [r for r in self._read_month(month).values() if r["id"] in indexed and matches(r)]
+            records.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+            jobs.extend(_job(r) for r in records[:limit + 1 - len(jobs)])
+            if len(jobs) > limit:
+                break
+
+        next_cursor = None
+        if len(jobs) > limit:
+            jobs = jobs[:limit]
+            next_cursor = encode_cursor(jobs[-1].created_at, jobs[-1].id)
+        return jobs, next_cursor
+
+    def find(self, job_id: str) -> Optional[QueueJob]:
+        """Look up one archived job, reading only the month it was archived in."""
+        month = queue_manager.archived_month(job_id)
+        if not month:
+            return None
+        record = self._read_month(month).get(job_id)
+        return _job(record) if record else None
+
+    # Maintenance
+
+    def compact(self) -> dict:
+        """Merge each month's segments into one, dropping duplicates, and vacuum queue.db."""
+        merged = bytes_before = bytes_after = 0
+        for month in self.months():
+            segments = self._segments(month)
+            if len(segments) < 2:
+                continue
+            size = sum(p.stat().st_size for p in segments)
+            records = sorted(self._read_month(month, segments).values(), key=lambda r: (r["created_at"], r["id"]))
+            if records:
+                bytes_after += self._write_segment(month, records).stat().st_size
+            # Only the segments that were read - new ones written meanwhile stay
+            for path in segments:
+                path.unlink(missing_ok=True)
+            merged += len(segments)
+            bytes_before += size
+        queue_manager.vacuum()
+        print(f"Queue archive: merged {merged} segments ({bytes_before} -> {bytes_after} bytes)")
+        return {"segments_merged": merged, "bytes_before": bytes_before, "bytes_after": bytes_after}
+
+    def months_before(self, cutoff: str) -> list[str]:
+        """Archived months whose jobs were all created before cutoff."""
+        found = []
+        for month in self.months():
+            # The month is over before the cutoff once the following month has started
+            year, number = int(month[:4]), int(month[5:7])
+            following = f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+            if following <= cutoff[:7]:
+                found.append(month)
+        return found
+
+    def drop_month(self, month: str):
+        """Delete a month of the archive."""
+        for path in self._segments(month):
+            path.unlink(missing_ok=True)
+        queue_manager.forget_archived(month)
+        try:
+            (self.root / month).rmdir()
+        except OSError:
+            pass
+
+    # Background archiving
+
+    async def _worker(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.archive)
+            except Exception as e:
+                print(f"Queue archive: archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Start periodic archiving (QUEUE_ARCHIVE_DAYS=0 turns it off)."""
+        if self.archive_days > 0 and not self._task:
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        segments = [p for month in self.months() for p in self._segments(month)]
+        return {
+            "enabled": self.archive_days > 0,
+            "archive_days": self.archive_days,
+            "months": len(self.months()),
+            "segments": len(segments),
+            "bytes": sum(p.stat().st_size for p in segments),
+            "archived": self._archived,
+            "last_run": self.last_run,
+        }
+
+
+# Singleton instance
+queue_archive = QueueArchive()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the queue archive")
+    parser.add_argument("command", choices=["archive", "compact", "find", "stats"])
+    parser.add_argument("job_id", nargs="?", help="job to look up (find)")
+    parser.add_argument("--days", type=float, help="archive jobs finished more than this many days ago")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        started = time.monotonic()
+        count = queue_archive.archive(args.days)
+        print(f"Archived {count} jobs in {time.monotonic() - started:.1f}s")
+    elif args.command == "compact":
+        print(queue_archive.compact())
+    elif args.command == "find":
+        if not args.job_id:
+            parser.error("find needs a job id")
+        job = queue_archive.find(args.job_id)
+        print(json.dumps(asdict(job), indent=2) if job else "Not found")
+    else:
+        print(queue_archive.metrics())
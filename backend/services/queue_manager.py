@@ -2,84 +2,421 @@
 Queue Manager Service
 
 Manages the thumbnail generation queue for both UI and API requests.
+
+Jobs live in an SQLite database (data/queue.db, WAL mode) with indexes on
+status and creation time, so listing pending jobs stays fast however many
+finished jobs accumulate, and a status change is a single-row UPDATE.
+Job files from the old data/queue/*.json layout are imported the first
+time the database is created. Finished jobs are moved out to compressed
+segments by services.queue_archive, so the table holds active work.
+
+The database is also the work queue the scheduler's workers consume. A
+worker claims a queued job with a single UPDATE, which takes a lease it
+must keep renewing with heartbeats; a job whose lease runs out (its
+worker crashed or hung) is put back in the queue. Failed attempts are
+retried with backoff up to the job's max_attempts, after which the job
+is dead-lettered. Every process that opens the same data directory
+shares the queue, so workers can run in several processes - on one host.
+The claim and lease guarantees rest on SQLite's WAL locking, which needs
+shared memory and POSIX locks on a local filesystem; on NFS/SMB two
+hosts could claim the same job.
+
+Statuses: queued -> processing -> pending/approved on success; failed
+(an error a retry can't fix) or dead (out of attempts) otherwise, and
+cancelled when stopped on request.
 """
 
 import json
+import os
+import sqlite3
+import threading
+import time
 import uuid
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Literal
-from dataclasses import dataclass, asdict
+from typing import Iterator, Optional, Literal
+from dataclasses import dataclass, asdict, field
+
+from services.events import event_bus
+from services.output_catalog import decode_cursor, encode_cursor
+from services.storage import storage
+
+
+JobStatus = Literal["queued", "processing", "pending", "approved", "failed", "dead", "cancelled"]
+
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("QUEUE_RETRY_BACKOFF_SECONDS", "5"))
 
 
-@dataclass
+@dataclass(slots=True)
 class QueueJob:
     """A job in the queue."""
     id: str
     template_id: str
     episode_id: str
     data: dict
-    status: Literal["processing", "pending", "approved", "failed"]
+    status: JobStatus
     source: Literal["ui", "api"]
     created_at: str
     completed_at: Optional[str] = None
     output_path: Optional[str] = None
     error: Optional[str] = None
+    # Execution
+    kind: str = "generate"  # scheduler handler that runs the job
+    priority: str = "api"
+    client_id: str = "anonymous"
+    params: dict = field(default_factory=dict)  # handler options (variants, webhook_url)
+    outputs: list = field(default_factory=list)
+    attempts: int = 0
+    max_attempts: int = MAX_ATTEMPTS
+    run_after: Optional[float] = None  # epoch seconds; retry backoff
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None  # epoch seconds
+
+    def output_names(self) -> list[str]:
+        """Filenames of every output the job produced."""
+        names = [Path(output["filename"]).name for output in self.outputs]
+        if not names and self.output_path:
+            names.append(Path(self.output_path).name)
+        return names
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    template_id  TEXT NOT NULL,
+    episode_id   TEXT NOT NULL,
+    data         TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    source       TEXT NOT NULL,
+    created_at   TEXT NOT NULL,
+    completed_at TEXT,
+    output_path  TEXT,
+    error        TEXT
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived (
+    id    TEXT PRIMARY KEY,
+    month TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archived_month ON archived (month);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_source ON jobs (source, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_template ON jobs (template_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_client ON jobs (status, client_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (status, lease_expires_at);
+"""
+
+# Added with the work queue; older databases are migrated on open
+ADDED_COLUMNS = {
+    "kind": "TEXT NOT NULL DEFAULT 'generate'",
+    "priority": "TEXT NOT NULL DEFAULT 'api'",
+    "client_id": "TEXT NOT NULL DEFAULT 'anonymous'",
+    "params": "TEXT NOT NULL DEFAULT '{}'",
+    "outputs": "TEXT NOT NULL DEFAULT '[]'",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "max_attempts": f"INTEGER NOT NULL DEFAULT {MAX_ATTEMPTS}",
+    "run_after": "REAL",
+    "lease_owner": "TEXT",
+    "lease_expires_at": "REAL",
+}
+
+JSON_COLUMNS = ("data", "params", "outputs")
+
+# Terminal statuses, as an SQL list (pending jobs still await review)
+FINISHED = "('approved', 'failed', 'dead', 'cancelled')"
+# Statuses retry_jobs puts back in the queue
+RETRYABLE = "('failed', 'dead', 'cancelled')"
+
+# Ids per IN (...) clause in bulk statements
+BULK_CHUNK = 500
+
+COLUMNS = (
+    "id", "template_id", "episode_id", "data", "status", "source",
+    "created_at", "completed_at", "output_path", "error", *ADDED_COLUMNS,
+)
+
+# Claim order: priority class first, then the client with the fewest jobs
+# running (fair share across clients), then oldest first
+CLAIM_SQL = """
+UPDATE jobs SET status = 'processing', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+WHERE id = (
+    SELECT id FROM jobs AS j
+    WHERE status = 'queued' AND COALESCE(run_after, 0) <= ?
+    ORDER BY
+        CASE priority WHEN 'ui' THEN 0 WHEN 'api' THEN 1 ELSE 2 END,
+        (SELECT COUNT(*) FROM jobs AS r WHERE r.status = 'processing' AND r.client_id = j.client_id),
+        created_at, id
+    LIMIT 1
+) AND status = 'queued'
+RETURNING *
+"""
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _chunks(ids: list[str]) -> Iterator[list[str]]:
+    for i in range(0, len(ids), BULK_CHUNK):
+        yield ids[i:i + BULK_CHUNK]
 
 
 class QueueManager:
     """Manages the thumbnail generation queue."""
 
-    def __init__(self):
-        self.queue_dir = Path("./data/queue")
-        self.queue_dir.mkdir(parents=True, exist_ok=True)
-        self.auto_approve = True  # Default setting
+    def __init__(self, db_path: Optional[Path] = None, legacy_dir: Optional[Path] = None):
+        self.db_path = Path(db_path or storage.data_dir / "queue.db")
+        self.legacy_dir = Path(legacy_dir or storage.data_dir / "queue")
+        is_new = not self.db_path.exists()
+        # Other processes may hold the write lock briefly (claims, heartbeats)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            self._conn.executescript(INDEXES)
+        if is_new:
+            self._import_legacy()
+
+    # Records
 
-    def _job_path(self, job_id: str) -> Path:
-        return self.queue_dir / f"{job_id}.json"
+    @staticmethod
+    def _value(job: QueueJob, name: str):
+        value = getattr(job, name)
+        return json.dumps(value, separators=(",", ":")) if name in JSON_COLUMNS else value
+
+    @classmethod
+    def _row(cls, job: QueueJob) -> tuple:
+        return tuple(cls._value(job, name) for name in COLUMNS)
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> QueueJob:
+        values = dict(row)
+        for name in JSON_COLUMNS:
+            values[name] = json.loads(values[name])
+        return QueueJob(**values)
+
+    def _insert(self, jobs: list[QueueJob]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [self._row(job) for job in jobs],
+            )
+
+    def _update(
+        self,
+        job: QueueJob,
+        *fields: str,
+        expect_status: Optional[str] = None,
+        expect_owner: Optional[str] = None,
+    ) -> bool:
+        """
+        Write just the given fields of a job. With expect_status (and
+        expect_owner), only if the stored job still has that status (and
+        lease holder), so racing transitions can't both win.
+        """
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        sql = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        params = [*(self._value(job, name) for name in fields), job.id]
+        if expect_status:
+            sql += " AND status = ?"
+            params.append(expect_status)
+        if expect_owner:
+            sql += " AND lease_owner = ?"
+            params.append(expect_owner)
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount > 0
+
+    def _query(self, sql: str, params: tuple = ()) -> list[QueueJob]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._job(row) for row in rows]
+
+    def _import_legacy(self):
+        """Load jobs saved by the JSON-file queue."""
+        if not self.legacy_dir.is_dir():
+            return
+        jobs = []
+        for path in self.legacy_dir.glob("*.json"):
+            try:
+                with open(path) as f:
+                    jobs.append(QueueJob(**json.load(f)))
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Queue: skipping unreadable job file {path.name}: {e}")
+        if jobs:
+            self._insert(jobs)
+            print(f"Queue: imported {len(jobs)} jobs from {self.legacy_dir}")
+
+    # Jobs
 
     def create_job(
         self,
         template_id: str,
         episode_id: str,
         data: dict,
-        source: Literal["ui", "api"] = "ui"
+        source: Literal["ui", "api"] = "ui",
+        kind: str = "generate",
+        priority: str = "api",
+        client_id: str = "anonymous",
+        params: Optional[dict] = None,
     ) -> QueueJob:
-        """Create a new queue job."""
+        """Queue a new job for the workers."""
         job = QueueJob(
             id=str(uuid.uuid4()),
             template_id=template_id,
             episode_id=episode_id,
             data=data,
-            status="processing",
+            status="queued",
             source=source,
-            created_at=datetime.utcnow().isoformat() + "Z"
+            created_at=_now(),
+            kind=kind,
+            priority=priority,
+            client_id=client_id,
+            params=params or {},
         )
-        self._save_job(job)
+        self._insert([job])
+        self._publish("created", job)
+        return job
+
+    def _publish(self, event: str, job: QueueJob):
+        """Push a job state transition to streaming clients."""
+        event_bus.publish("queue", job.id, event, job=asdict(job))
+
+    def get_job(self, job_id: str) -> Optional[QueueJob]:
+        jobs = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        """Just the status - cheap enough to poll between render stages."""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def cancel_job(self, job_id: str) -> Optional[QueueJob]:
+        """
+        Cancel a queued or running job. A running job's worker loses its
+        lease and stops at its next checkpoint or heartbeat. Returns the
+        cancelled job, or None if it wasn't queued or running.
+        """
+        now = _now()
+        with self._lock, self._conn:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', error = 'Cancelled', completed_at = ?, "
+                "lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE id = ? AND status IN ('queued', 'processing')",
+                (now, job_id),
+            ).rowcount
+        if not cancelled:
+            return None
+        job = self.get_job(job_id)
+        self._publish("cancelled", job)
         return job
 
-    def _save_job(self, job: QueueJob):
-        """Save a job to disk."""
-        with open(self._job_path(job.id), "w") as f:
-            json.dump(asdict(job), f, indent=2)
+    # Leases
 
-    def _load_job(self, job_id: str) -> Optional[QueueJob]:
-        """Load a job from disk."""
-        path = self._job_path(job_id)
-        if not path.exists():
+    def claim(self, owner: str, lease_seconds: float) -> Optional[QueueJob]:
+        """
+        Atomically take the next runnable queued job, leasing it to owner.
+        Safe to call from any number of threads and processes on this host.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(CLAIM_SQL, (owner, now + lease_seconds, now)).fetchone()
+        if not row:
             return None
-        with open(path) as f:
-            data = json.load(f)
-        return QueueJob(**data)
-
-    def complete_job(self, job_id: str, output_path: str):
-        """Mark a job as completed."""
-        job = self._load_job(job_id)
-        if not job:
-            return
+        job = self._job(row)
+        self._publish("processing", job)
+        return job
 
-        job.completed_at = datetime.utcnow().isoformat() + "Z"
-        job.output_path = output_path
+    def heartbeat(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extend a lease. False means the lease is lost and the work should stop."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ? AND status = 'processing'",
+                (time.time() + lease_seconds, job_id, owner),
+            ).rowcount > 0
+
+    def release(self, job_id: str, owner: str) -> bool:
+        """Hand a leased job back to the queue unrun (e.g. on shutdown); the attempt doesn't count."""
+        with self._lock, self._conn:
+            released = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), "
+                "lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE id = ? AND lease_owner = ? AND status = 'processing'",
+                (job_id, owner),
+            ).rowcount > 0
+        job = self.get_job(job_id) if released else None
+        if job:
+            self._publish("queued", job)
+        return released
+
+    def requeue_expired(self) -> int:
+        """Put jobs whose lease ran out back in the queue (or dead-letter them); returns the count."""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'processing' "
+                "AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (time.time(),),
+            ).fetchall()
+            jobs = []
+            for row in rows:
+                job = self._job(row)
+                self._retry_or_bury(job, f"Lease expired (held by {job.lease_owner})", retryable=True)
+                updated = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, completed_at = ?, run_after = ?, "
+                    "lease_owner = NULL, lease_expires_at = NULL "
+                    "WHERE id = ? AND status = 'processing' AND lease_owner IS ?",
+                    (job.status, job.error, job.completed_at, job.run_after, job.id, row["lease_owner"]),
+                ).rowcount
+                if updated:
+                    jobs.append(job)
+        for job in jobs:
+            print(f"Queue: lease on job {job.id} expired; now {job.status}")
+            self._publish(job.status, job)
+        return len(jobs)
+
+    @staticmethod
+    def _retry_or_bury(job: QueueJob, error: str, retryable: bool):
+        """Move a failed attempt back to queued with backoff, or to failed/dead."""
+        job.error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if retryable and job.attempts < job.max_attempts:
+            job.status = "queued"
+            job.run_after = time.time() + RETRY_BACKOFF_SECONDS * 2 ** max(job.attempts - 1, 0)
+        else:
+            job.status = "dead" if retryable else "failed"
+            job.completed_at = _now()
+
+    def complete_job(self, job_id: str, outputs: list[dict], owner: Optional[str] = None) -> bool:
+        """
+        Mark a job as completed. With owner, only while that worker still
+        holds the lease; returns False otherwise.
+        """
+        job = self.get_job(job_id)
+        if not job or (owner and job.lease_owner != owner):
+            return False
+
+        job.completed_at = _now()
+        job.outputs = outputs
+        job.output_path = outputs[0]["filename"] if outputs else None
+        job.error = None
+        job.lease_owner = None
+        job.lease_expires_at = None
 
         # Auto-approve or set to pending
         if self.auto_approve or job.source == "ui":
@@ -87,54 +424,344 @@ class QueueManager:
         else:
             job.status = "pending"
 
-        self._save_job(job)
+        if not self._update(
+            job, "status", "completed_at", "outputs", "output_path", "error", "lease_owner", "lease_expires_at",
+            expect_status="processing", expect_owner=owner,
+        ):
+            return False
+        if job.status == "approved":
+            self._protect_output(job)
+        self._publish(job.status, job)
+        return True
 
-    def fail_job(self, job_id: str, error: str):
-        """Mark a job as failed."""
-        job = self._load_job(job_id)
-        if not job:
-            return
+    def fail_job(
+        self,
+        job_id: str,
+        error: str,
+        owner: Optional[str] = None,
+        retryable: bool = False,
+    ) -> Optional[QueueJob]:
+        """
+        Record a failed attempt. Retryable failures go back in the queue
+        until the job runs out of attempts and is dead-lettered; others
+        fail the job outright. Returns the updated job.
+        """
+        job = self.get_job(job_id)
+        if not job or (owner and job.lease_owner != owner):
+            return None
 
-        job.status = "failed"
-        job.error = error
-        job.completed_at = datetime.utcnow().isoformat() + "Z"
-        self._save_job(job)
+        self._retry_or_bury(job, error, retryable)
+        if not self._update(
+            job, "status", "error", "completed_at", "run_after", "lease_owner", "lease_expires_at",
+            expect_status="processing" if owner else None, expect_owner=owner,
+        ):
+            return None
+        self._publish(job.status, job)
+        return job
 
     def approve_job(self, job_id: str) -> bool:
         """Approve a pending job."""
-        job = self._load_job(job_id)
+        job = self.get_job(job_id)
         if not job or job.status != "pending":
             return False
 
         job.status = "approved"
-        self._save_job(job)
+        if not self._update(job, "status", expect_status="pending"):
+            return False
+        self._protect_output(job)
+        self._publish("approved", job)
         return True
 
+    def _protect_output(self, job: QueueJob):
+        """Exempt an approved job's outputs from retention cleanup."""
+        for name in job.output_names():
+            storage.output_catalog.set_approved(name)
+
     def delete_job(self, job_id: str) -> bool:
-        """Delete a job."""
-        path = self._job_path(job_id)
-        if path.exists():
-            path.unlink()
+        """
+        Delete a job, unless it is processing: its worker would then stop
+        as if it had lost the lease, and not clean up its partial outputs.
+        Cancel it first.
+        """
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND status != 'processing'", (job_id,)
+            ).rowcount
+        if deleted:
+            event_bus.publish("queue", job_id, "deleted")
             return True
         return False
 
+    # Bulk operations - each runs in a single transaction
+
+    def _bulk_transition(self, job_ids: list[str], from_status: tuple[str, ...], updates: dict) -> list[QueueJob]:
+        """Apply updates to every listed job currently in one of from_status; returns the updated jobs."""
+        ids = list(dict.fromkeys(job_ids))
+        assignments = ", ".join(f"{name} = ?" for name in updates)
+        changed = []
+        with self._lock, self._conn:
+            for chunk in _chunks(ids):
+                marks = ", ".join("?" * len(chunk))
+                statuses = ", ".join("?" * len(from_status))
+                rows = self._conn.execute(
+                    f"SELECT * FROM jobs WHERE id IN ({marks}) AND status IN ({statuses})", (*chunk, *from_status)
+                ).fetchall()
+                if not rows:
+                    continue
+                matched = [row["id"] for row in rows]
+                self._conn.execute(
+                    f"UPDATE jobs SET {assignments} WHERE id IN ({', '.join('?' * len(matched))})",
+                    (*updates.values(), *matched),
+                )
+                for row in rows:
+                    job = self._job(row)
+                    for name, value in updates.items():
+                        setattr(job, name, value)
+                    changed.append(job)
+        return changed
+
+    def approve_jobs(self, job_ids: list[str]) -> list[QueueJob]:
+        """Approve every listed job that is pending."""
+        approved = self._bulk_transition(job_ids, ("pending",), {"status": "approved"})
+        storage.output_catalog.set_approved_many([name for job in approved for name in job.output_names()])
+        for job in approved:
+            self._publish("approved", job)
+        return approved
+
+    def retryable_counts(self, job_ids: list[str]) -> dict[str, int]:
+        """Of the listed jobs, how many retry_jobs would re-queue, by client."""
+        counts: dict[str, int] = {}
+        with self._lock:
+            for chunk in _chunks(list(dict.fromkeys(job_ids))):
+                marks = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT client_id, COUNT(*) FROM jobs WHERE id IN ({marks}) "
+                    f"AND status IN {RETRYABLE} GROUP BY client_id",
+                    chunk,
+                ).fetchall()
+                for client_id, count in rows:
+                    counts[client_id] = counts.get(client_id, 0) + count
+        return counts
+
+    def retry_jobs(self, job_ids: list[str]) -> list[QueueJob]:
+        """Put every listed failed, dead or cancelled job back in the queue with fresh attempts."""
+        retried = self._bulk_transition(
+            job_ids,
+            ("failed", "dead", "cancelled"),
+            {"status": "queued", "error": None, "completed_at": None, "attempts": 0, "run_after": None},
+        )
+        for job in retried:
+            self._publish("queued", job)
+        return retried
+
+    def delete_jobs(self, job_ids: list[str]) -> list[str]:
+        """Delete every listed job that isn't processing (see delete_job); returns the ids deleted."""
+        ids = list(dict.fromkeys(job_ids))
+        deleted = []
+        with self._lock, self._conn:
+            for chunk in _chunks(ids):
+                marks = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"DELETE FROM jobs WHERE id IN ({marks}) AND status != 'processing' RETURNING id", chunk
+                )
+                deleted.extend(row[0] for row in rows)
+        for job_id in deleted:
+            event_bus.publish("queue", job_id, "deleted")
+        return deleted
+
+    # Archive index - which month of services.queue_archive holds a job
+
+    def archive_jobs(self, months: dict[str, str]) -> list[str]:
+        """
+        Delete jobs just written to the archive and index each under its
+        month (job id -> month), in one transaction. Jobs that have left
+        their terminal status since they were read (e.g. were retried) stay
+        in the queue, unindexed. Returns the ids archived.
+        """
+        archived = []
+        with self._lock, self._conn:
+            for chunk in _chunks(list(months)):
+                marks = ", ".join("?" * len(chunk))
+                ids = [
+                    row[0] for row in self._conn.execute(
+                        f"DELETE FROM jobs WHERE id IN ({marks}) AND status IN {FINISHED} RETURNING id", chunk
+                    )
+                ]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO archived (id, month) VALUES (?, ?)", [(i, months[i]) for i in ids]
+                )
+                archived.extend(ids)
+        for job_id in archived:
+            event_bus.publish("queue", job_id, "archived")
+        return archived
+
+    def index_archived(self, months: dict[str, str]):
+        """Index jobs found in archive segments, except any still in the queue."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO archived (id, month) SELECT ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE id = ?)",
+                [(job_id, month, job_id) for job_id, month in months.items()],
+            )
+
+    def archived_month(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT month FROM archived WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def archived_ids(self, month: str) -> set[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM archived WHERE month = ?", (month,)).fetchall()
+        return {row[0] for row in rows}
+
+    def archived_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archived").fetchone()[0]
+
+    def forget_archived(self, month: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM archived WHERE month = ?", (month,))
+
+    # Listing
+
+    def query(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        status: Optional[list[str]] = None,
+        source: Optional[str] = None,
+        template_id: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+    ) -> tuple[list[QueueJob], Optional[str]]:
+        """
+        Page through jobs, newest first.
+
+        Returns:
+            (jobs, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        clauses, params = [], []
+        if status:
+            clauses.append(f"status IN ({', '.join('?' * len(status))})")
+            params.extend(status)
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        if template_id:
+            clauses.append("template_id = ?")
+            params.append(template_id)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        if cursor:
+            created_at, job_id = decode_cursor(cursor)
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend([created_at, job_id])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        jobs = self._query(
+            f"SELECT * FROM jobs {where} ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit + 1)
+        )
+        next_cursor = None
+        if len(jobs) > limit:
+            jobs = jobs[:limit]
+            next_cursor = encode_cursor(jobs[-1].created_at, jobs[-1].id)
+        return jobs, next_cursor
+
     def get_all_jobs(self) -> list:
         """Get all jobs, sorted by creation time (newest first)."""
-        jobs = []
-        for path in self.queue_dir.glob("*.json"):
-            if path.name != ".gitkeep":
-                job = self._load_job(path.stem)
-                if job:
-                    jobs.append(job)
-        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+        return self._query("SELECT * FROM jobs ORDER BY created_at DESC")
 
     def get_pending_jobs(self) -> list:
         """Get all pending jobs."""
-        return [j for j in self.get_all_jobs() if j.status == "pending"]
+        return self._query("SELECT * FROM jobs WHERE status = 'pending' ORDER BY created_at DESC")
+
+    def iter_jobs(self, status: str, batch_size: int = 1000) -> Iterator[QueueJob]:
+        """Yield every job with a status, newest first, a batch at a time."""
+        jobs = self._query(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (status, batch_size),
+        )
+        while jobs:
+            yield from jobs
+            if len(jobs) < batch_size:
+                return
+            last = jobs[-1]
+            jobs = self._query(
+                "SELECT * FROM jobs WHERE status = ? AND (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (status, last.created_at, last.id, batch_size),
+            )
+
+    def finished_before(self, cutoff: str) -> list[str]:
+        """Ids of finished jobs that finished (or were created) before cutoff."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE status IN {FINISHED} "
+                "AND COALESCE(completed_at, created_at) < ?",
+                (cutoff,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def finished_jobs_before(self, cutoff: str, limit: int = 1000) -> list[QueueJob]:
+        """Oldest finished jobs that finished before cutoff."""
+        return self._query(
+            f"SELECT * FROM jobs WHERE status IN {FINISHED} "
+            "AND COALESCE(completed_at, created_at) < ? ORDER BY created_at, id LIMIT ?",
+            (cutoff, limit),
+        )
+
+    def vacuum(self):
+        """Give the space of deleted jobs back to the filesystem."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            # In WAL mode the file only shrinks once the WAL is checkpointed
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def status_counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def queued_counts(self) -> dict[str, dict[str, int]]:
+        """Queued jobs by priority and by client, for admission control."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT priority, client_id, COUNT(*) FROM jobs WHERE status = 'queued' GROUP BY priority, client_id"
+            ).fetchall()
+        by_priority: dict[str, int] = {}
+        by_client: dict[str, int] = {}
+        for priority, client_id, count in rows:
+            by_priority[priority] = by_priority.get(priority, 0) + count
+            by_client[client_id] = by_client.get(client_id, 0) + count
+        return {"priority": by_priority, "client": by_client}
+
+    # Settings - stored with the queue so every process sees the same values
+
+    def _setting(self, key: str, default):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_setting(self, key: str, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    @property
+    def auto_approve(self) -> bool:
+        return self._setting("auto_approve", True)
 
     def set_auto_approve(self, enabled: bool):
         """Set auto-approve setting."""
-        self.auto_approve = enabled
+        self._set_setting("auto_approve", enabled)
 
 
 # Singleton instance
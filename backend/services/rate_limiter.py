@@ -0,0 +1,426 @@
+"""
+Rate Limiter Service
+
+Coordinates every Gemini/Imagen call in the process against per-model
+requests-per-minute and tokens-per-minute budgets, and trips a circuit
+breaker when a model keeps failing so callers fail fast (Imagen drops
+straight to its fallback background) instead of piling onto an
+erroring upstream.
+
+Budgets are token buckets. Callers reserve capacity up front and wait
+their turn, which queues them in arrival order. Budgets live in SQLite
+(RATE_LIMIT_DB, default data/ratelimit.db), so every process on the host
+sharing the data directory draws from the same ones; set RATE_LIMIT_DB
+to an empty value to keep them in-process. Daily spending caps (the warm
+pool's) are kept there too. Circuit breakers stay per process.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+
+# Per-model budgets; override with GEMINI_RATE_LIMITS='{"model": {"rpm": 10, "tpm": 100000}}'
+DEFAULT_BUDGETS: dict[str, dict] = {
+    "imagen-4.0-generate-001": {"rpm": 10},
+    "gemini-2.5-flash": {"rpm": 60, "tpm": 250000},
+    "gemini-2.0-flash": {"rpm": 60, "tpm": 1000000},
+}
+FALLBACK_BUDGET = {"rpm": 30}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when waiting for budget would take longer than allowed."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit breaker is open."""
+
+
+class TokenBucket:
+    """In-process token bucket that hands out reservations."""
+
+    def __init__(self, name: str, per_minute: float):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens (possibly going into debt); return seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """Token bucket whose state lives in SQLite, shared across processes."""
+
+    def __init__(self, name: str, per_minute: float, db_path: str):
+        super().__init__(name, per_minute)
+        self.db_path = db_path
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time()),
+            )
+        finally:
+            conn.close()
+
+    def _update(self, delta: float) -> float:
+        conn = _connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated = conn.execute(
+                "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate) + delta
+            tokens = min(self.capacity, tokens)
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = ?, updated = ? WHERE name = ?",
+                (tokens, now, self.name),
+            )
+            conn.execute("COMMIT")
+            return tokens
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def reserve(self, amount: float) -> float:
+        tokens = self._update(-min(amount, self.capacity))
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def refund(self, amount: float):
+        self._update(amount)
+
+    def available(self) -> float:
+        return self._update(0.0)
+
+
+class DailyBudget:
+    """In-process count of what has been spent today against a daily limit."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._day = date.today()
+        self._spent = 0
+        self._lock = threading.Lock()
+
+    def spent(self) -> int:
+        with self._lock:
+            if date.today() != self._day:
+                self._day = date.today()
+                self._spent = 0
+            return self._spent
+
+    def spend(self, amount: int = 1):
+        self.spent()
+        with self._lock:
+            self._spent += amount
+
+    def remaining(self) -> int:
+        return self.limit - self.spent()
+
+
+class SQLiteDailyBudget(DailyBudget):
+    """Daily budget whose count lives in SQLite, shared across processes."""
+
+    def __init__(self, name: str, limit: int, db_path: str):
+        super().__init__(name, limit)
+        self.db_path = db_path
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_budgets ("
+                "name TEXT NOT NULL, day TEXT NOT NULL, spent INTEGER NOT NULL, PRIMARY KEY (name, day))"
+            )
+        finally:
+            conn.close()
+
+    def spent(self) -> int:
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT spent FROM daily_budgets WHERE name = ? AND day = ?",
+                (self.name, date.today().isoformat()),
+            ).fetchone()
+            return row[0] if row else 0
+        finally:
+            conn.close()
+
+    def spend(self, amount: int = 1):
+        today = date.today().isoformat()
+        conn = _connect(self.db_path)
+        try:
+            conn.execute(
+                "INSERT INTO daily_budgets (name, day, spent) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, day) DO UPDATE SET spent = spent + excluded.spent",
+                (self.name, today, amount),
+            )
+            conn.execute("DELETE FROM daily_budgets WHERE name = ? AND day < ?", (self.name, today))
+        finally:
+            conn.close()
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpenError("Circuit open - upstream is failing")
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise CircuitOpenError("Circuit half-open - trial request in flight")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give the half-open trial back when the call never reached upstream."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class ModelLimiter:
+    """Budgets, breaker and stats for one model."""
+
+    def __init__(self, model: str, budget: dict, db_path: Optional[str]):
+        self.model = model
+        self.rpm = self._bucket(f"{model}:rpm", budget["rpm"], db_path)
+        self.tpm = self._bucket(f"{model}:tpm", budget["tpm"], db_path) if budget.get("tpm") else None
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+        )
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.wait_samples: deque[float] = deque(maxlen=200)
+
+    @staticmethod
+    def _bucket(name: str, per_minute: float, db_path: Optional[str]) -> TokenBucket:
+        if db_path:
+            return SQLiteTokenBucket(name, per_minute, db_path)
+        return TokenBucket(name, per_minute)
+
+
+class RateLimiter:
+    """Process-wide registry of per-model limiters."""
+
+    def __init__(self):
+        default = str(Path(os.getenv("DATA_DIR", "./data")) / "ratelimit.db")
+        self.db_path = os.getenv("RATE_LIMIT_DB", default) or None
+        self.max_wait = float(os.getenv("GEMINI_MAX_WAIT_SECONDS", "30"))
+        self.budgets = dict(DEFAULT_BUDGETS)
+        overrides = os.getenv("GEMINI_RATE_LIMITS")
+        if overrides:
+            self.budgets.update(json.loads(overrides))
+        self._limiters: dict[str, ModelLimiter] = {}
+        self._budgets: dict[str, DailyBudget] = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                budget = self.budgets.get(model, FALLBACK_BUDGET)
+                self._limiters[model] = ModelLimiter(model, budget, self.db_path)
+            return self._limiters[model]
+
+    def daily_budget(self, name: str, limit: int) -> DailyBudget:
+        """A daily spending cap, shared across processes like the rate budgets."""
+        with self._lock:
+            if name not in self._budgets:
+                if self.db_path:
+                    self._budgets[name] = SQLiteDailyBudget(name, limit, self.db_path)
+                else:
+                    self._budgets[name] = DailyBudget(name, limit)
+            return self._budgets[name]
+
+    async def _reserve(self, bucket: TokenBucket, amount: float) -> float:
+        if self.db_path:
+            return await asyncio.to_thread(bucket.reserve, amount)
+        return bucket.reserve(amount)
+
+    def _refund(self, bucket: TokenBucket, amount: float):
+        if self.db_path:
+            # Not awaited - this runs while unwinding, possibly from a cancellation
+            asyncio.get_running_loop().run_in_executor(None, bucket.refund, amount)
+        else:
+            bucket.refund(amount)
+
+    @asynccontextmanager
+    async def limit(self, model: str, tokens: int = 0):
+        """
+        Wait for budget, check the breaker, and record the outcome.
+
+        Usage:
+            async with rate_limiter.limit("gemini-2.5-flash", tokens=1500):
+                await client.aio.models.generate_content(...)
+
+        Raises:
+            CircuitOpenError: If the model's breaker is open
+            RateLimitExceeded: If the wait for budget exceeds GEMINI_MAX_WAIT_SECONDS
+        """
+        limiter = self._limiter(model)
+        try:
+            limiter.breaker.before_call()
+        except CircuitOpenError:
+            limiter.rejected += 1
+            raise
+
+        reserved: list[tuple[TokenBucket, float]] = []
+        try:
+            wait = await self._reserve(limiter.rpm, 1)
+            reserved.append((limiter.rpm, 1))
+            if limiter.tpm and tokens:
+                wait = max(wait, await self._reserve(limiter.tpm, tokens))
+                reserved.append((limiter.tpm, tokens))
+
+            if wait > self.max_wait:
+                raise RateLimitExceeded(f"{model}: budget exhausted, next slot in {wait:.1f}s")
+
+            limiter.wait_samples.append(wait)
+            if wait > 0:
+                limiter.waiting += 1
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    limiter.waiting -= 1
+        except BaseException:
+            # Never reached upstream - give the budget and breaker trial back
+            for bucket, amount in reserved:
+                self._refund(bucket, amount)
+            limiter.breaker.release_trial()
+            limiter.rejected += 1
+            raise
+
+        limiter.calls += 1
+        try:
+            yield
+        except asyncio.CancelledError:
+            limiter.breaker.release_trial()
+            raise
+        except Exception:
+            limiter.failures += 1
+            limiter.breaker.record_failure()
+            raise
+        else:
+            limiter.breaker.record_success()
+
+    async def settle_tokens(self, model: str, estimated: int, actual: int):
+        """Correct a TPM reservation once the real token usage is known."""
+        limiter = self._limiter(model)
+        if not limiter.tpm or not actual or actual == estimated:
+            return
+        if actual < estimated:
+            settle, amount = limiter.tpm.refund, estimated - actual
+        else:
+            settle, amount = limiter.tpm.reserve, actual - estimated
+        if self.db_path:
+            await asyncio.to_thread(settle, amount)
+        else:
+            settle(amount)
+
+    def is_open(self, model: str) -> bool:
+        """True when calls to this model would currently fail fast."""
+        breaker = self._limiter(model).breaker
+        return breaker.state == "open" and time.monotonic() - breaker.opened_at < breaker.reset_seconds
+
+    def metrics(self) -> dict:
+        """Remaining budget, wait times and breaker state per model."""
+        result = {}
+        with self._lock:
+            limiters = list(self._limiters.values())
+        for limiter in limiters:
+            waits = list(limiter.wait_samples)
+            result[limiter.model] = {
+                "rpm_budget": limiter.rpm.capacity,
+                "rpm_available": round(max(limiter.rpm.available(), 0.0), 2),
+                "tpm_budget": limiter.tpm.capacity if limiter.tpm else None,
+                "tpm_available": round(max(limiter.tpm.available(), 0.0), 0) if limiter.tpm else None,
+                "waiting": limiter.waiting,
+                "wait_seconds": {
+                    "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "max": round(max(waits), 3) if waits else 0.0,
+                },
+                "calls": limiter.calls,
+                "failures": limiter.failures,
+                "rejected": limiter.rejected,
+                "breaker": limiter.breaker.state,
+            }
+        return {
+            "shared": bool(self.db_path),
+            "max_wait_seconds": self.max_wait,
+            "models": result,
+        }
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,185 @@
+"""
+Render Pool
+
+Runs renders in worker processes so a render can be abandoned. PIL work
+can't be interrupted from another thread, so a cancelled job, or a
+render that runs past its deadline (a huge stroke, grain on a 4K
+canvas), would otherwise hold a thread until it finished. Instead the
+process rendering it is killed, which frees its CPU and memory at once,
+and a fresh process takes its place.
+
+Processes are started with "spawn" (fork would copy the parent's SQLite
+connections and threads) and each keeps its own font and asset caches.
+RENDER_PROCESSES=0 renders on threads in-process instead, without hard
+kills.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from typing import Optional
+
+from PIL import Image
+
+from models import Template
+
+
+class RenderError(Exception):
+    """A render failed in its worker process."""
+
+
+class RenderTimeout(RenderError):
+    """A render ran past its deadline and its process was killed."""
+
+
+def _serve(conn):
+    """Worker process loop: render each request and send back the PNG bytes."""
+    from services.renderer import renderer
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            conn.send(("ok", renderer.render(*request)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """One render process and the pipe to it."""
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), name="render-worker", daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class RenderPool:
+    """Fixed set of render processes; misbehaving ones are killed and replaced."""
+
+    def __init__(self, processes: Optional[int] = None, timeout: Optional[float] = None):
+        self.size = processes if processes is not None else int(os.getenv("RENDER_PROCESSES", "2"))
+        # Upper bound for any single render, whatever the job's deadline
+        self.timeout = timeout or float(os.getenv("RENDER_TIMEOUT_SECONDS", "120"))
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: set[_Worker] = set()
+        self._starting: Optional[asyncio.Task] = None
+
+        # Metrics
+        self._renders = 0
+        self._killed = 0
+        self._failed = 0
+
+    async def start(self):
+        """Start the worker processes (also happens on the first render)."""
+        if not self.size:
+            return
+        if self._starting is None:
+            self._idle = asyncio.Queue()
+            self._starting = asyncio.create_task(self._spawn(self.size))
+        await asyncio.shield(self._starting)
+
+    async def _spawn(self, count: int):
+        workers = await asyncio.gather(
+            *(asyncio.to_thread(_Worker, self._context) for _ in range(count)), return_exceptions=True
+        )
+        for worker in workers:
+            if isinstance(worker, BaseException):
+                print(f"Render pool: failed to start a worker: {worker}")
+                continue
+            self._workers.add(worker)
+            self._idle.put_nowait(worker)
+
+    def _discard(self, worker: _Worker):
+        """Kill a worker that may still be rendering and start a replacement."""
+        self._killed += 1
+        self._workers.discard(worker)
+        worker.kill()
+        asyncio.get_running_loop().create_task(self._spawn(1))
+
+    async def render(
+        self,
+        template: Template,
+        episode_data: dict,
+        background_override: Optional[str] = None,
+        background_image: Optional[Image.Image] = None,
+        timeout: Optional[float] = None,
+    ) -> bytes:
+        """
+        Render in a worker process.
+
+        Raises:
+            RenderTimeout: If the render takes longer than timeout (or the
+                pool's RENDER_TIMEOUT_SECONDS)
+            RenderError: If rendering raised, or the worker died
+        """
+        if not self.size:
+            from services.renderer import renderer
+
+            return await asyncio.to_thread(
+                renderer.render, template, episode_data, background_override, background_image
+            )
+
+        await self.start()
+        # A deadline that has already passed is 0.0, not "no deadline"
+        limit = min(timeout, self.timeout) if timeout is not None else self.timeout
+        # Waiting for a free worker counts against the same deadline
+        loop = asyncio.get_running_loop()
+        waiting_since = loop.time()
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), limit)
+        except asyncio.TimeoutError:
+            raise RenderTimeout(f"No render worker free within {limit:.0f}s")
+        limit = max(0.0, limit - (loop.time() - waiting_since))
+        try:
+            await asyncio.to_thread(
+                worker.conn.send, (template, episode_data, background_override, background_image)
+            )
+            status, result = await asyncio.wait_for(asyncio.to_thread(worker.conn.recv), limit)
+        except asyncio.TimeoutError:
+            self._discard(worker)
+            raise RenderTimeout(f"Render exceeded {limit:.0f}s; worker killed")
+        except (EOFError, OSError) as e:
+            self._discard(worker)
+            raise RenderError(f"Render worker died: {e}")
+        except BaseException:
+            # Cancelled mid-render: the process is still busy, so kill it
+            self._discard(worker)
+            raise
+
+        self._idle.put_nowait(worker)
+        self._renders += 1
+        if status == "error":
+            self._failed += 1
+            raise RenderError(result)
+        return result
+
+    async def stop(self):
+        for worker in list(self._workers):
+            worker.kill()
+        self._workers.clear()
+        self._idle = None
+        self._starting = None
+
+    def metrics(self) -> dict:
+        return {
+            "processes": len(self._workers) if self.size else 0,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "renders": self._renders,
+            "failed": self._failed,
+            "killed": self._killed,
+            "timeout_seconds": self.timeout,
+        }
+
+
+# Singleton instance
+render_pool = RenderPool()
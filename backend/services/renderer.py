@@ -1,43 +1,55 @@
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional
 import io
 import os
+import threading
 
 from models import Template, TextZone, BadgeZone, ImageZone
 from services.storage import storage
+from services.uploads import FONT_EXTENSIONS
 
 
 class RendererService:
     def __init__(self):
         self.default_font = "arial.ttf"
-        self.fonts_cache: dict[str, ImageFont.FreeTypeFont] = {}
+        # (font file, size) -> font, least recently used first
+        self.fonts_cache: OrderedDict[tuple[str, int], ImageFont.FreeTypeFont] = OrderedDict()
+        self.fonts_cache_size = int(os.getenv("RENDER_FONT_CACHE_SIZE", "256"))
+        # RENDER_PROCESSES=0 renders on several threads at once
+        self._fonts_lock = threading.Lock()
 
     def render(
         self,
         template: Template,
         episode_data: dict,
         background_override: Optional[str] = None,
+        background_image: Optional[Image.Image] = None,
     ) -> bytes:
         # Create canvas
         canvas = Image.new("RGB", (template.canvas.width, template.canvas.height), "#1a1a1a")
 
-        # Load background with offset and scale
-        background = self._load_background(template, background_override)
-        if background:
-            bg_config = template.background
-            offset_x = getattr(bg_config, 'offset_x', 0) or 0
-            offset_y = getattr(bg_config, 'offset_y', 0) or 0
-            bg_scale = getattr(bg_config, 'scale', 1.0) or 1.0
+        # Load background with offset and scale; an already-decoded image
+        # (e.g. a generated or fallback background) skips the asset lookup
+        bg_config = template.background
+        offset_x = getattr(bg_config, 'offset_x', 0) or 0
+        offset_y = getattr(bg_config, 'offset_y', 0) or 0
+        bg_scale = getattr(bg_config, 'scale', 1.0) or 1.0
 
-            # Calculate scaled dimensions
-            canvas_w, canvas_h = template.canvas.width, template.canvas.height
-            scaled_w = int(canvas_w * bg_scale)
-            scaled_h = int(canvas_h * bg_scale)
+        # Calculate scaled dimensions
+        canvas_w, canvas_h = template.canvas.width, template.canvas.height
+        scaled_w = int(canvas_w * bg_scale)
+        scaled_h = int(canvas_h * bg_scale)
 
+        if background_image is not None:
+            background = background_image if background_image.mode == "RGB" else background_image.convert("RGB")
             # Resize background to scaled dimensions
             background = background.resize((scaled_w, scaled_h), Image.LANCZOS)
-
+        else:
+            # Asset backgrounds come pre-sized from the derivative cache
+            background = self._load_background(template, background_override, (scaled_w, scaled_h))
+        if background:
             # Calculate paste position (centered with offset)
             paste_x = (canvas_w - scaled_w) // 2 + offset_x
             paste_y = (canvas_h - scaled_h) // 2 + offset_y
@@ -50,13 +62,17 @@ class RendererService:
 
         # Render zones
         draw = ImageDraw.Draw(canvas)
+        # Font name -> file, looked up once per render
+        font_files: dict[str, str] = {}
 
         for zone_name, zone in template.zones.items():
             value = episode_data.get(zone_name, "")
 
             if isinstance(zone, TextZone) or (isinstance(zone, dict) and zone.get("type") == "text"):
                 zone_obj = zone if isinstance(zone, TextZone) else TextZone(**zone)
-                self._render_text_zone(canvas, draw, zone_obj, value, episode_data)
+                if zone_obj.font not in font_files:
+                    font_files[zone_obj.font] = self._resolve_font(zone_obj.font)
+                self._render_text_zone(canvas, draw, zone_obj, value, episode_data, font_files[zone_obj.font])
             elif isinstance(zone, BadgeZone) or (isinstance(zone, dict) and zone.get("type") == "badge"):
                 zone_obj = zone if isinstance(zone, BadgeZone) else BadgeZone(**zone)
                 self._render_badge_zone(canvas, zone_obj, value, episode_data)
@@ -73,19 +89,22 @@ class RendererService:
         buffer.seek(0)
         return buffer.getvalue()
 
-    def _load_background(self, template: Template, override: Optional[str] = None) -> Optional[Image.Image]:
+    def _load_background(
+        self,
+        template: Template,
+        override: Optional[str],
+        size: tuple[int, int],
+    ) -> Optional[Image.Image]:
         bg_config = template.background
 
         if override:
-            path = storage.get_asset_path("backgrounds", override)
-            if path:
-                return Image.open(path).convert("RGB")
+            background = storage.load_asset_image("backgrounds", override, "RGB", size, Image.LANCZOS)
+            if background:
+                return background
 
         if bg_config.mode == "fixed" and bg_config.fixed_images:
             filename = bg_config.fixed_images[0]
-            path = storage.get_asset_path("backgrounds", filename)
-            if path:
-                return Image.open(path).convert("RGB")
+            return storage.load_asset_image("backgrounds", filename, "RGB", size, Image.LANCZOS)
 
         return None
 
@@ -101,15 +120,13 @@ class RendererService:
         if not enabled or not image_name:
             return
 
-        # Load the subject PNG from subjects folder
-        path = storage.get_asset_path("subjects", image_name)
-        if not path:
-            return
-
+        # Load the subject PNG from subjects folder (RGBA derivative)
         try:
-            subject_img = Image.open(path).convert("RGBA")
+            subject_img = storage.load_asset_image("subjects", image_name, "RGBA")
         except Exception:
             return
+        if subject_img is None:
+            return
 
         # Get positioning parameters
         offset_x = getattr(subject, 'offset_x', 0) or 0
@@ -152,6 +169,7 @@ class RendererService:
         zone: TextZone,
         value: str,
         episode_data: dict,
+        font_file: str,
     ):
         if not value:
             return
@@ -182,25 +200,25 @@ class RendererService:
 
         # Handle stacked text modes
         if layout_mode == "stacked-words":
-            self._render_stacked_text(canvas, draw, zone, value.split(), color, stack_gap, letter_spacing, align, valign, text_bg)
+            self._render_stacked_text(canvas, draw, zone, font_file, value.split(), color, stack_gap, letter_spacing, align, valign, text_bg)
             return
         elif layout_mode == "stacked-chars":
-            self._render_stacked_text(canvas, draw, zone, list(value), color, stack_gap, letter_spacing, align, valign, text_bg)
+            self._render_stacked_text(canvas, draw, zone, font_file, list(value), color, stack_gap, letter_spacing, align, valign, text_bg)
             return
 
         # For rotated text, we render to a separate layer then rotate
         if layout_mode == "rotated" and rotation != 0:
-            self._render_rotated_text(canvas, zone, value, color, episode_data)
+            self._render_rotated_text(canvas, zone, font_file, value, color, episode_data)
             return
 
         # Get font
-        font = self._get_font(zone.font, zone.size.max)
+        font = self._get_font(font_file, zone.size.max)
 
         # Auto-size text if enabled
         if zone.size.auto:
             font = self._auto_size_font(
                 value,
-                zone.font,
+                font_file,
                 zone.size.min,
                 zone.size.max,
                 zone.position.width,
@@ -274,6 +292,7 @@ class RendererService:
         self,
         canvas: Image.Image,
         zone: TextZone,
+        font_file: str,
         value: str,
         color: str,
         episode_data: dict,
@@ -287,11 +306,11 @@ class RendererService:
         text_draw = ImageDraw.Draw(text_layer)
 
         # Get font
-        font = self._get_font(zone.font, zone.size.max)
+        font = self._get_font(font_file, zone.size.max)
         if zone.size.auto:
             # For rotated text, use height as width constraint for vertical text
             constraint = zone.position.height if abs(rotation) == 90 else zone.position.width
-            font = self._auto_size_font(value, zone.font, zone.size.min, zone.size.max, constraint, letter_spacing)
+            font = self._auto_size_font(value, font_file, zone.size.min, zone.size.max, constraint, letter_spacing)
 
         # Calculate text size
         if letter_spacing > 0:
@@ -334,6 +353,7 @@ class RendererService:
         canvas: Image.Image,
         draw: ImageDraw.Draw,
         zone: TextZone,
+        font_file: str,
         parts: list[str],
         color: str,
         stack_gap: int,
@@ -352,7 +372,7 @@ class RendererService:
             return
 
         # Get font and calculate dimensions for each part
-        font = self._get_font(zone.font, zone.size.max)
+        font = self._get_font(font_file, zone.size.max)
 
         # Calculate total height and individual line dimensions
         line_heights = []
@@ -502,11 +522,10 @@ class RendererService:
         if not badge_file:
             return
 
-        path = storage.get_asset_path("overlays", badge_file)
-        if not path:
+        badge = storage.load_asset_image("overlays", badge_file, "RGBA")
+        if badge is None:
             return
 
-        badge = Image.open(path).convert("RGBA")
         canvas.paste(badge, (zone.position.x, zone.position.y), badge)
 
     def _render_image_zone(
@@ -519,12 +538,12 @@ class RendererService:
         if not image_file:
             return
 
-        path = storage.get_asset_path("backgrounds", image_file)
-        if not path:
+        img = storage.load_asset_image(
+            "backgrounds", image_file, "RGBA", (zone.position.width, zone.position.height)
+        )
+        if img is None:
             return
 
-        img = Image.open(path).convert("RGBA")
-        img = img.resize((zone.position.width, zone.position.height))
         canvas.paste(img, (zone.position.x, zone.position.y), img)
 
     def _apply_overlays(self, canvas: Image.Image, overlays: list[str]) -> Image.Image:
@@ -569,37 +588,50 @@ class RendererService:
 
         return image
 
-    def _get_font(self, font_name: str, size: int) -> ImageFont.FreeTypeFont:
-        cache_key = f"{font_name}_{size}"
-        if cache_key in self.fonts_cache:
-            return self.fonts_cache[cache_key]
+    def _resolve_font(self, font_name: str) -> str:
+        """
+        The file for a font: an uploaded font's blob path, so re-uploading
+        a font under the same name picks up the new file, or else the name
+        for FreeType to find. Uploads of any font format match by stem.
+        """
+        for ext in FONT_EXTENSIONS:
+            custom_path = storage.get_asset_path("fonts", f"{font_name}{ext}")
+            if custom_path:
+                return str(custom_path)
+        return font_name
+
+    def _get_font(self, font_file: str, size: int) -> ImageFont.FreeTypeFont:
+        cache_key = (font_file, size)
+        with self._fonts_lock:
+            if cache_key in self.fonts_cache:
+                self.fonts_cache.move_to_end(cache_key)
+                return self.fonts_cache[cache_key]
 
-        custom_path = storage.get_asset_path("fonts", f"{font_name}.ttf")
-        if custom_path:
-            font = ImageFont.truetype(str(custom_path), size)
-        else:
+        try:
+            font = ImageFont.truetype(font_file, size)
+        except OSError:
             try:
-                font = ImageFont.truetype(font_name, size)
+                font = ImageFont.truetype("arial.ttf", size)
             except OSError:
-                try:
-                    font = ImageFont.truetype("arial.ttf", size)
-                except OSError:
-                    font = ImageFont.load_default()
+                font = ImageFont.load_default()
 
-        self.fonts_cache[cache_key] = font
+        with self._fonts_lock:
+            self.fonts_cache[cache_key] = font
+            while len(self.fonts_cache) > self.fonts_cache_size:
+                self.fonts_cache.popitem(last=False)
         return font
 
     def _auto_size_font(
         self,
         text: str,
-        font_name: str,
+        font_file: str,
         min_size: int,
         max_size: int,
         max_width: int,
         letter_spacing: int = 0,
     ) -> ImageFont.FreeTypeFont:
         for size in range(max_size, min_size - 1, -2):
-            font = self._get_font(font_name, size)
+            font = self._get_font(font_file, size)
             if letter_spacing > 0:
                 text_width = self._get_text_width_with_spacing(text, font, letter_spacing)
             else:
@@ -607,7 +639,7 @@ class RendererService:
                 text_width = bbox[2] - bbox[0]
             if text_width <= max_width:
                 return font
-        return self._get_font(font_name, min_size)
+        return self._get_font(font_file, min_size)
 
 
 # Singleton
@@ -0,0 +1,266 @@
+"""
+Retention Service
+
+Keeps data/ from growing forever. Each sweep:
+- deletes outputs older than RETENTION_MAX_AGE_DAYS
+- evicts least-recently-accessed outputs while outputs use more than
+  RETENTION_MAX_OUTPUT_MB
+- deletes finished (approved/failed/dead/cancelled) queue jobs older than
+  RETENTION_QUEUE_DAYS, and archived months that are entirely older
+- removes orphaned `_temp_*` backgrounds and abandoned upload/staging files
+
+Outputs of approved queue jobs are never evicted, nor are those of jobs
+still in flight (queued, processing, or pending review) - including files
+a running attempt has saved but not yet recorded on the job. Nothing
+younger than RETENTION_MIN_AGE_SECONDS is touched. A limit of 0 disables that rule.
+Sweeps run in the background when RETENTION_ENABLED=true; a dry run
+reports what a sweep would remove without removing anything.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from services.queue_archive import queue_archive
+from services.queue_manager import queue_manager
+from services.storage import iter_files, storage
+
+TEMP_PREFIX = "_temp_"
+# Jobs whose outputs may still be reviewed or are being written
+IN_FLIGHT = ("queued", "processing", "pending")
+STAGING_PREFIXES = (".upload-", ".tmp-")
+# Catalog rows marked approved per statement
+APPROVE_BATCH = 1000
+
+
+@dataclass
+class RetentionReport:
+    """What a sweep removed (or, for a dry run, would remove)."""
+    dry_run: bool
+    outputs: list[dict] = field(default_factory=list)
+    queue_jobs: list[str] = field(default_factory=list)
+    queue_archive_months: list[str] = field(default_factory=list)
+    temp_files: list[str] = field(default_factory=list)
+    bytes_reclaimed: int = 0
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    duration_seconds: float = 0.0
+
+
+class RetentionService:
+    """Age and size quotas for outputs, plus queue and temp-file cleanup."""
+
+    def __init__(self):
+        self.enabled = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+        self.max_age_days = float(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+        self.max_output_bytes = int(float(os.getenv("RETENTION_MAX_OUTPUT_MB", "0")) * 1024 * 1024)
+        self.queue_days = float(os.getenv("RETENTION_QUEUE_DAYS", "30"))
+        self.min_age_seconds = float(os.getenv("RETENTION_MIN_AGE_SECONDS", "3600"))
+        self.interval = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_report: Optional[RetentionReport] = None
+
+    # Planning
+
+    def _protect_approved(self):
+        """Make sure every approved job's outputs are marked approved in the catalog."""
+        names = []
+        for job in queue_manager.iter_jobs("approved"):
+            names.extend(job.output_names())
+            if len(names) >= APPROVE_BATCH:
+                storage.output_catalog.set_approved_many(names)
+                names = []
+        storage.output_catalog.set_approved_many(names)
+
+    def _in_flight(self) -> tuple[set[str], set[str]]:
+        """(job ids, output filenames) of jobs that haven't finished."""
+        job_ids, names = set(), set()
+        for status in IN_FLIGHT:
+            for job in queue_manager.iter_jobs(status):
+                job_ids.add(job.id)
+                names.update(job.output_names())
+        return job_ids, names
+
+    def _plan_outputs(self, report: RetentionReport):
+        catalog = storage.output_catalog
+        job_ids, names = self._in_flight()
+
+        def in_use(record: dict) -> bool:
+            # Recorded on the job, or saved by an attempt still running
+            return record["filename"] in names or record.get("job_id") in job_ids
+
+        now = datetime.now()
+        grace_cutoff = (now - timedelta(seconds=self.min_age_seconds)).isoformat()
+        age_cutoff = (now - timedelta(days=self.max_age_days)).isoformat() if self.max_age_days else None
+
+        chosen = {}
+        if age_cutoff:
+            for record in catalog.iter_evictable(min(age_cutoff, grace_cutoff)):
+                if not in_use(record):
+                    chosen[record["filename"]] = (record, "age")
+
+        if self.max_output_bytes:
+            excess = catalog.total_size() - self.max_output_bytes
+            excess -= sum(r["size"] for r, _ in chosen.values())
+            if excess > 0:
+                for record in catalog.iter_evictable(grace_cutoff):
+                    if excess <= 0:
+                        break
+                    if record["filename"] in chosen or in_use(record):
+                        continue
+                    chosen[record["filename"]] = (record, "quota")
+                    excess -= record["size"]
+
+        for record, reason in chosen.values():
+            report.outputs.append({
+                "filename": record["filename"],
+                "size": record["size"],
+                "reason": reason,
+                "last_used": record.get("last_accessed") or record["created_at"],
+            })
+            report.bytes_reclaimed += record["size"]
+
+    def _plan_queue(self, report: RetentionReport):
+        if not self.queue_days:
+            return
+        cutoff = (datetime.utcnow() - timedelta(days=self.queue_days)).isoformat() + "Z"
+        report.queue_jobs.extend(queue_manager.finished_before(cutoff))
+        report.queue_archive_months.extend(queue_archive.months_before(cutoff))
+
+    def _temp_candidates(self) -> list[tuple[str, str]]:
+        """(kind, name) of orphaned temp backgrounds and abandoned staging files."""
+        cutoff = time.time() - self.min_age_seconds
+        cutoff_iso = datetime.fromtimestamp(cutoff).isoformat()
+        found = []
+        for record in storage.asset_store.list("backgrounds"):
+            if record["filename"].startswith(TEMP_PREFIX) and record["created_at"] < cutoff_iso:
+                found.append(("alias", record["filename"]))
+        for key, stat in storage._legacy_files("assets/backgrounds"):
+            if key.rsplit("/", 1)[1].startswith(TEMP_PREFIX) and stat.mtime < cutoff:
+                found.append(("key", key))
+        # Staging files are always node-local
+        for directory in (storage.asset_store.blobs_dir, storage.derivatives.derived_dir):
+            for entry in iter_files(directory):
+                if entry.name.startswith(STAGING_PREFIXES) and entry.stat().st_mtime < cutoff:
+                    found.append(("file", entry.path))
+        return found
+
+    # Sweeping
+
+    def _sweep(self, dry_run: bool) -> RetentionReport:
+        started = time.monotonic()
+        report = RetentionReport(dry_run=dry_run)
+        storage.output_catalog.flush_access()
+        self._protect_approved()
+        self._plan_outputs(report)
+        self._plan_queue(report)
+        temp = []
+        for kind, name in self._temp_candidates():
+            if kind == "file":
+                try:
+                    report.bytes_reclaimed += os.path.getsize(name)
+                except OSError:
+                    # Finished or cleaned up since it was listed
+                    continue
+            temp.append((kind, name))
+            report.temp_files.append(name)
+
+        if not dry_run:
+            for output in report.outputs:
+                if not storage.delete_output(output["filename"]):
+                    # File already gone - just drop the stale catalog row
+                    storage.output_catalog.remove(output["filename"])
+            for job_id in report.queue_jobs:
+                queue_manager.delete_job(job_id)
+            for month in report.queue_archive_months:
+                queue_archive.drop_month(month)
+            for kind, name in temp:
+                if kind == "alias":
+                    storage.delete_asset("backgrounds", name)
+                elif kind == "key":
+                    storage.backend.delete(name)
+                else:
+                    Path(name).unlink(missing_ok=True)
+
+        report.duration_seconds = round(time.monotonic() - started, 3)
+        if not dry_run:
+            self.last_report = report
+            print(
+                f"Retention: removed {len(report.outputs)} outputs, {len(report.queue_jobs)} queue jobs, "
+                f"{len(report.queue_archive_months)} archived months, "
+                f"{len(report.temp_files)} temp files ({report.bytes_reclaimed} bytes)"
+            )
+        return report
+
+    async def sweep(self, dry_run: bool = False) -> RetentionReport:
+        """Run one sweep off the event loop (sweeps never overlap)."""
+        async with self._lock:
+            return await asyncio.to_thread(self._sweep, dry_run)
+
+    async def _worker(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Retention: sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Start periodic sweeps if retention is enabled."""
+        if self.enabled and not self._task:
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Reporting
+
+    def disk_usage(self) -> dict:
+        """Space used by outputs and assets, plus free space on the data volume."""
+        total, used, free = shutil.disk_usage(storage.cache_root)
+        assets = storage.asset_store.stats()
+        return {
+            "outputs": {
+                "count": storage.output_catalog.count(),
+                "bytes": storage.output_catalog.total_size(),
+                "quota_bytes": self.max_output_bytes or None,
+            },
+            "assets": {
+                "count": assets["aliases"],
+                "bytes": assets["stored_bytes"],
+            },
+            "volume": {
+                "total_bytes": total,
+                "free_bytes": free,
+            },
+        }
+
+    def metrics(self) -> dict:
+        last = self.last_report
+        return {
+            "enabled": self.enabled,
+            "max_age_days": self.max_age_days or None,
+            "max_output_bytes": self.max_output_bytes or None,
+            "queue_days": self.queue_days or None,
+            "last_sweep": {
+                "started_at": last.started_at,
+                "duration_seconds": last.duration_seconds,
+                "outputs": len(last.outputs),
+                "queue_jobs": len(last.queue_jobs),
+                "queue_archive_months": len(last.queue_archive_months),
+                "temp_files": len(last.temp_files),
+                "bytes_reclaimed": last.bytes_reclaimed,
+            } if last else None,
+        }
+
+
+# Singleton instance
+retention = RetentionService()
@@ -0,0 +1,477 @@
+"""
+Job Scheduler Service
+
+Bounded, priority-aware worker pool over the persistent job queue in
+services.queue_manager. Jobs are admitted into a fixed-depth queue
+(callers get a 429 when it is full) and claimed UI first, then API, then
+backfill; within each priority class the client with the fewest jobs
+running goes next, so one noisy client cannot starve the others.
+
+Each claimed job runs under a lease that a heartbeat renews while its
+handler works, and a per-attempt deadline (JOB_TIMEOUT_SECONDS, or the
+job's own timeout_seconds). The handler task is cancelled when the
+deadline passes, when the job is cancelled, or when the lease is lost
+(this process stalled for longer than the lease and the job was handed
+to someone else); handlers also check for this at stage boundaries via
+JobContext.checkpoint(). Failed and timed-out attempts are retried with
+backoff, then dead-lettered.
+Workers in other processes on the same host (see worker.py) consume the
+same queue, and a reaper in every process requeues jobs whose worker
+died. Jobs queued by another process wake idle workers through the
+change feed; QUEUE_POLL_SECONDS is the fallback.
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from services.async_storage import async_storage
+from services.change_feed import change_feed
+from services.events import event_bus
+from services.queue_manager import QueueJob, queue_manager
+
+
+# Dispatch order - earlier classes always win
+PRIORITY_ORDER: tuple[str, ...] = ("ui", "api", "backfill")
+
+Handler = Callable[[QueueJob, "JobContext"], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler cannot admit another job."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for failures a retry cannot fix (e.g. a missing template)."""
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint when the job was cancelled or is past its deadline."""
+
+
+class LeaseLost(JobCancelled):
+    """Raised when another worker has taken the job over; what it wrote is theirs now."""
+
+
+class JobContext:
+    """
+    What a handler gets besides its job: the deadline, cooperative
+    cancellation checkpoints, and cleanups for work left unfinished.
+    """
+
+    def __init__(self, job: QueueJob, deadline: Optional[float] = None):
+        self.job = job
+        self.deadline = deadline  # epoch seconds
+        self.timeout = deadline - time.time() if deadline else 0.0
+        self.stopped_by: Optional[str] = None  # "cancelled", "deadline" or "lost"
+        self.cleanups: list[Callable[[], None]] = []
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def stop(self, reason: str):
+        if self.stopped_by is None:
+            self.stopped_by = reason
+
+    def on_cancel(self, cleanup: Callable[[], None]):
+        """Register a blocking cleanup to run if the job doesn't complete."""
+        self.cleanups.append(cleanup)
+
+    async def checkpoint(self):
+        """
+        Call between stages. Raises JobCancelled if the job has been
+        cancelled (by any process) or its deadline has passed.
+        """
+        if self.stopped_by is None and self.remaining() == 0:
+            self.stop("deadline")
+        if self.stopped_by is None:
+            status = await async_storage.run(queue_manager.get_status, self.job.id)
+            if status != "processing":
+                self.stop("cancelled" if status == "cancelled" else "lost")
+        if self.stopped_by == "lost":
+            raise LeaseLost(self.stopped_by)
+        if self.stopped_by is not None:
+            raise JobCancelled(self.stopped_by)
+
+
+class JobScheduler:
+    """Bounded priority queue with per-client fair share and a leasing worker pool."""
+
+    def __init__(
+        self,
+        max_depth: Optional[int] = None,
+        max_per_client: Optional[int] = None,
+        workers: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+    ):
+        self.max_depth = max_depth or int(os.getenv("SCHEDULER_MAX_DEPTH", "100"))
+        self.max_per_client = max_per_client or int(
+            os.getenv("SCHEDULER_MAX_PER_CLIENT", str(max(1, self.max_depth // 2)))
+        )
+        # 0 workers: this process only enqueues (see worker.py)
+        self.worker_count = workers if workers is not None else int(os.getenv("SCHEDULER_WORKERS", "2"))
+        self.lease_seconds = lease_seconds or float(os.getenv("QUEUE_LEASE_SECONDS", "60"))
+        # How often idle workers look for new jobs if no wake-up arrives
+        self.poll_seconds = float(os.getenv("QUEUE_POLL_SECONDS", "1"))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # Default per-attempt deadline; jobs may set params["timeout_seconds"]
+        self.job_timeout = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+
+        self._handlers: dict[str, Handler] = {}
+        self._running = 0
+        self._active: dict[str, tuple[asyncio.Task, JobContext]] = {}
+
+        self._workers: list[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        # Metrics (this process)
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._lost = 0
+        self._requeued = 0
+        self._cancelled = 0
+        self._timed_out = 0
+        self._wait_samples: deque[float] = deque(maxlen=500)
+        self._avg_run_seconds = 0.0
+
+    def register(self, kind: str, handler: Handler):
+        """Set the coroutine that runs jobs of a kind."""
+        self._handlers[kind] = handler
+
+    # Admission
+
+    async def submit(
+        self,
+        template_id: str,
+        episode_id: str,
+        data: dict,
+        priority: str = "api",
+        client_id: str = "anonymous",
+        source: str = "api",
+        kind: str = "generate",
+        params: Optional[dict] = None,
+    ) -> QueueJob:
+        """
+        Admit a job into the queue.
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If the queue or the client's share of it is full
+        """
+        if priority not in PRIORITY_ORDER:
+            priority = "api"
+
+        counts = await async_storage.run(queue_manager.queued_counts)
+        depth = sum(counts["priority"].values())
+        if depth >= self.max_depth:
+            self._rejected += 1
+            raise QueueFullError("Generation queue is full", self._retry_after(depth))
+
+        client_depth = counts["client"].get(client_id, 0)
+        if client_depth >= self.max_per_client:
+            self._rejected += 1
+            raise QueueFullError("Too many queued jobs for this client", self._retry_after(client_depth))
+
+        job = await async_storage.run(
+            queue_manager.create_job,
+            template_id,
+            episode_id,
+            data,
+            source=source,
+            kind=kind,
+            priority=priority,
+            client_id=client_id,
+            params=params,
+        )
+        self._submitted += 1
+        self.wake()
+        return job
+
+    async def retry(self, job_ids: list[str]) -> list[QueueJob]:
+        """
+        Put failed, dead or cancelled jobs back in the queue, under the
+        same limits as submit - all of them or, if they don't fit, none.
+
+        Returns:
+            The re-queued jobs
+
+        Raises:
+            QueueFullError: If they would overfill the queue or a client's share of it
+        """
+        counts = await async_storage.run(queue_manager.queued_counts)
+        retrying = await async_storage.run(queue_manager.retryable_counts, job_ids)
+        depth = sum(counts["priority"].values())
+        if retrying and depth + sum(retrying.values()) > self.max_depth:
+            self._rejected += 1
+            raise QueueFullError(
+                f"Generation queue is full ({self.max_depth - depth} free slots)", self._retry_after(depth)
+            )
+        for client_id, count in retrying.items():
+            client_depth = counts["client"].get(client_id, 0)
+            if client_depth + count > self.max_per_client:
+                self._rejected += 1
+                raise QueueFullError(
+                    f"Too many queued jobs for client {client_id}", self._retry_after(client_depth)
+                )
+
+        retried = await async_storage.run(queue_manager.retry_jobs, job_ids)
+        self.wake()
+        return retried
+
+    def wake(self):
+        """Have idle workers look for new jobs now rather than at their next poll."""
+        self._ensure_workers()
+        self._wakeup.set()
+
+    def _retry_after(self, backlog: int) -> int:
+        """Estimate seconds until a slot frees up."""
+        per_job = self._avg_run_seconds or 2.0
+        return max(1, int(per_job * max(backlog, 1) / max(self.worker_count, 1)))
+
+    # Dispatch
+
+    def _ensure_workers(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            if self.worker_count:
+                loop = asyncio.get_running_loop()
+                change_feed.subscribe("events", lambda _, event: self._on_feed_event(loop, event))
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    def _on_feed_event(self, loop: asyncio.AbstractEventLoop, event: dict):
+        """Feed thread: another process queued (or re-queued) a job."""
+        job = event["data"].get("job") if event["topic"] == "queue" else None
+        if job and job.get("status") == "queued":
+            try:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # Loop closed at shutdown
+                pass
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = await async_storage.run(queue_manager.claim, self.worker_id, self.lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: QueueJob):
+        queued_since = job.run_after or _epoch(job.created_at)
+        self._wait_samples.append(max(0.0, time.time() - queued_since))
+
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            await async_storage.run(
+                queue_manager.fail_job, job.id, f"No handler for job kind '{job.kind}'", self.worker_id
+            )
+            return
+
+        timeout_seconds = job.params.get("timeout_seconds")
+        timeout = float(timeout_seconds if timeout_seconds is not None else self.job_timeout)
+        context = JobContext(job, deadline=time.time() + timeout if timeout else None)
+        started = time.monotonic()
+        self._running += 1
+        task = asyncio.create_task(handler(job, context))
+        self._active[job.id] = (task, context)
+        watchdog = asyncio.create_task(self._watch(task, context))
+        try:
+            await task
+            self._completed += 1
+        except LeaseLost:
+            context.stop("lost")
+            await self._stopped(context)
+        except (asyncio.CancelledError, JobCancelled):
+            if context.stopped_by is None:
+                # Shutting down: hand the job straight back to the queue
+                await async_storage.run(queue_manager.release, job.id, self.worker_id)
+                raise
+            await self._stopped(context)
+        except PermanentJobError as e:
+            self._failed += 1
+            await self._reclaim(context)
+            await async_storage.run(queue_manager.fail_job, job.id, str(e), self.worker_id)
+        except Exception as e:
+            self._failed += 1
+            print(f"Scheduler: job {job.id} attempt {job.attempts} failed: {e}")
+            await self._reclaim(context)
+            await async_storage.run(queue_manager.fail_job, job.id, str(e), self.worker_id, retryable=True)
+        finally:
+            watchdog.cancel()
+            self._active.pop(job.id, None)
+            self._running -= 1
+            elapsed = time.monotonic() - started
+            # Exponential moving average feeds the Retry-After estimate
+            self._avg_run_seconds = (
+                elapsed if not self._avg_run_seconds
+                else 0.8 * self._avg_run_seconds + 0.2 * elapsed
+            )
+
+    async def _stopped(self, context: JobContext):
+        """Wrap up a job that was cancelled, ran out of time or lost its lease."""
+        job = context.job
+        if context.stopped_by == "lost":
+            # Another worker owns the job (and its output names) now
+            self._lost += 1
+            print(f"Scheduler: lost the lease on job {job.id}; abandoned it")
+            return
+        await self._reclaim(context)
+        if context.stopped_by == "cancelled":
+            self._cancelled += 1
+            print(f"Scheduler: job {job.id} cancelled")
+        else:
+            self._timed_out += 1
+            await async_storage.run(
+                queue_manager.fail_job, job.id, f"Deadline exceeded after {context.timeout:.0f}s",
+                self.worker_id, retryable=True,
+            )
+
+    async def _reclaim(self, context: JobContext):
+        """Run the cleanups a job registered for work it didn't finish (e.g. partial outputs)."""
+        for cleanup in reversed(context.cleanups):
+            try:
+                await async_storage.run(cleanup)
+            except Exception as e:
+                print(f"Scheduler: cleanup for job {context.job.id} failed: {e}")
+        context.cleanups.clear()
+
+    async def _watch(self, task: asyncio.Task, context: JobContext):
+        """
+        Renew the job's lease until it finishes. Cancels it when its
+        deadline passes, it is cancelled, or the lease is lost.
+        """
+        job = context.job
+        interval = self.lease_seconds / 3
+        while True:
+            remaining = context.remaining()
+            await asyncio.sleep(interval if remaining is None else max(0.0, min(interval, remaining)))
+            if context.remaining() == 0:
+                context.stop("deadline")
+                task.cancel()
+                return
+            try:
+                held = await async_storage.run(queue_manager.heartbeat, job.id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                # Keep working; the next beat may get through before the lease runs out
+                print(f"Scheduler: heartbeat for job {job.id} failed: {e}")
+                continue
+            if not held:
+                status = await async_storage.run(queue_manager.get_status, job.id)
+                context.stop("cancelled" if status == "cancelled" else "lost")
+                task.cancel()
+                return
+
+    async def cancel_job(self, job_id: str) -> Optional[QueueJob]:
+        """
+        Cancel a queued or running job, wherever it runs. Returns None if
+        it wasn't queued or running.
+        """
+        job = await async_storage.run(queue_manager.cancel_job, job_id)
+        if job:
+            self.cancel(job_id)
+            event_bus.publish("generate", job_id, "cancelled")
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Stop a job if this process is running it. Call after marking it
+        cancelled in the queue; other processes notice at their next
+        checkpoint or heartbeat.
+        """
+        active = self._active.get(job_id)
+        if not active:
+            return False
+        task, context = active
+        context.stop("cancelled")
+        task.cancel()
+        return True
+
+    async def _reap(self):
+        """Requeue jobs whose worker stopped renewing its lease."""
+        while True:
+            try:
+                requeued = await async_storage.run(queue_manager.requeue_expired)
+                if requeued:
+                    self._requeued += requeued
+                    self._wakeup.set()
+            except Exception as e:
+                print(f"Scheduler: reaping expired leases failed: {e}")
+            await asyncio.sleep(self.lease_seconds / 2)
+
+    async def start(self):
+        """Start the worker pool and reaper (also happens lazily on first submit)."""
+        self._ensure_workers()
+
+    async def stop(self):
+        """Cancel all workers; jobs they were running go back in the queue."""
+        tasks = self._workers + ([self._reaper] if self._reaper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reaper = None
+
+    # Metrics
+
+    def metrics(self) -> dict:
+        """Queue depth and status counts, plus this process's throughput and wait times."""
+        counts = queue_manager.queued_counts()
+        waits = sorted(self._wait_samples)
+        return {
+            "depth": sum(counts["priority"].values()),
+            "max_depth": self.max_depth,
+            "depth_by_priority": {p: counts["priority"].get(p, 0) for p in PRIORITY_ORDER},
+            "clients_waiting": len(counts["client"]),
+            "jobs": queue_manager.status_counts(),
+            "worker_id": self.worker_id,
+            "running": self._running,
+            "workers": self.worker_count,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+            "timed_out": self._timed_out,
+            "leases_lost": self._lost,
+            "leases_requeued": self._requeued,
+            "wait_seconds": {
+                "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "p95": round(waits[int(len(waits) * 0.95) - 1], 3) if waits else 0.0,
+                "max": round(waits[-1], 3) if waits else 0.0,
+            },
+            "avg_run_seconds": round(self._avg_run_seconds, 3),
+        }
+
+
+def _epoch(timestamp: str) -> float:
+    """Epoch seconds of a queue timestamp (UTC ISO with a trailing Z)."""
+    return datetime.fromisoformat(timestamp.removesuffix("Z")).replace(tzinfo=timezone.utc).timestamp()
+
+
+# Singleton instance
+scheduler = JobScheduler()
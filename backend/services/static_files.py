@@ -0,0 +1,160 @@
+"""
+Static file serving through the storage service.
+
+/static/outputs/<filename> and /static/assets/<type>/<filename> URLs stay
+flat whatever the storage layout: outputs are looked up in their
+hash-prefix shard and then in the legacy flat location, and asset
+filenames resolve through their blob store alias. On remote storage
+backends files are served from the local read-through cache.
+/static/blobs/<sha256><ext> serves blobs by content hash, and
+/static/derived/ their derivatives; neither ever changes, so those
+responses are cacheable forever.
+
+Every response carries an ETag derived from the content hash where one is
+known (falling back to Starlette's mtime/size tag), and conditional
+requests are answered with 304 Not Modified. Mutable URLs are sent with
+`Cache-Control: no-cache`, so browsers keep their copy and revalidate it;
+adding `?v=<hash>` (as listings do) makes them immutable too, as long as
+the hash (or at least its first 16 digits) is that of the current content.
+"""
+
+import os
+import re
+from email.utils import parsedate
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+from services.storage import storage
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_HASH_PREFIX = re.compile(r"^[0-9a-f]{64}")
+# ?v= carries a prefix of the content hash; too short a prefix proves nothing
+_VERSION = re.compile(r"^[0-9a-f]{16,64}$")
+
+
+def content_etag(path: str) -> Optional[str]:
+    """ETag for content-addressed files: blobs and their derivatives are named after their hash."""
+    stem = Path(path).stem
+    return stem if _HASH_PREFIX.match(stem) else None
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """
+    Whether a 304 can be sent. If-None-Match wins over If-Modified-Since, so
+    content swapped for an older file (re-pointed aliases) isn't mistaken
+    for unchanged.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers.get("etag", "").removeprefix("W/")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    last_modified = response_headers.get("last-modified")
+    if if_modified_since and last_modified:
+        since, modified = parsedate(if_modified_since), parsedate(last_modified)
+        return since is not None and modified is not None and since >= modified
+    return False
+
+
+def conditional_response(
+    path: Path,
+    request_headers: Headers,
+    etag: Optional[str] = None,
+    cache_control: str = REVALIDATE,
+    stat_result: Optional[os.stat_result] = None,
+    status_code: int = 200,
+) -> Response:
+    """FileResponse with an ETag and Cache-Control, or a 304 if the client's copy is current."""
+    response = FileResponse(path, status_code=status_code, stat_result=stat_result or os.stat(path))
+    if etag:
+        response.headers["etag"] = f'"{etag}"'
+    response.headers["cache-control"] = cache_control
+    if is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+class StorageStaticFiles(StaticFiles):
+    """
+    StaticFiles that resolves each URL path with `resolve`, optionally
+    reporting each file served to `on_access` (used for LRU retention).
+
+    `etag` maps the resolved file to its content hash. Responses are
+    immutable when `immutable` is set, or when `versioned` is set and the
+    URL's `v` query parameter matches that hash - a stale or made-up
+    version must not pin the current content in caches for a year.
+    """
+
+    def __init__(
+        self,
+        *args,
+        resolve: Callable[[str], Optional[Path]],
+        on_access: Optional[Callable[[str], None]] = None,
+        etag: Callable[[str], Optional[str]] = content_etag,
+        immutable: bool = False,
+        versioned: bool = False,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.resolve = resolve
+        self.on_access = on_access
+        self.etag = etag
+        self.immutable = immutable
+        self.versioned = versioned
+
+    def lookup_path(self, path: str):
+        if not path or path.startswith(("/", ".")) or ".." in path.split("/"):
+            return "", None
+        resolved = self.resolve(path)
+        if not resolved:
+            return "", None
+        try:
+            stat_result = os.stat(resolved)
+        except FileNotFoundError:
+            return "", None
+        if self.on_access:
+            self.on_access(os.path.basename(path))
+        return str(resolved), stat_result
+
+    def _cache_control(self, scope, etag: Optional[str]) -> str:
+        if self.immutable:
+            return IMMUTABLE
+        if self.versioned and etag:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            version = (query.get("v") or [""])[0]
+            if _VERSION.match(version) and etag.startswith(version):
+                return IMMUTABLE
+        return REVALIDATE
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        etag = self.etag(str(full_path))
+        return conditional_response(
+            Path(full_path),
+            Headers(scope=scope),
+            etag=etag,
+            cache_control=self._cache_control(scope, etag),
+            stat_result=stat_result,
+            status_code=status_code,
+        )
+
+
+def asset_file(path: str) -> Optional[Path]:
+    """Resolve "<type>/<filename>" to the asset's local file."""
+    asset_type, _, name = path.partition("/")
+    if not asset_type or not name or asset_type.startswith("_"):
+        return None
+    return storage.get_asset_path(asset_type, name)
+
+
+def output_etag(path: str) -> Optional[str]:
+    return storage.output_hash(os.path.basename(path))
@@ -1,22 +1,218 @@
+import hashlib
 import json
 import os
+import socket
+import threading
+import time
 from pathlib import Path
 from typing import Optional
 from datetime import datetime
 import uuid
 
 from models import Template, TemplateCreate
+from PIL import Image
+
+from services.asset_store import AssetStore, blob_name
+from services.change_feed import change_feed
+from services.derivatives import DEFAULT_CANVAS, GALLERY_SIZE, DerivativeStore
+from services.output_catalog import OutputCatalog, parse_output_filename
+from services.storage_backends import LocalBackend, StorageBackend, create_backend
+from services.uploads import FONT_EXTENSIONS
+
+OUTPUT_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+HEX_DIGITS = set("0123456789abcdef")
+ASSET_TYPES = ["backgrounds", "fonts", "overlays", "subjects", "keeper"]
+# Names the data directory whose indexes a shared backend belongs to
+INDEX_OWNER_KEY = "_meta/index_owner.json"
+
+
+def shard_for(filename: str) -> str:
+    """Two-hex-digit shard directory for a filename (256 shards per directory)."""
+    return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2]
+
+
+def file_sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def is_shard_dir(name: str) -> bool:
+    return len(name) == 2 and set(name) <= HEX_DIGITS
+
+
+def iter_files(directory: Path):
+    """Yield os.DirEntry for every file in a directory and its shard subdirectories."""
+    if not directory.exists():
+        return
+    with os.scandir(directory) as entries:
+        shards = []
+        for entry in entries:
+            if entry.is_file():
+                yield entry
+            elif entry.is_dir() and is_shard_dir(entry.name):
+                shards.append(entry.path)
+    for shard in shards:
+        with os.scandir(shard) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield entry
+
+
+class TemplateIndex:
+    """
+    In-memory cache of parsed templates, keyed by id.
+
+    Each entry remembers the version (mtime and size, or ETag) of the file
+    it was parsed from, so a changed file is re-read on the next access.
+    Listings are served from a sorted snapshot and only re-scan the
+    backend every `rescan_seconds`, which picks up files added or edited
+    outside the API. Writes through StorageService update the index
+    immediately, and other processes' indexes through the change feed
+    (see invalidate). On remote backends single lookups also trust an entry for
+    `revalidate_seconds` instead of checking the backend every time.
+
+    Cached Template objects are shared - treat them as read-only.
+    """
+
+    def __init__(self, backend: StorageBackend, rescan_seconds: float = 2.0, revalidate_seconds: float = 0.0):
+        self.backend = backend
+        self.rescan_seconds = rescan_seconds
+        self.revalidate_seconds = revalidate_seconds
+        # id -> (version, validated_at, template)
+        self._entries: dict[str, tuple[str, float, Template]] = {}
+        self._sorted: Optional[list[Template]] = None
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(template_id: str) -> str:
+        return f"templates/{template_id}.json"
+
+    def _load(self, template_id: str, version: str) -> Optional[Template]:
+        content = self.backend.read_bytes(self._key(template_id))
+        if content is None:
+            return None
+        template = Template(**json.loads(content))
+        self._entries[template_id] = (version, time.monotonic(), template)
+        self._sorted = None
+        return template
+
+    def get(self, template_id: str) -> Optional[Template]:
+        with self._lock:
+            entry = self._entries.get(template_id)
+            if entry and time.monotonic() - entry[1] < self.revalidate_seconds:
+                return entry[2]
+
+        stat = self.backend.stat(self._key(template_id))
+        with self._lock:
+            if stat is None:
+                if self._entries.pop(template_id, None):
+                    self._sorted = None
+                return None
+            entry = self._entries.get(template_id)
+            if entry and entry[0] == stat.version:
+                self._entries[template_id] = (entry[0], time.monotonic(), entry[2])
+                return entry[2]
+            return self._load(template_id, stat.version)
+
+    def list(self) -> list[Template]:
+        with self._lock:
+            if self._sorted is not None and time.monotonic() - self._scanned_at < self.rescan_seconds:
+                return list(self._sorted)
+
+            seen = set()
+            for key, stat in self.backend.list("templates/"):
+                name = key[len("templates/"):]
+                if "/" in name or not name.endswith(".json") or name.startswith("."):
+                    continue
+                template_id = name[:-5]
+                seen.add(template_id)
+                cached = self._entries.get(template_id)
+                if not cached or cached[0] != stat.version:
+                    self._load(template_id, stat.version)
+
+            for template_id in list(self._entries):
+                if template_id not in seen:
+                    del self._entries[template_id]
+                    self._sorted = None
+
+            if self._sorted is None:
+                self._sorted = sorted(
+                    (entry[2] for entry in self._entries.values()),
+                    key=lambda t: t.updated_at,
+                    reverse=True,
+                )
+            self._scanned_at = time.monotonic()
+            return list(self._sorted)
+
+    def put(self, template: Template):
+        """Record a template that was just written."""
+        stat = self.backend.stat(self._key(template.id))
+        with self._lock:
+            self._entries[template.id] = (stat.version if stat else "", time.monotonic(), template)
+            self._sorted = None
+
+    def remove(self, template_id: str):
+        with self._lock:
+            self._entries.pop(template_id, None)
+            self._sorted = None
+
+    def invalidate(self, template_id: str):
+        """Another process wrote or deleted a template: re-read it, and re-scan listings."""
+        with self._lock:
+            self._entries.pop(template_id, None)
+            self._sorted = None
+            self._scanned_at = 0.0
 
 
 class StorageService:
-    def __init__(self, data_dir: str = "./data"):
+    def __init__(self, data_dir: str = "./data", backend: Optional[StorageBackend] = None):
         self.data_dir = Path(data_dir)
+        # Templates, asset blobs and outputs live in the backend; the SQLite
+        # indexes stay under data_dir (which a shared backend is bound to,
+        # see _claim_backend) and node-local files under cache_root
+        self.backend = backend or create_backend(self.data_dir)
+        self.cache_root = self.backend.cache_root
         self.templates_dir = self.data_dir / "templates"
         self.assets_dir = self.data_dir / "assets"
         self.outputs_dir = self.data_dir / "outputs"
+        # "sharded" writes files under a hash-prefix subdirectory; lookups
+        # always fall back to the flat layout so old files keep resolving
+        self.sharded = os.getenv("STORAGE_LAYOUT", "sharded") == "sharded"
         self._ensure_dirs()
+        is_local = isinstance(self.backend, LocalBackend)
+        self.index_id = None if is_local else self._index_id()
+        if not is_local:
+            self._claim_backend()
+        rescan_seconds = float(os.getenv("TEMPLATE_RESCAN_SECONDS", "2"))
+        self.templates = TemplateIndex(
+            self.backend,
+            rescan_seconds=rescan_seconds,
+            revalidate_seconds=0.0 if is_local else rescan_seconds,
+        )
+        change_feed.subscribe("templates", lambda _, change: self.templates.invalidate(change["id"]))
+        self.derivatives = DerivativeStore(
+            self.cache_root / "assets" / "_derived",
+            threads=int(os.getenv("ASSET_DERIVE_THREADS", "2")),
+            cache_size=int(os.getenv("ASSET_DECODE_CACHE", "32")),
+        )
+        self.asset_store = AssetStore(
+            self.backend,
+            self.data_dir / "assets.db",
+            on_collect=self.derivatives.remove,
+            can_collect=None if is_local else self.owns_backend,
+        )
+        self.output_catalog = OutputCatalog(self.data_dir / "outputs.db")
+        if self.output_catalog.is_new:
+            self.rebuild_output_catalog()
 
     def _ensure_dirs(self):
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        if not isinstance(self.backend, LocalBackend):
+            return
         self.templates_dir.mkdir(parents=True, exist_ok=True)
         (self.assets_dir / "backgrounds").mkdir(parents=True, exist_ok=True)
         (self.assets_dir / "fonts").mkdir(parents=True, exist_ok=True)
@@ -25,21 +221,79 @@ class StorageService:
         (self.assets_dir / "keeper").mkdir(parents=True, exist_ok=True)
         self.outputs_dir.mkdir(parents=True, exist_ok=True)
 
+    # Index ownership
+    def _index_id(self) -> str:
+        """Stable id of this data directory, shared by every process using it."""
+        path = self.data_dir / "index_id"
+        try:
+            return path.read_text().strip()
+        except FileNotFoundError:
+            pass
+        index_id = uuid.uuid4().hex
+        try:
+            # O_EXCL: if another process got there first, use its id
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return path.read_text().strip()
+        with os.fdopen(fd, "w") as f:
+            f.write(index_id)
+        return index_id
+
+    def _read_owner(self) -> Optional[dict]:
+        content = self.backend.read_bytes(INDEX_OWNER_KEY)
+        return json.loads(content) if content else None
+
+    def _claim_backend(self):
+        """
+        Bind a shared backend to this data directory.
+
+        Asset aliases and the output catalog are indexed in SQLite under
+        data_dir, so a bucket can only be used from one data directory:
+        another host would neither resolve aliases made here nor know which
+        blobs are still referenced. Processes sharing this data directory
+        can all use it. Refuses to start when the bucket already belongs to
+        another data directory, unless STORAGE_TAKE_OVER=1 (after that one
+        has been shut down for good).
+        """
+        owner = self._read_owner()
+        if owner and owner.get("index_id") == self.index_id:
+            return
+        if owner and os.getenv("STORAGE_TAKE_OVER", "0") != "1":
+            raise RuntimeError(
+                f"The storage backend is indexed by another data directory "
+                f"({owner.get('data_dir')} on {owner.get('host')}). Give each install its own "
+                f"bucket or S3_PREFIX, or set STORAGE_TAKE_OVER=1 once that install is gone."
+            )
+        record = {
+            "index_id": self.index_id,
+            "host": socket.gethostname(),
+            "data_dir": str(self.data_dir.resolve()),
+            "claimed_at": datetime.now().isoformat(),
+        }
+        self.backend.write_bytes(INDEX_OWNER_KEY, json.dumps(record).encode("utf-8"))
+        # Two installs claiming at once: the last write wins, the other stops here
+        owner = self._read_owner()
+        if not owner or owner.get("index_id") != self.index_id:
+            raise RuntimeError("Another data directory claimed the storage backend at the same time")
+        print(f"Storage: claimed the backend for {record['data_dir']}")
+
+    def owns_backend(self) -> bool:
+        """Whether the backend still belongs to this data directory's indexes."""
+        if isinstance(self.backend, LocalBackend):
+            return True
+        try:
+            owner = self._read_owner()
+        except Exception as e:
+            print(f"Storage: could not check backend owner: {e}")
+            return False
+        return bool(owner) and owner.get("index_id") == self.index_id
+
     # Templates
     def list_templates(self) -> list[Template]:
-        templates = []
-        for f in self.templates_dir.glob("*.json"):
-            with open(f) as file:
-                data = json.load(file)
-                templates.append(Template(**data))
-        return sorted(templates, key=lambda t: t.updated_at, reverse=True)
+        return self.templates.list()
 
     def get_template(self, template_id: str) -> Optional[Template]:
-        path = self.templates_dir / f"{template_id}.json"
-        if not path.exists():
-            return None
-        with open(path) as f:
-            return Template(**json.load(f))
+        return self.templates.get(template_id)
 
     def create_template(self, data: TemplateCreate) -> Template:
         template_id = str(uuid.uuid4())[:8]
@@ -65,9 +319,9 @@ class StorageService:
         return updated
 
     def delete_template(self, template_id: str) -> bool:
-        path = self.templates_dir / f"{template_id}.json"
-        if path.exists():
-            path.unlink()
+        if self.backend.delete(TemplateIndex._key(template_id)):
+            self.templates.remove(template_id)
+            self._template_changed(template_id)
             return True
         return False
 
@@ -85,84 +339,451 @@ class StorageService:
         return new_template
 
     def _save_template(self, template: Template):
-        path = self.templates_dir / f"{template.id}.json"
-        with open(path, "w") as f:
-            json.dump(template.model_dump(mode="json"), f, indent=2, default=str)
+        content = json.dumps(template.model_dump(mode="json"), indent=2, default=str)
+        self.backend.write_bytes(TemplateIndex._key(template.id), content.encode("utf-8"))
+        self.templates.put(template)
+        self._template_changed(template.id)
+        self._derive_for_template(template)
+
+    @staticmethod
+    def _template_changed(template_id: str):
+        """Tell other processes to drop their cached copy."""
+        if change_feed.enabled:
+            change_feed.publish("templates", {"id": template_id})
+
+    # Layout
+    def _write_key(self, prefix: str, filename: str) -> str:
+        """Where a new file should be written under the configured layout."""
+        if self.sharded:
+            return f"{prefix}/{shard_for(filename)}/{filename}"
+        return f"{prefix}/{filename}"
+
+    def _find(self, prefix: str, filename: str) -> Optional[str]:
+        """Resolve a filename in either layout to its key."""
+        if not self.valid_name(filename):
+            return None
+        for key in (f"{prefix}/{shard_for(filename)}/{filename}", f"{prefix}/{filename}"):
+            if self.backend.exists(key):
+                return key
+        return None
+
+    def _find_many(self, prefix: str, filenames: list[str]) -> dict[str, Optional[str]]:
+        """_find for several filenames, with one batched stat per layout."""
+        found = {name: None for name in filenames}
+        pending = [name for name in filenames if self.valid_name(name)]
+        for layout in (lambda n: f"{prefix}/{shard_for(n)}/{n}", lambda n: f"{prefix}/{n}"):
+            if not pending:
+                break
+            keys = {layout(name): name for name in pending}
+            for key, stat in self.backend.stat_many(list(keys)).items():
+                if stat is not None:
+                    found[keys[key]] = key
+            pending = [name for name in pending if found[name] is None]
+        return found
+
+    def _write_file(self, prefix: str, filename: str, content: bytes) -> str:
+        key = self._write_key(prefix, filename)
+        self.backend.write_bytes(key, content)
+        # Don't leave a stale copy behind in the other layout
+        other = f"{prefix}/{filename}" if self.sharded else f"{prefix}/{shard_for(filename)}/{filename}"
+        self.backend.delete(other)
+        return key
+
+    def _legacy_files(self, prefix: str):
+        """Yield (key, stat) for files directly in prefix or one of its shards."""
+        for key, stat in self.backend.list(f"{prefix}/"):
+            parts = key[len(prefix) + 1:].split("/")
+            if parts[-1].startswith("."):
+                continue
+            if len(parts) == 1 or (len(parts) == 2 and is_shard_dir(parts[0])):
+                yield key, stat
+
+    @staticmethod
+    def _asset_prefixes() -> list[str]:
+        return [f"assets/{asset_type}" for asset_type in ASSET_TYPES]
+
+    def migrate_layout(self, dry_run: bool = False) -> dict:
+        """Move flat files into shard directories. Returns moved counts per directory."""
+        moved = {}
+        for prefix in ["outputs"] + self._asset_prefixes():
+            count = 0
+            flat = [key for key, _ in self._legacy_files(prefix) if key.count("/") == prefix.count("/") + 1]
+            for key in flat:
+                name = key.rsplit("/", 1)[1]
+                if not dry_run:
+                    self.backend.move(key, f"{prefix}/{shard_for(name)}/{name}")
+                count += 1
+            moved[prefix] = count
+        return moved
 
     # Assets
     def list_assets(self, asset_type: str) -> list[dict]:
-        asset_dir = self.assets_dir / asset_type
-        if not asset_dir.exists():
+        if asset_type not in ASSET_TYPES:
             return []
-        assets = []
-        for f in asset_dir.iterdir():
-            if f.is_file() and not f.name.startswith("."):
+        references = self.asset_references()
+        records = self.asset_store.list(asset_type)
+        thumbnails = self.derivatives.thumbnail_names([r["hash"] for r in records])
+        assets = [self._asset_entry(record, references, thumbnails) for record in records]
+        aliased = {a["filename"] for a in assets}
+        # Files that predate the blob store (see migrate_storage)
+        for key, stat in self._legacy_files(f"assets/{asset_type}"):
+            name = key.rsplit("/", 1)[1]
+            if name not in aliased:
                 assets.append({
-                    "id": f.stem,
-                    "filename": f.name,
-                    "path": str(f),
+                    "id": Path(name).stem,
+                    "filename": name,
+                    "path": str(self.cache_root / key),
                     "type": asset_type,
-                    "size": f.stat().st_size,
+                    "size": stat.size,
+                    "hash": None,
+                    "url": None,
+                    "thumbnail_url": None,
+                    "used_by": references.get((asset_type, name), []),
                 })
         return assets
 
-    def save_asset(self, asset_type: str, filename: str, content: bytes) -> dict:
-        asset_dir = self.assets_dir / asset_type
-        asset_dir.mkdir(parents=True, exist_ok=True)
-        path = asset_dir / filename
-        with open(path, "wb") as f:
-            f.write(content)
-        return {
-            "id": path.stem,
-            "filename": filename,
-            "path": str(path),
-            "type": asset_type,
+    def _asset_entry(
+        self,
+        record: dict,
+        references: Optional[dict] = None,
+        thumbnails: Optional[dict[str, Optional[str]]] = None,
+    ) -> dict:
+        name = blob_name(record["hash"], record["ext"])
+        if references is None:
+            references = self.asset_references()
+        entry = {
+            "id": Path(record["filename"]).stem,
+            "filename": record["filename"],
+            "path": str(self.cache_root / self.asset_store.blob_key(record["hash"], record["ext"])),
+            "type": record["asset_type"],
+            "size": record["size"],
+            "hash": record["hash"],
+            "url": f"/static/blobs/{name}",
+            "used_by": references.get((record["asset_type"], record["filename"]), []),
         }
+        if thumbnails is not None:
+            thumbnail = thumbnails.get(record["hash"])
+        else:
+            thumbnail = self.derivatives.thumbnail_name(record["hash"])
+        entry["thumbnail_url"] = f"/static/derived/{thumbnail}" if thumbnail else None
+        if record["asset_type"] == "fonts":
+            path = self.asset_store.blob_path(record["hash"], record["ext"])
+            entry["font"] = self.derivatives.font_info(path, record["hash"]) if path else None
+        return entry
+
+    def save_asset(self, asset_type: str, filename: str, content: bytes) -> dict:
+        if not self.valid_name(filename):
+            raise ValueError("Invalid filename")
+        record = self.asset_store.put(asset_type, filename, content)
+        self._remove_legacy_asset(asset_type, filename)
+        self._derive(record)
+        return self._asset_entry(record)
+
+    def save_staged_asset(self, asset_type: str, filename: str, source: Path, digest: str, size: int) -> dict:
+        """Move an already-hashed file (staged under asset_store.blobs_dir) into place."""
+        if not self.valid_name(filename):
+            raise ValueError("Invalid filename")
+        record = self.asset_store.link(asset_type, filename, digest, size, source=source)
+        self._remove_legacy_asset(asset_type, filename)
+        self._derive(record)
+        return self._asset_entry(record)
 
     def delete_asset(self, asset_type: str, filename: str) -> bool:
-        path = self.assets_dir / asset_type / filename
-        if path.exists():
-            path.unlink()
-            return True
-        return False
+        deleted = self.asset_store.delete(asset_type, filename)
+        return self._remove_legacy_asset(asset_type, filename) or deleted
+
+    def _remove_legacy_asset(self, asset_type: str, filename: str) -> bool:
+        key = self._find(f"assets/{asset_type}", filename)
+        return bool(key) and self.backend.delete(key)
 
     def get_asset_path(self, asset_type: str, filename: str) -> Optional[Path]:
-        path = self.assets_dir / asset_type / filename
-        return path if path.exists() else None
+        """A local file for the asset (downloaded into the cache on remote backends)."""
+        record = self.asset_store.resolve(asset_type, filename)
+        if record:
+            path = self.asset_store.blob_path(record["hash"], record["ext"])
+            if path:
+                return path
+        key = self._find(f"assets/{asset_type}", filename)
+        return self.backend.local_path(key) if key else None
+
+    def get_blob_path(self, name: str) -> Optional[Path]:
+        """A local file for a blob by its /static/blobs name (<sha256><ext>)."""
+        digest, ext = name[:64], name[64:]
+        if len(digest) != 64 or not set(digest) <= HEX_DIGITS or "/" in ext:
+            return None
+        return self.asset_store.blob_path(digest, ext)
+
+    def load_asset_image(
+        self,
+        asset_type: str,
+        filename: str,
+        mode: str,
+        size: Optional[tuple[int, int]] = None,
+        resample: Optional[int] = None,
+    ) -> Optional[Image.Image]:
+        """
+        Open an asset converted to `mode` (and resized to `size`), using its
+        prepared derivative when the asset is in the blob store.
+
+        The returned image may be shared - treat it as read-only.
+        """
+        record = self.asset_store.resolve(asset_type, filename)
+        if record:
+            path = self.asset_store.blob_path(record["hash"], record["ext"])
+            if path:
+                return self.derivatives.image(path, record["hash"], mode, size, resample)
+        path = self.get_asset_path(asset_type, filename)
+        if not path:
+            return None
+        image = Image.open(path).convert(mode)
+        if size:
+            image = image.resize(size, resample) if resample is not None else image.resize(size)
+        return image
+
+    def _derive(self, record: dict):
+        """Queue derivative builds for a newly saved asset."""
+        variants = []
+        if record["asset_type"] == "backgrounds":
+            variants = self._background_variants(record["filename"]) or [("RGB", DEFAULT_CANVAS, Image.LANCZOS)]
+        path = self.asset_store.blob_path(record["hash"], record["ext"])
+        if path:
+            self.derivatives.submit(record["asset_type"], path, record["hash"], variants)
+
+    def _background_variants(self, filename: str, templates: Optional[list[Template]] = None) -> list[tuple]:
+        """(mode, size, resample) of every way the templates draw a background."""
+        variants = set()
+        for template in templates if templates is not None else self.list_templates():
+            bg = template.background
+            if filename in bg.fixed_images[:1]:
+                size = (int(template.canvas.width * (bg.scale or 1.0)), int(template.canvas.height * (bg.scale or 1.0)))
+                variants.add(("RGB", size, Image.LANCZOS))
+            for zone in template.zones.values():
+                if zone.type == "image" and filename in zone.mapping.values():
+                    variants.add(("RGBA", (zone.position.width, zone.position.height), None))
+        return sorted(variants, key=str)
+
+    def _derive_for_template(self, template: Template):
+        """Pre-build the background variants a (new or edited) template will need."""
+        names = set(template.background.fixed_images[:1])
+        for zone in template.zones.values():
+            if zone.type == "image":
+                names.update(zone.mapping.values())
+        for filename in names:
+            record = self.asset_store.resolve("backgrounds", filename)
+            if record:
+                path = self.asset_store.blob_path(record["hash"], record["ext"])
+                if path:
+                    variants = self._background_variants(filename, [template])
+                    self.derivatives.submit("backgrounds", path, record["hash"], variants)
+
+    def asset_references(self) -> dict[tuple[str, str], list[str]]:
+        """(asset_type, filename) -> ids of the templates that use it."""
+        references: dict[tuple[str, str], list[str]] = {}
+
+        def add(asset_type: str, filename: str, template_id: str):
+            if filename:
+                users = references.setdefault((asset_type, filename), [])
+                if template_id not in users:
+                    users.append(template_id)
+
+        for template in self.list_templates():
+            for asset_type, filename in self.template_assets(template):
+                add(asset_type, filename, template.id)
+        return references
+
+    @staticmethod
+    def template_assets(template: Template) -> list[tuple[str, str]]:
+        """(asset_type, filename) of every asset a template may render with."""
+        assets = [("backgrounds", filename) for filename in template.background.fixed_images]
+        if template.subject.image:
+            assets.append(("subjects", template.subject.image))
+        assets.extend(("overlays", filename) for filename in template.overlays)
+        for zone in template.zones.values():
+            if zone.type == "badge":
+                assets.extend(("overlays", filename) for filename in zone.variants.values())
+            elif zone.type == "image":
+                assets.extend(("backgrounds", filename) for filename in zone.mapping.values())
+            else:
+                # Zones name a font by stem; any uploaded format may be the one used
+                assets.extend(("fonts", f"{zone.font}{ext}") for ext in FONT_EXTENSIONS)
+        return [(asset_type, filename) for asset_type, filename in assets if filename]
+
+    def ingest_legacy_assets(self, dry_run: bool = False) -> dict:
+        """Move pre-blob-store asset files into the blob store. Returns counts per type."""
+        ingested = {}
+        for prefix in self._asset_prefixes():
+            asset_type = prefix.split("/", 1)[1]
+            count = 0
+            for key, stat in list(self._legacy_files(prefix)):
+                if not dry_run:
+                    path = self.backend.local_path(key)
+                    if not path:
+                        continue
+                    record = self.asset_store.link(
+                        asset_type,
+                        key.rsplit("/", 1)[1],
+                        file_sha256(path),
+                        stat.size,
+                        source=path,
+                    )
+                    # Locally the file was moved; remote backends still hold the original
+                    self.backend.delete(key)
+                    self._derive(record)
+                count += 1
+            ingested[asset_type] = count
+        return ingested
+
+    @staticmethod
+    def valid_name(filename: str) -> bool:
+        """A bare filename: no path separators, not "." or ".."."""
+        return bool(filename) and "/" not in filename and "\\" not in filename and filename not in (".", "..")
 
     # Outputs
-    def list_outputs(self) -> list[dict]:
-        outputs = []
-        for f in self.outputs_dir.glob("*.png"):
-            outputs.append({
-                "id": f.stem,
-                "filename": f.name,
-                "path": str(f),
-                "size": f.stat().st_size,
-                "created_at": datetime.fromtimestamp(f.stat().st_mtime).isoformat(),
-            })
-        return sorted(outputs, key=lambda o: o["created_at"], reverse=True)
-
-    def save_output(self, filename: str, content: bytes) -> dict:
-        path = self.outputs_dir / filename
-        with open(path, "wb") as f:
-            f.write(content)
+    def list_outputs(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        episode_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> tuple[list[dict], Optional[str]]:
+        """Page through the output catalog, newest first."""
+        records, next_cursor = self.output_catalog.query(
+            limit=limit,
+            cursor=cursor,
+            episode_id=episode_id,
+            template_id=template_id,
+            job_id=job_id,
+        )
+        return [self._output_entry(r) for r in records], next_cursor
+
+    def iter_output_files(self, **filters):
+        """
+        Yield (record, local path) for every output matching the catalog
+        filters, newest first. Files missing from storage are skipped.
+        """
+        for record in self.output_catalog.iter_all(batch_size=200, **filters):
+            path = self.get_output_path(record["filename"])
+            if path:
+                yield record, path
+
+    def _output_entry(self, record: dict) -> dict:
+        filename = record["filename"]
+        # Versioned URLs can be cached forever - new content, new hash
+        version = f"?v={record['hash'][:16]}" if record.get("hash") else ""
         return {
-            "id": path.stem,
+            "id": Path(filename).stem,
             "filename": filename,
-            "path": str(path),
+            "path": str(self.cache_root / self._write_key("outputs", filename)),
+            "url": f"/static/outputs/{filename}{version}",
+            "thumbnail_url": f"/static/thumbs/{filename}{version}",
+            "hash": record.get("hash"),
+            "size": record["size"],
+            "format": record["format"],
+            "created_at": record["created_at"],
+            "episode_id": record["episode_id"],
+            "template_id": record["template_id"],
+            "job_id": record["job_id"],
+        }
+
+    def save_output(
+        self,
+        filename: str,
+        content: bytes,
+        episode_id: Optional[str] = None,
+        template_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> dict:
+        key = self._write_file("outputs", filename, content)
+        content_hash = hashlib.sha256(content).hexdigest()
+        self.output_catalog.add(
+            filename,
+            size=len(content),
+            episode_id=episode_id,
+            template_id=template_id,
+            job_id=job_id,
+            content_hash=content_hash,
+        )
+        return {
+            "id": Path(filename).stem,
+            "filename": filename,
+            "path": str(self.cache_root / key),
+            "hash": content_hash,
         }
 
     def delete_output(self, filename: str) -> bool:
-        path = self.outputs_dir / filename
-        if path.exists():
-            path.unlink()
+        key = self._find("outputs", filename)
+        if key and self.backend.delete(key):
+            digest = self.output_hash(filename)
+            self.output_catalog.remove(filename)
+            if digest and not self.output_catalog.has_hash(digest):
+                self.derivatives.remove(digest, kind="gallery")
             return True
         return False
 
+    def rebuild_output_catalog(self) -> int:
+        """Re-index every file in the outputs directory; returns the count."""
+        template_ids = [t.id for t in self.list_templates()]
+        existing = {r["filename"]: r for r in self.output_catalog.iter_all()}
+        records = []
+        for key, stat in self._legacy_files("outputs"):
+            name = key.rsplit("/", 1)[1]
+            if Path(name).suffix.lower() not in OUTPUT_EXTENSIONS:
+                continue
+            known = existing.get(name) or {}
+            episode_id, template_id = parse_output_filename(name, template_ids)
+            # Hash new or changed files, so their ETags and ?v= URLs survive
+            digest = known.get("hash") if known.get("size") == stat.size else None
+            if not digest:
+                path = self.backend.local_path(key)
+                digest = file_sha256(path) if path else None
+            records.append((
+                name,
+                known.get("episode_id") or episode_id,
+                known.get("template_id") or template_id,
+                known.get("job_id"),
+                stat.size,
+                Path(name).suffix.lstrip(".").lower(),
+                known.get("created_at") or datetime.fromtimestamp(stat.mtime).isoformat(),
+                digest,
+            ))
+        self.output_catalog.replace_all(records)
+        return len(records)
+
     def get_output_path(self, filename: str) -> Optional[Path]:
-        path = self.outputs_dir / filename
-        return path if path.exists() else None
+        """A local file for the output (downloaded into the cache on remote backends)."""
+        key = self._find("outputs", filename)
+        return self.backend.local_path(key) if key else None
+
+    def output_exists(self, filename: str) -> bool:
+        return self._find("outputs", filename) is not None
+
+    def output_hash(self, filename: str) -> Optional[str]:
+        """The output's SHA-256 as recorded in the catalog, if known."""
+        record = self.output_catalog.get(filename)
+        return record.get("hash") if record else None
+
+    def get_output_thumbnail(self, filename: str) -> Optional[Path]:
+        """A small WebP of the output for galleries, built on first request."""
+        path = self.get_output_path(filename)
+        if not path:
+            return None
+        digest = self.output_hash(filename)
+        if not digest:
+            # Indexed before hashes were recorded
+            digest = file_sha256(path)
+            self.output_catalog.set_hash(filename, digest)
+        try:
+            return self.derivatives.thumbnail(path, digest, size=GALLERY_SIZE, kind="gallery")
+        except OSError:
+            return None
+
+    def outputs_exist(self, filenames: list[str]) -> dict[str, bool]:
+        return {name: key is not None for name, key in self._find_many("outputs", filenames).items()}
+
+    def output_hashes(self, filenames: list[str]) -> dict[str, Optional[str]]:
+        """Each output's SHA-256 as recorded in the catalog (None if unknown or deleted)."""
+        return {name: self.output_hash(name) for name in filenames}
 
 
 # Singleton instance
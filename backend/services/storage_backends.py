@@ -0,0 +1,421 @@
+"""
+Storage Backends
+
+Where StorageService keeps templates, asset blobs and outputs. Everything
+is addressed by a relative key such as "templates/abc123.json" or
+"outputs/9b/EP-001-keeper.png".
+
+- LocalBackend stores keys as files under DATA_DIR (the default).
+- S3Backend stores keys as objects in an S3-compatible bucket (AWS, MinIO,
+  moto's server mode, ...), so files live off the host's disk. The alias
+  and output indexes stay in SQLite under DATA_DIR, so a bucket belongs to
+  one data directory (see StorageService._claim_backend).
+  boto3 is only needed when it is selected.
+
+Readers that need a real file (PIL, fonts, FileResponse) ask for
+local_path(): for S3 that downloads the object into a local read-through
+cache. Content-addressed keys never change once written, so cached copies
+of them are trusted without asking the bucket again.
+
+Select with STORAGE_BACKEND=local|s3; see S3Backend.from_env for settings.
+"""
+
+import io
+import os
+from abc import ABC, abstractmethod
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+@dataclass
+class ObjectStat:
+    """Size and modification time of a stored key."""
+    size: int
+    mtime: float
+    # Changes whenever the content changes (mtime_ns locally, ETag on S3)
+    version: str
+
+
+def atomic_write(path: Path, content: bytes):
+    """Write a file via a temp file in the same directory and a rename."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class StorageBackend(ABC):
+    """Key/value file storage used by StorageService."""
+
+    # Local directory for files that only make sense per node (staging,
+    # derivatives, caches) and for local_path() copies
+    cache_root: Path
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def write_bytes(self, key: str, content: bytes):
+        ...
+
+    @abstractmethod
+    def write_file(self, key: str, source: Path):
+        """Store a local file under key, consuming (moving) the source file."""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def move(self, key: str, new_key: str):
+        ...
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        ...
+
+    def stat_many(self, keys: list[str]) -> dict[str, Optional[ObjectStat]]:
+        """Stat several keys in one call; missing keys map to None."""
+        return {key: self.stat(key) for key in keys}
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        """Yield (key, stat) for every key under prefix, recursively."""
+
+    @abstractmethod
+    def local_path(self, key: str) -> Optional[Path]:
+        """A local file with the key's content, or None if the key doesn't exist."""
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+
+class LocalBackend(StorageBackend):
+    """Keys are files under a root directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.cache_root = self.root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_bytes(self, key: str, content: bytes):
+        atomic_write(self._path(key), content)
+
+    def write_file(self, key: str, source: Path):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+
+    def delete(self, key: str) -> bool:
+        try:
+            self._path(key).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def move(self, key: str, new_key: str):
+        target = self._path(new_key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._path(key), target)
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectStat(size=st.st_size, mtime=st.st_mtime, version=f"{st.st_mtime_ns}-{st.st_size}")
+
+    def list(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        base = self._path(prefix)
+        if not base.is_dir():
+            return
+        stack = [base]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(Path(entry.path))
+                    elif entry.is_file():
+                        st = entry.stat()
+                        key = Path(entry.path).relative_to(self.root).as_posix()
+                        yield key, ObjectStat(st.st_size, st.st_mtime, f"{st.st_mtime_ns}-{st.st_size}")
+
+    def local_path(self, key: str) -> Optional[Path]:
+        path = self._path(key)
+        return path if path.is_file() else None
+
+
+class S3Backend(StorageBackend):
+    """
+    Keys are objects in an S3-compatible bucket, under an optional prefix.
+
+    One boto3 client (and so one HTTP connection pool) is shared by all
+    threads. Large writes go up as multipart uploads. local_path() keeps a
+    read-through cache under cache_root, bounded to cache_max_bytes.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        cache_root: Path,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        max_pool_connections: int = 32,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        cache_max_bytes: int = 2 * 1024 ** 3,
+        immutable_prefixes: tuple[str, ...] = ("assets/_blobs/",),
+    ):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.cache_root = Path(cache_root)
+        self.cache_root.mkdir(parents=True, exist_ok=True)
+        self.cache_max_bytes = cache_max_bytes
+        self.immutable_prefixes = immutable_prefixes
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+            max_concurrency=4,
+        )
+        self.max_pool_connections = max_pool_connections
+        self._head_executor: Optional[ThreadPoolExecutor] = None
+        self._cache_bytes = self._measure_cache()
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, data_dir: Path) -> "S3Backend":
+        """
+        S3_BUCKET (required), S3_PREFIX, S3_ENDPOINT_URL (MinIO etc.),
+        S3_REGION, S3_MAX_CONNECTIONS, S3_MULTIPART_THRESHOLD_MB,
+        S3_CACHE_DIR (default DATA_DIR/cache) and S3_CACHE_MAX_MB.
+        Credentials come from the usual AWS environment/config chain.
+        """
+        bucket = os.getenv("S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return cls(
+            bucket=bucket,
+            cache_root=Path(os.getenv("S3_CACHE_DIR") or data_dir / "cache"),
+            prefix=os.getenv("S3_PREFIX", ""),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region=os.getenv("S3_REGION") or None,
+            max_pool_connections=int(os.getenv("S3_MAX_CONNECTIONS", "32")),
+            multipart_threshold=int(float(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * 1024 * 1024),
+            cache_max_bytes=int(float(os.getenv("S3_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _missing(error: "ClientError") -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def read_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def write_bytes(self, key: str, content: bytes):
+        # upload_fileobj switches to multipart above the threshold
+        self.client.upload_fileobj(io.BytesIO(content), self.bucket, self._key(key), Config=self.transfer)
+        self._drop_cached(key)
+
+    def write_file(self, key: str, source: Path):
+        self.client.upload_file(str(source), self.bucket, self._key(key), Config=self.transfer)
+        # The uploaded file becomes the cached copy
+        self._drop_cached(key)
+        cached = self.cache_root / key
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, cached)
+        os.utime(cached)
+        self._account(cached.stat().st_size)
+
+    def delete(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        self._drop_cached(key)
+        return True
+
+    def move(self, key: str, new_key: str):
+        # Managed copy - multipart for large objects
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(key)}, self.bucket, self._key(new_key), Config=self.transfer
+        )
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        self._drop_cached(key)
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return ObjectStat(
+            size=head["ContentLength"],
+            mtime=head["LastModified"].timestamp(),
+            version=head["ETag"].strip('"'),
+        )
+
+    def stat_many(self, keys: list[str]) -> dict[str, Optional[ObjectStat]]:
+        # One HEAD per key, issued concurrently over the shared connection pool
+        if len(keys) < 2:
+            return super().stat_many(keys)
+        if not self._head_executor:
+            self._head_executor = ThreadPoolExecutor(
+                max_workers=self.max_pool_connections, thread_name_prefix="s3-head"
+            )
+        return dict(zip(keys, self._head_executor.map(self.stat, keys)))
+
+    def list(self, prefix: str) -> Iterator[tuple[str, ObjectStat]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], ObjectStat(
+                    size=obj["Size"],
+                    mtime=obj["LastModified"].timestamp(),
+                    version=obj["ETag"].strip('"'),
+                )
+
+    # Read-through cache
+
+    def local_path(self, key: str) -> Optional[Path]:
+        cached = self.cache_root / key
+        if cached.is_file():
+            if key.startswith(self.immutable_prefixes):
+                return cached
+            # Mutable key: reuse the copy only if the object hasn't changed
+            stat = self.stat(key)
+            if stat is None:
+                self._drop_cached(key)
+                return None
+            local = cached.stat()
+            if local.st_size == stat.size and local.st_mtime >= stat.mtime:
+                return cached
+
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cached.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp, Config=self.transfer)
+        except ClientError as e:
+            os.unlink(tmp)
+            if self._missing(e):
+                return None
+            raise
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, cached)
+        self._account(cached.stat().st_size)
+        return cached
+
+    def _drop_cached(self, key: str):
+        cached = self.cache_root / key
+        try:
+            size = cached.stat().st_size
+            cached.unlink()
+            self._account(-size)
+        except FileNotFoundError:
+            pass
+
+    def _measure_cache(self) -> int:
+        return sum(
+            stat.size for key, stat in LocalBackend(self.cache_root).list("")
+            if not key.startswith("assets/_derived/")
+        )
+
+    def _account(self, delta: int):
+        with self._cache_lock:
+            self._cache_bytes += delta
+            over = self._cache_bytes > self.cache_max_bytes
+        if over:
+            self._trim_cache()
+
+    def _trim_cache(self):
+        """Evict least recently modified cached objects down to 90% of the limit."""
+        with self._cache_lock:
+            local = LocalBackend(self.cache_root)
+            files = sorted(
+                (stat.mtime, key, stat.size) for key, stat in local.list("")
+                if not key.startswith("assets/_derived/") and not Path(key).name.startswith(".")
+            )
+            target = int(self.cache_max_bytes * 0.9)
+            for _, key, size in files:
+                if self._cache_bytes <= target:
+                    break
+                local.delete(key)
+                self._cache_bytes -= size
+
+
+def create_backend(data_dir: Path) -> StorageBackend:
+    """Build the backend selected by STORAGE_BACKEND."""
+    kind = os.getenv("STORAGE_BACKEND", "local")
+    if kind == "local":
+        return LocalBackend(data_dir)
+    if kind == "s3":
+        return S3Backend.from_env(data_dir)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {kind}")
+
+
+def copy_tree(source: StorageBackend, target: StorageBackend, prefixes: tuple[str, ...]) -> int:
+    """Copy every key under prefixes from one backend to another; returns the count."""
+    copied = 0
+    for prefix in prefixes:
+        for key, _ in source.list(prefix):
+            if Path(key).name.startswith("."):
+                continue
+            path = source.local_path(key)
+            if path is None:
+                continue
+            fd, tmp = tempfile.mkstemp(dir=target.cache_root, prefix=".copy-")
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            target.write_file(key, Path(tmp))
+            copied += 1
+    return copied
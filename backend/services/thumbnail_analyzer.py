@@ -3,24 +3,17 @@ Thumbnail CTR Analyzer Service
 
 Uses Gemini 2.5 Flash Vision to analyze YouTube thumbnails for CTR optimization.
 Incorporates research-backed guidelines from MrBeast, VidIQ, and industry studies.
+Results are cached by image and context (see services.analysis_cache).
 """
 
-import os
+import asyncio
+import hashlib
 import json
 import base64
 from typing import Optional, Dict, Any
 
-# Try the new google-genai package first, fall back to older one
-try:
-    from google import genai
-    from google.genai import types
-    USE_NEW_SDK = True
-except ImportError:
-    USE_NEW_SDK = False
-    try:
-        import google.generativeai as genai_old
-    except ImportError:
-        genai_old = None
+from services.analysis_cache import analysis_cache, context_key, fingerprint
+from services.gemini_client import gemini, types, USE_NEW_SDK
 
 
 # Comprehensive CTR research prompt incorporating MrBeast rules, VidIQ data, and industry studies
@@ -202,28 +195,19 @@ Be honest and specific. Generic feedback is useless. Every "fix" should be immed
 """
 
 
+# Changes whenever the prompt is edited, so cached analyses from an older prompt aren't reused
+PROMPT_VERSION = hashlib.sha256(THUMBNAIL_ANALYSIS_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
 class ThumbnailAnalyzerService:
     """Service for analyzing YouTube thumbnails for CTR optimization using Gemini Vision."""
 
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        self.client = None
         self.model_name = "gemini-2.5-flash"
 
-    def _get_client(self):
-        """Get or create the Gemini client."""
-        if not self.client and self.api_key:
-            if USE_NEW_SDK:
-                self.client = genai.Client(api_key=self.api_key)
-            else:
-                if genai_old:
-                    genai_old.configure(api_key=self.api_key)
-                    self.client = "legacy"
-        return self.client
-
     def is_available(self) -> bool:
         """Check if the service is available (API key is configured)."""
-        return bool(self.api_key)
+        return gemini.is_available()
 
     def _build_context_section(
         self,
@@ -325,6 +309,7 @@ class ThumbnailAnalyzerService:
         competitors: Optional[str] = None,
         video_title: Optional[str] = None,
         target_emotion: Optional[str] = None,
+        force_refresh: bool = False,
     ) -> Dict[str, Any]:
         """
         Analyze a thumbnail image for CTR optimization.
@@ -337,29 +322,48 @@ class ThumbnailAnalyzerService:
             competitors: List or description of competitor channels
             video_title: The video title this thumbnail is for
             target_emotion: The intended emotional response
+            force_refresh: Ask the model even if a cached analysis exists
 
         Returns:
-            Dict containing analysis results with scores and recommendations
+            Dict containing analysis results with scores and recommendations,
+            and "cached" (plus "cached_at") when served from the cache
         """
-        try:
-            client = self._get_client()
-
-            if not client:
-                return self._error_response("No API key configured. Please set GEMINI_API_KEY.")
-
-            # Build context section
-            context_section = self._build_context_section(
-                niche=niche,
-                target_audience=target_audience,
-                channel_style=channel_style,
-                competitors=competitors,
-                video_title=video_title,
-                target_emotion=target_emotion,
-            )
-
-            # Build the full prompt
-            full_prompt = THUMBNAIL_ANALYSIS_PROMPT.format(context_section=context_section)
+        if not gemini.is_available():
+            return self._error_response("No API key configured. Please set GEMINI_API_KEY.")
+
+        context = {
+            "niche": niche,
+            "target_audience": target_audience,
+            "channel_style": channel_style,
+            "competitors": competitors,
+            "video_title": video_title,
+            "target_emotion": target_emotion,
+        }
 
+        cache_key = None
+        if analysis_cache.enabled:
+            try:
+                image_hash, signature = await asyncio.to_thread(fingerprint, image_bytes)
+                cache_key = (image_hash, signature, context_key(context, f"{self.model_name}:{PROMPT_VERSION}"))
+            except Exception as e:
+                # Not an image PIL can read - let the model judge it, uncached
+                print(f"Thumbnail analysis: not caching, could not hash image: {e}")
+        if cache_key and not force_refresh:
+            cached = await asyncio.to_thread(analysis_cache.get, *cache_key)
+            if cached:
+                cached["cached"] = True
+                return cached
+
+        full_prompt = THUMBNAIL_ANALYSIS_PROMPT.format(context_section=self._build_context_section(**context))
+        result = await self._request(image_bytes, full_prompt)
+        if cache_key and not result.get("error"):
+            await asyncio.to_thread(analysis_cache.put, *cache_key, result)
+        result["cached"] = False
+        return result
+
+    async def _request(self, image_bytes: bytes, full_prompt: str) -> Dict[str, Any]:
+        """Send the image and prompt to the model and parse its analysis."""
+        try:
             if USE_NEW_SDK:
                 # Use the new SDK with vision capabilities
                 # Encode image to base64
@@ -377,7 +381,7 @@ class ThumbnailAnalyzerService:
                     mime_type = "image/jpeg"  # Default assumption
 
                 # Create the content with image
-                response = self.client.models.generate_content(
+                response = await gemini.generate_content(
                     model=self.model_name,
                     contents=[
                         types.Part.from_bytes(
@@ -415,6 +419,7 @@ class ThumbnailAnalyzerService:
 
             else:
                 # Legacy SDK handling
+                genai_old = gemini.legacy()
                 if not genai_old:
                     return self._error_response("Google Generative AI SDK not installed.")
 
@@ -427,12 +432,16 @@ class ThumbnailAnalyzerService:
                     "data": base64.b64encode(image_bytes).decode("utf-8")
                 }
 
-                response = model.generate_content(
+                # No async interface in the legacy SDK - run it off the event loop
+                response = await gemini.run_blocking(
+                    model.generate_content,
                     [full_prompt, image_part],
+                    rate_model=self.model_name,
+                    rate_tokens=len(full_prompt) // 4 + 4096,
                     generation_config=genai_old.GenerationConfig(
                         temperature=0.3,
                         max_output_tokens=4096,
-                    )
+                    ),
                 )
 
                 if response.text:
@@ -456,6 +465,7 @@ class ThumbnailAnalyzerService:
         competitors: Optional[str] = None,
         video_title: Optional[str] = None,
         target_emotion: Optional[str] = None,
+        force_refresh: bool = False,
     ) -> Dict[str, Any]:
         """
         Synchronous version of analyze for non-async contexts.
@@ -468,12 +478,11 @@ class ThumbnailAnalyzerService:
             competitors: List or description of competitor channels
             video_title: The video title this thumbnail is for
             target_emotion: The intended emotional response
+            force_refresh: Ask the model even if a cached analysis exists
 
         Returns:
             Dict containing analysis results with scores and recommendations
         """
-        import asyncio
-
         try:
             loop = asyncio.get_event_loop()
         except RuntimeError:
@@ -489,6 +498,7 @@ class ThumbnailAnalyzerService:
                 competitors=competitors,
                 video_title=video_title,
                 target_emotion=target_emotion,
+                force_refresh=force_refresh,
             )
         )
 
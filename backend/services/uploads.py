@@ -0,0 +1,101 @@
+"""
+Upload Service
+
+Streams multipart uploads to a staging file in fixed-size chunks, hashing
+as it goes, so an upload never has to fit in memory. The staged file is
+checked against a size limit and validated as an image or font before it
+is renamed into the asset blob store.
+"""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+
+CHUNK_SIZE = 1024 * 1024
+
+IMAGE_FORMATS = {"PNG", "JPEG", "WEBP"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+# In the order a template's font name is looked up in (see Renderer._resolve_font)
+FONT_EXTENSIONS = (".ttf", ".otf", ".woff", ".woff2")
+FONT_SIGNATURES = (b"\x00\x01\x00\x00", b"OTTO", b"true", b"ttcf", b"wOFF", b"wOF2")
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is not an acceptable asset."""
+
+
+class UploadTooLarge(UploadRejected):
+    """Raised when an upload exceeds the size limit."""
+
+
+@dataclass
+class StagedUpload:
+    """An upload written to disk and ready to be moved into place."""
+    path: Path
+    digest: str
+    size: int
+
+    def discard(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+def stage_upload(source: BinaryIO, staging_dir: Path, max_bytes: int) -> StagedUpload:
+    """
+    Copy an upload to a staging file in staging_dir. Blocking - run it in a
+    worker thread.
+
+    Raises:
+        UploadTooLarge: If the upload is larger than max_bytes
+    """
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=staging_dir, prefix=".upload-")
+    path = Path(tmp)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes / (1024 * 1024):g} MB limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    os.chmod(path, 0o644)
+    return StagedUpload(path=path, digest=digest.hexdigest(), size=size)
+
+
+def validate_asset(asset_type: str, filename: str, path: Path):
+    """
+    Check that a staged file is a font (for fonts) or an image (everything else).
+
+    Raises:
+        UploadRejected: If the file type or content is not acceptable
+    """
+    ext = Path(filename).suffix.lower()
+    if asset_type == "fonts":
+        if ext not in FONT_EXTENSIONS:
+            raise UploadRejected(f"Fonts must be one of {', '.join(sorted(FONT_EXTENSIONS))}")
+        with open(path, "rb") as f:
+            if not f.read(4).startswith(FONT_SIGNATURES):
+                raise UploadRejected("File is not a valid font")
+        return
+
+    if ext not in IMAGE_EXTENSIONS:
+        raise UploadRejected(f"Images must be one of {', '.join(sorted(IMAGE_EXTENSIONS))}")
+    try:
+        with Image.open(path) as img:
+            image_format = img.format
+            img.verify()
+    except Exception:
+        raise UploadRejected("File is not a valid image")
+    if image_format not in IMAGE_FORMATS:
+        raise UploadRejected(f"Unsupported image format: {image_format}")
@@ -0,0 +1,403 @@
+"""
+Warm Pool Service
+
+Pre-generates AI backgrounds ahead of time so AI-mode templates don't pay
+Imagen latency on the critical path of a generate job.
+
+Two kinds of entries are pooled per template:
+- episode backgrounds, pre-generated from upcoming episode data and
+  matched by their exact prompt
+- generic backgrounds built from the template's fallback_prompt, used for
+  any episode when WARM_POOL_GENERIC is enabled
+
+Pools are bounded per template and overall, entries expire, and Imagen
+spend is capped by a daily generation budget (see services.rate_limiter).
+
+Pools are shared by every process on the host: entries and upcoming
+requests live in data/warm_pool.db, with the images as PNGs under
+data/warm_pool/. A job takes a pooled background whichever process -
+an API worker or worker.py - claims it, and each process's filler picks
+up requests the others queued. Like the queue, this is SQLite, so it is
+same-host only.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from models import Template
+from services.imagen import imagen
+from services.rate_limiter import rate_limiter
+from services.storage import storage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pooled (
+    id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+    template_id         TEXT NOT NULL,
+    template_updated_at TEXT NOT NULL,
+    prompt              TEXT NOT NULL,
+    generic             INTEGER NOT NULL,
+    filename            TEXT NOT NULL,
+    created_at          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pooled_template ON pooled (template_id, prompt);
+CREATE TABLE IF NOT EXISTS upcoming (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    template_id TEXT NOT NULL,
+    prompt      TEXT NOT NULL,
+    generic     INTEGER NOT NULL DEFAULT 0,
+    claimed_at  REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_upcoming_prompt ON upcoming (template_id, prompt) WHERE generic = 0;
+"""
+
+# A request claimed longer ago than this was left by a process that died
+CLAIM_SECONDS = 600
+
+
+@dataclass
+class WarmRequest:
+    """A background the worker should pre-generate."""
+    template_id: str
+    prompt: str
+    generic: bool = False
+    request_id: Optional[int] = None
+
+
+def build_prompt(template: Template, data: dict) -> Optional[str]:
+    """Format the template's AI prompt with episode data, or None if data is missing."""
+    try:
+        return template.background.ai_config.prompt_template.format(**data)
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class WarmPool:
+    """Bounded per-template pools of pre-generated backgrounds, shared on the host."""
+
+    def __init__(self, db_path: Optional[Path] = None, images_dir: Optional[Path] = None):
+        self.enabled = os.getenv("WARM_POOL_ENABLED", "false").lower() == "true"
+        self.use_generic = os.getenv("WARM_POOL_GENERIC", "false").lower() == "true"
+        self.per_template = int(os.getenv("WARM_POOL_SIZE", "3"))
+        self.max_total = int(os.getenv("WARM_POOL_MAX_TOTAL", "50"))
+        self.max_age = float(os.getenv("WARM_POOL_MAX_AGE_SECONDS", "86400"))
+        self.daily_budget = int(os.getenv("WARM_POOL_DAILY_BUDGET", "100"))
+        self.refill_seconds = float(os.getenv("WARM_POOL_REFILL_SECONDS", "60"))
+
+        self.db_path = Path(db_path or storage.data_dir / "warm_pool.db")
+        self.images_dir = Path(images_dir or storage.data_dir / "warm_pool")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._budget = rate_limiter.daily_budget("warm_pool", self.daily_budget)
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    # Database
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use, so a disabled pool never touches disk
+        if self._conn is None:
+            self.images_dir.mkdir(parents=True, exist_ok=True)
+            # Other processes may hold the write lock briefly
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _write(self):
+        """A write transaction, serialised with every other process."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _expire(self, conn: sqlite3.Connection, template: Template) -> list[str]:
+        """Drop entries that are too old or built from an older template version."""
+        rows = conn.execute(
+            "DELETE FROM pooled WHERE created_at < ? OR (template_id = ? AND template_updated_at != ?) "
+            "RETURNING filename",
+            (time.time() - self.max_age, template.id, template.updated_at.isoformat()),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def _discard(self, filenames: list[str]):
+        """Delete the images of entries removed from the pool."""
+        for filename in filenames:
+            (self.images_dir / filename).unlink(missing_ok=True)
+            self._evicted += 1
+
+    @staticmethod
+    def _total(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COUNT(*) FROM pooled").fetchone()[0]
+
+    # Lookup
+
+    async def take(self, template: Template, prompt: str) -> Optional[Image.Image]:
+        """Pop a pooled background for this prompt (or a generic one if enabled)."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._take, template, prompt)
+
+    def _take(self, template: Template, prompt: str) -> Optional[Image.Image]:
+        with self._write() as conn:
+            stale = self._expire(conn, template)
+            # An exact match first, then the oldest generic entry
+            row = conn.execute(
+                "DELETE FROM pooled WHERE id = ("
+                "SELECT id FROM pooled WHERE template_id = ? AND "
+                "((generic = 0 AND prompt = ?) OR (generic = 1 AND ?)) "
+                "ORDER BY generic, id LIMIT 1) RETURNING filename",
+                (template.id, prompt, self.use_generic),
+            ).fetchone()
+        self._discard(stale)
+        image = self._load(row[0]) if row else None
+        if image is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._kick()
+        return image
+
+    def _load(self, filename: str) -> Optional[Image.Image]:
+        """Read a taken entry's image and delete the file."""
+        path = self.images_dir / filename
+        try:
+            with Image.open(path) as image:
+                return image.convert("RGB")
+        except OSError as e:
+            print(f"Warm pool: unreadable background {filename}: {e}")
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+
+    def _add(self, template: Template, prompt: str, generic: bool, image: Image.Image) -> bool:
+        """Pool a background, making room if needed; False if there was none."""
+        filename = f"{uuid.uuid4().hex}.png"
+        path = self.images_dir / filename
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        # Written before the entry, so whoever takes the entry finds the file
+        image.save(path, format="PNG", compress_level=1)
+        evicted: list[str] = []
+        added = False
+        try:
+            with self._write() as conn:
+                evicted += self._expire(conn, template)
+                # Make room: generic entries go first, then the oldest
+                while True:
+                    pooled = conn.execute(
+                        "SELECT COUNT(*) FROM pooled WHERE template_id = ?", (template.id,)
+                    ).fetchone()[0]
+                    if not pooled or (pooled < self.per_template and self._total(conn) < self.max_total):
+                        break
+                    evicted.append(conn.execute(
+                        "DELETE FROM pooled WHERE id = ("
+                        "SELECT id FROM pooled WHERE template_id = ? ORDER BY generic DESC, id LIMIT 1"
+                        ") RETURNING filename",
+                        (template.id,),
+                    ).fetchone()[0])
+                if self._total(conn) >= self.max_total and not generic:
+                    # An episode background displaces a generic one from another template
+                    row = conn.execute(
+                        "DELETE FROM pooled WHERE id = ("
+                        "SELECT id FROM pooled WHERE generic = 1 ORDER BY id LIMIT 1"
+                        ") RETURNING filename"
+                    ).fetchone()
+                    if row:
+                        evicted.append(row[0])
+                if self._total(conn) < self.max_total:
+                    conn.execute(
+                        "INSERT INTO pooled (template_id, template_updated_at, prompt, generic, filename, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (template.id, template.updated_at.isoformat(), prompt, generic, filename, time.time()),
+                    )
+                    added = True
+        finally:
+            if not added:
+                path.unlink(missing_ok=True)
+        self._discard(evicted)
+        if not added:
+            print(f"Warm pool: full ({self.max_total}), dropped a background for {template.id}")
+        return added
+
+    # Scheduling
+
+    def schedule(self, template: Template, episodes: list[dict]) -> int:
+        """
+        Queue pre-generation of backgrounds for upcoming episodes.
+
+        Returns:
+            The number of backgrounds queued
+        """
+        prompts = dict.fromkeys(p for p in (build_prompt(template, data) for data in episodes) if p)
+        queued = 0
+        with self._write() as conn:
+            for prompt in prompts:
+                if conn.execute(
+                    "SELECT 1 FROM pooled WHERE template_id = ? AND prompt = ?", (template.id, prompt)
+                ).fetchone():
+                    continue
+                queued += conn.execute(
+                    "INSERT OR IGNORE INTO upcoming (template_id, prompt) VALUES (?, ?)", (template.id, prompt)
+                ).rowcount
+            # Bounded like the pools - the oldest requests give way
+            conn.execute(
+                "DELETE FROM upcoming WHERE generic = 0 AND id NOT IN "
+                "(SELECT id FROM upcoming WHERE generic = 0 ORDER BY id DESC LIMIT ?)",
+                (self.max_total,),
+            )
+        self._kick()
+        return queued
+
+    def _budget_left(self) -> int:
+        return self._budget.remaining()
+
+    def _next_request(self) -> Optional[WarmRequest]:
+        """Claim the next background to generate, so no other process generates it too."""
+        now = time.time()
+        # Read outside the transaction, it may hit the template store
+        templates = [t for t in storage.list_templates() if t.background.mode == "ai"] if self.use_generic else []
+        with self._write() as conn:
+            row = conn.execute(
+                "UPDATE upcoming SET claimed_at = ? WHERE id = ("
+                "SELECT id FROM upcoming WHERE generic = 0 AND (claimed_at IS NULL OR claimed_at < ?) "
+                "ORDER BY id LIMIT 1) RETURNING id, template_id, prompt",
+                (now, now - CLAIM_SECONDS),
+            ).fetchone()
+            if row:
+                return WarmRequest(template_id=row["template_id"], prompt=row["prompt"], request_id=row["id"])
+            if not templates or self._total(conn) >= self.max_total:
+                return None
+            conn.execute("DELETE FROM upcoming WHERE generic = 1 AND claimed_at < ?", (now - CLAIM_SECONDS,))
+            # Top up generic pools for AI-mode templates, counting those being generated elsewhere
+            for template in templates:
+                pooled, generic = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(generic), 0) FROM pooled WHERE template_id = ?", (template.id,)
+                ).fetchone()
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM upcoming WHERE template_id = ? AND generic = 1", (template.id,)
+                ).fetchone()[0]
+                if generic + pending < self.per_template and pooled + pending < self.per_template:
+                    prompt = template.background.ai_config.fallback_prompt
+                    request_id = conn.execute(
+                        "INSERT INTO upcoming (template_id, prompt, generic, claimed_at) VALUES (?, ?, 1, ?)",
+                        (template.id, prompt, now),
+                    ).lastrowid
+                    return WarmRequest(template_id=template.id, prompt=prompt, generic=True, request_id=request_id)
+        return None
+
+    def _finish(self, request: WarmRequest):
+        with self._write() as conn:
+            conn.execute("DELETE FROM upcoming WHERE id = ?", (request.request_id,))
+
+    # Worker
+
+    def _kick(self):
+        # take() and schedule() run in threads, the worker on the event loop
+        if self._wakeup and self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _fill(self, request: WarmRequest) -> bool:
+        """Pre-generate one background; True if it was pooled."""
+        template = storage.get_template(request.template_id)
+        if not template or template.background.mode != "ai":
+            return False
+        image, called = await imagen.try_generate_image(
+            prompt=request.prompt,
+            negative_prompt=template.background.ai_config.negative_prompt,
+        )
+        if called:
+            # The budget may be SQLite-backed - keep it off the event loop
+            await asyncio.to_thread(self._budget.spend)
+        if image is None:
+            return False
+        return await asyncio.to_thread(self._add, template, request.prompt, request.generic, image)
+
+    async def _worker(self):
+        while True:
+            request = None
+            if await asyncio.to_thread(self._budget_left) > 0 and not rate_limiter.is_open(imagen.model_name):
+                request = await asyncio.to_thread(self._next_request)
+
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.refill_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                filled = await self._fill(request)
+            except Exception as e:
+                print(f"Warm pool: failed to pre-generate background: {e}")
+                filled = False
+            finally:
+                await asyncio.to_thread(self._finish, request)
+            if not filled:
+                # Nothing came of it - don't retry straight away
+                await asyncio.sleep(self.refill_seconds)
+
+    async def start(self):
+        """Start the background worker if the pool is enabled."""
+        if not self.enabled or not imagen.can_generate() or self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        pooled: dict[str, int] = {}
+        upcoming = 0
+        if self.enabled:
+            with self._lock:
+                conn = self._connection()
+                pooled = dict(conn.execute("SELECT template_id, COUNT(*) FROM pooled GROUP BY template_id").fetchall())
+                upcoming = conn.execute("SELECT COUNT(*) FROM upcoming WHERE generic = 0").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "generic": self.use_generic,
+            "pooled": pooled,
+            "upcoming": upcoming,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evicted": self._evicted,
+            "budget": {
+                "daily": self.daily_budget,
+                "spent_today": self._budget.spent(),
+                "remaining": max(self._budget_left(), 0),
+            },
+        }
+
+
+# Singleton instance
+warm_pool = WarmPool()
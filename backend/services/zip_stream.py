@@ -0,0 +1,82 @@
+"""
+Streaming ZIP Writer
+
+Builds a ZIP archive as a sequence of byte chunks, so a response can send
+the archive while it is being written - nothing larger than one read
+chunk is held in memory, however many files go in. zipfile writes to an
+unseekable sink using data descriptors, which every unzip tool accepts.
+
+Files that are already compressed (PNG, JPEG, WebP) are stored as-is;
+deflating them again costs CPU and saves nothing.
+"""
+
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+CHUNK_SIZE = 1024 * 1024
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip"}
+
+
+class _Sink:
+    """Write-only file object that buffers until drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _info(name: str, mtime: Optional[float] = None) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, time.localtime(mtime or time.time())[:6])
+    stored = Path(name).suffix.lower() in STORED_EXTENSIONS
+    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def stream_zip(
+    files: Iterable[tuple[str, Path]],
+    extra: Iterable[tuple[str, bytes]] = (),
+) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (archive name, local path) files, followed by
+    (archive name, content) entries from `extra` (e.g. a manifest).
+
+    Both iterables are consumed lazily, so `extra` may describe the files
+    that were actually written.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for name, path in files:
+            with open(path, "rb") as source:
+                stat = path.stat()
+                info = _info(name, stat.st_mtime)
+                # Known up front, so zipfile can decide on ZIP64 per entry
+                info.file_size = stat.st_size
+                with archive.open(info, "w") as dest:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        dest.write(chunk)
+                        yield from _pending(sink)
+            yield from _pending(sink)
+        for name, content in extra:
+            archive.writestr(_info(name), content)
+            yield from _pending(sink)
+    yield from _pending(sink)
+
+
+def _pending(sink: _Sink) -> Iterator[bytes]:
+    data = sink.drain()
+    if data:
+        yield data
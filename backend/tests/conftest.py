@@ -0,0 +1,60 @@
+"""
+Shared fixtures. Run from backend/:
+
+    python -m pytest -q
+
+Services read their configuration when first imported, so it is set
+here, before any of them are: data goes to a throwaway directory, events
+stay in-process and failed attempts are retried without backoff.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+DATA_DIR = tempfile.mkdtemp(prefix="thumbnail-gen-tests-")
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["CHANGE_FEED_DB"] = ""
+os.environ["RATE_LIMIT_DB"] = ""
+os.environ["QUEUE_MAX_ATTEMPTS"] = "3"
+os.environ["QUEUE_RETRY_BACKOFF_SECONDS"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from services import queue_archive as queue_archive_module
+from services import scheduler as scheduler_module
+from services.queue_manager import QueueManager
+
+
+@pytest.fixture
+def queue(tmp_path):
+    """A QueueManager on its own empty queue.db."""
+    manager = QueueManager(tmp_path / "queue.db", legacy_dir=tmp_path / "queue")
+    manager.set_auto_approve(False)
+    return manager
+
+
+@pytest.fixture
+def archive(tmp_path, queue, monkeypatch):
+    """A QueueArchive under tmp_path, archiving out of the `queue` fixture."""
+    monkeypatch.setattr(queue_archive_module, "queue_manager", queue)
+    return queue_archive_module.QueueArchive(tmp_path / "queue_archive")
+
+
+@pytest.fixture
+def scheduler(queue, monkeypatch):
+    """A JobScheduler with no worker tasks, scheduling out of the `queue` fixture."""
+    monkeypatch.setattr(scheduler_module, "queue_manager", queue)
+    return scheduler_module.JobScheduler(workers=0)
+
+
+def set_created(queue: QueueManager, job_id: str, created_at: str):
+    """Backdate a job (the queue stamps new jobs with the current time)."""
+    with queue._lock, queue._conn:
+        queue._conn.execute("UPDATE jobs SET created_at = ? WHERE id = ?", (created_at, job_id))
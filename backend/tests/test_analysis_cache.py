@@ -0,0 +1,82 @@
+"""Perceptual-hash analysis cache: fingerprint() and AnalysisCache."""
+
+import io
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from services.analysis_cache import AnalysisCache, context_key, fingerprint
+
+CONTEXT = context_key({"title": "Episode 1"}, "v1")
+
+
+def _thumbnail(text_colour=(255, 255, 255), size=(1280, 720), format="PNG", **save) -> bytes:
+    image = Image.new("RGB", (1280, 720))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 1280, 8):
+        draw.line([(x, 0), (x, 720)], fill=(x // 5, 80, 255 - x // 5), width=8)
+    draw.ellipse([700, 100, 1200, 600], fill=(240, 200, 40))
+    draw.rectangle([80, 420, 620, 620], fill=text_colour)
+    image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **save)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(tmp_path / "analysis_cache.db", ttl_seconds=3600, max_entries=10)
+
+
+def test_reencoded_and_rescaled_copies_hit(cache):
+    cache.put(*fingerprint(_thumbnail()), CONTEXT, {"score": 7})
+
+    for copy in (_thumbnail(format="JPEG", quality=85), _thumbnail(size=(640, 360))):
+        hit = cache.get(*fingerprint(copy), CONTEXT)
+        assert hit["score"] == 7
+        assert hit["cached_at"] <= time.time()
+    assert cache.metrics()["hits"] == 2
+
+
+def test_changed_colours_miss(cache):
+    cache.put(*fingerprint(_thumbnail()), CONTEXT, {"score": 7})
+
+    assert cache.get(*fingerprint(_thumbnail(text_colour=(255, 40, 40))), CONTEXT) is None
+    assert cache.metrics()["misses"] == 1
+
+
+def test_other_context_or_prompt_misses(cache):
+    image_hash, signature = fingerprint(_thumbnail())
+    cache.put(image_hash, signature, CONTEXT, {"score": 7})
+
+    assert cache.get(image_hash, signature, context_key({"title": "Episode 2"}, "v1")) is None
+    assert cache.get(image_hash, signature, context_key({"title": "Episode 1"}, "v2")) is None
+
+
+def test_expired_entries_miss(cache):
+    image_hash, signature = fingerprint(_thumbnail())
+    cache.put(image_hash, signature, CONTEXT, {"score": 7})
+    with cache._conn:
+        cache._conn.execute("UPDATE analyses SET created_at = created_at - 7200")
+
+    assert cache.get(image_hash, signature, CONTEXT) is None
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = AnalysisCache(tmp_path / "analysis_cache.db", ttl_seconds=3600, max_entries=2)
+    _, signature = fingerprint(_thumbnail())
+    # Far apart, so no lookup matches another entry
+    hashes = ["0" * 64, "f" * 64, "0f" * 32]
+    for n, image_hash in enumerate(hashes):
+        cache.put(image_hash, signature, CONTEXT, {"n": n})
+        time.sleep(0.01)
+
+    assert cache.metrics()["entries"] == 2
+    assert cache.get(hashes[0], signature, CONTEXT) is None
+    assert [cache.get(h, signature, CONTEXT)["n"] for h in hashes[1:]] == [1, 2]
+    assert cache.clear() == 2
+
+
+def test_zero_ttl_disables_the_cache(tmp_path):
+    assert not AnalysisCache(tmp_path / "analysis_cache.db", ttl_seconds=0).enabled
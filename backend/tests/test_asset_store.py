@@ -0,0 +1,99 @@
+"""AssetStore: deduplicated blobs, aliases onto them, and collecting unused blobs."""
+
+import threading
+import time
+
+import pytest
+
+from services.asset_store import AssetStore
+from services.storage_backends import LocalBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalBackend(tmp_path / "storage")
+
+
+@pytest.fixture
+def store(backend, tmp_path):
+    return AssetStore(backend, tmp_path / "assets.db")
+
+
+def _stored(store: AssetStore, record: dict) -> bool:
+    return store.blob_path(record["hash"], record["ext"]) is not None
+
+
+def test_identical_content_is_stored_once(store):
+    first = store.put("backgrounds", "a.png", b"same")
+    second = store.put("overlays", "b.png", b"same")
+
+    assert first["hash"] == second["hash"]
+    assert store.stats() == {"aliases": 2, "blobs": 1, "logical_bytes": 8, "stored_bytes": 4}
+    assert store.alias_counts() == {first["hash"]: 2}
+
+
+def test_overwriting_a_name_collects_the_old_blob(store):
+    old = store.put("backgrounds", "a.png", b"old")
+    new = store.put("backgrounds", "a.png", b"new")
+
+    assert store.resolve("backgrounds", "a.png")["hash"] == new["hash"]
+    assert not _stored(store, old)
+    assert _stored(store, new)
+
+
+def test_blob_is_kept_while_another_alias_uses_it(store):
+    record = store.put("backgrounds", "a.png", b"shared")
+    store.put("backgrounds", "b.png", b"shared")
+
+    assert store.delete("backgrounds", "a.png")
+    assert _stored(store, record)
+    assert store.delete("backgrounds", "b.png")
+    assert not _stored(store, record)
+    assert not store.delete("backgrounds", "b.png")
+
+
+def test_pinned_blob_survives_collection(store):
+    record = store.put("backgrounds", "a.png", b"content")
+    # A link() of the same content in another process, between pin and alias
+    with store._conn:
+        store._conn.execute(
+            "INSERT INTO pins (hash, ext, created_at) VALUES (?, ?, ?)",
+            (record["hash"], record["ext"], time.time()),
+        )
+
+    store.delete("backgrounds", "a.png")
+
+    assert _stored(store, record)
+
+
+def test_blobs_are_kept_when_the_backend_is_indexed_elsewhere(backend, tmp_path):
+    store = AssetStore(backend, tmp_path / "assets.db", can_collect=lambda: False)
+    record = store.put("backgrounds", "a.png", b"content")
+
+    store.delete("backgrounds", "a.png")
+
+    assert _stored(store, record)
+
+
+def test_concurrent_link_and_delete_never_lose_a_live_blob(backend, tmp_path):
+    # Two processes' worth of connections onto one index
+    churner = AssetStore(backend, tmp_path / "assets.db")
+    linker = AssetStore(backend, tmp_path / "assets.db")
+
+    def churn():
+        for _ in range(100):
+            churner.put("backgrounds", "churn.png", b"content")
+            churner.delete("backgrounds", "churn.png")
+
+    def link():
+        for _ in range(100):
+            linker.put("overlays", "keep.png", b"content")
+
+    threads = [threading.Thread(target=churn), threading.Thread(target=link)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    record = linker.resolve("overlays", "keep.png")
+    assert _stored(linker, record)
@@ -0,0 +1,86 @@
+"""Deduplicating generate requests: IdempotencyIndex and the reuse checks in routes/generate."""
+
+import asyncio
+import threading
+
+from models import GenerateRequest, TemplateCreate
+from routes import generate as generate_module
+from services.idempotency import IdempotencyIndex, request_fingerprint
+from services.storage import storage
+
+
+def test_only_one_concurrent_request_reserves_a_key(tmp_path):
+    index = IdempotencyIndex(tmp_path / "idempotency.db")
+    barrier = threading.Barrier(8)
+    winners = []
+
+    def request(n: int):
+        # Separate connections, as separate API processes would have
+        mine = IdempotencyIndex(tmp_path / "idempotency.db")
+        barrier.wait()
+        if mine.reserve("key:abc", "fp") is None:
+            winners.append(n)
+
+    threads = [threading.Thread(target=request, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(winners) == 1
+    assert index.reserve("key:abc", "fp").job_id == ""
+
+
+def test_assign_then_discard(tmp_path):
+    index = IdempotencyIndex(tmp_path / "idempotency.db")
+    assert index.reserve("key:abc", "fp") is None
+
+    index.assign("key:abc", "job-1")
+    assert index.reserve("key:abc", "fp").job_id == "job-1"
+
+    # A discard for another job leaves the key alone
+    index.discard("key:abc", "job-2")
+    assert index.reserve("key:abc", "fp").job_id == "job-1"
+    index.discard("key:abc", "job-1")
+    assert index.reserve("key:abc", "fp") is None
+
+
+def test_expired_keys_can_be_reserved_again(tmp_path):
+    index = IdempotencyIndex(tmp_path / "idempotency.db", ttl_seconds=1)
+    index.reserve("key:abc", "fp")
+    index.assign("key:abc", "job-1")
+    with index._conn:
+        index._conn.execute("UPDATE idempotency SET created_at = created_at - 10")
+
+    assert index.reserve("key:abc", "fp") is None
+
+
+def test_replacing_an_asset_changes_the_fingerprint():
+    template = storage.create_template(TemplateCreate(name="t", pipeline="x"))
+    template.background.fixed_images = ["dedup-bg.png"]
+    request = GenerateRequest(template_id=template.id, episode_id="ep", data={"title": "x"})
+
+    storage.save_asset("backgrounds", "dedup-bg.png", b"first")
+    first = request_fingerprint(template, request)
+    assert request_fingerprint(template, request) == first
+
+    storage.save_asset("backgrounds", "dedup-bg.png", b"second")
+    assert request_fingerprint(template, request) != first
+
+
+def test_overwritten_outputs_are_not_reused(queue, monkeypatch):
+    monkeypatch.setattr(generate_module, "queue_manager", queue)
+    job_id = queue.create_job("t", "ep-dedup", {}, source="api").id
+    queue.claim("worker", lease_seconds=60)
+    saved = storage.save_output("ep-dedup-t.png", b"render 1", "ep-dedup", "t", job_id)
+    queue.complete_job(job_id, [{"filename": saved["filename"], "hash": saved["hash"]}], "worker")
+
+    reused = asyncio.run(generate_module._reusable_job(job_id))
+    assert reused.deduplicated and reused.job_id == job_id
+
+    # A later job rendered the same episode and template over it
+    storage.save_output("ep-dedup-t.png", b"render 2", "ep-dedup", "t", "another-job")
+    assert asyncio.run(generate_module._reusable_job(job_id)) is None
+
+    storage.delete_output("ep-dedup-t.png")
+    assert asyncio.run(generate_module._reusable_job(job_id)) is None
@@ -0,0 +1,120 @@
+"""Archiving finished jobs out of the hot queue: QueueArchive and the archived index."""
+
+from conftest import set_created
+from services.queue_archive import QueueArchive, _record
+from services.queue_manager import QueueManager
+
+
+def _finished(queue: QueueManager, episode_id: str, created_at: str) -> str:
+    job_id = queue.create_job("t", episode_id, {}).id
+    queue.cancel_job(job_id)
+    set_created(queue, job_id, created_at)
+    return job_id
+
+
+def test_archive_moves_only_finished_jobs(queue, archive):
+    june = _finished(queue, "ep-june", "2024-06-10T00:00:00Z")
+    july = _finished(queue, "ep-july", "2024-07-10T00:00:00Z")
+    active = queue.create_job("t", "ep-active", {}).id
+
+    assert archive.archive(older_than_days=0) == 2
+
+    assert queue.get_job(june) is None and queue.get_job(july) is None
+    assert queue.get_status(active) == "queued"
+    assert archive.months() == ["2024-07", "2024-06"]
+    assert queue.archived_month(june) == "2024-06"
+    assert archive.find(june).episode_id == "ep-june"
+    assert archive.find(active) is None
+    assert archive.find("missing") is None
+
+
+def test_recent_jobs_stay_in_the_queue(queue, archive):
+    job_id = _finished(queue, "ep", "2024-06-10T00:00:00Z")
+
+    assert archive.archive(older_than_days=1) == 0
+    assert queue.get_status(job_id) == "cancelled"
+
+
+def test_job_retried_before_it_is_deleted_stays_in_the_queue(queue, archive):
+    job_id = _finished(queue, "ep", "2024-06-10T00:00:00Z")
+    # Written to a segment, then retried before archive_jobs deletes it
+    archive._write_segment("2024-06", [_record(queue.get_job(job_id))])
+    queue.retry_jobs([job_id])
+
+    assert queue.archive_jobs({job_id: "2024-06"}) == []
+
+    assert queue.get_status(job_id) == "queued"
+    assert queue.archived_month(job_id) is None
+    # Its segment line has no index row, so it isn't listed
+    assert archive.find(job_id) is None
+    assert archive.query() == ([], None)
+
+
+def test_query_pages_newest_first_across_months(queue, archive):
+    ids = []
+    for month in ("05", "06", "07"):
+        for day in (1, 2):
+            ids.append(_finished(queue, f"ep-{month}-{day}", f"2024-{month}-0{day}T00:00:00Z"))
+    archive.archive(older_than_days=0)
+
+    pages, cursor = [], None
+    while True:
+        jobs, cursor = archive.query(limit=4, cursor=cursor)
+        pages.append([job.id for job in jobs])
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [4, 2]
+    assert [job_id for page in pages for job_id in page] == ids[::-1]
+    jobs, _ = archive.query(episode_id="ep-06-1")
+    assert [job.id for job in jobs] == [ids[2]]
+    jobs, _ = archive.query(created_after="2024-06-01", created_before="2024-07-01")
+    assert [job.id for job in jobs] == [ids[3], ids[2]]
+
+
+def test_duplicates_are_dropped_on_read_and_by_compaction(queue, archive):
+    first = _finished(queue, "ep-1", "2024-06-01T00:00:00Z")
+    archive.archive(older_than_days=0)
+    second = _finished(queue, "ep-2", "2024-06-02T00:00:00Z")
+    # A crash after writing the segment: the job is written again next run
+    archive._write_segment("2024-06", [_record(queue.get_job(second))])
+    archive.archive(older_than_days=0)
+
+    assert len(archive._segments("2024-06")) == 3
+    jobs, _ = archive.query()
+    assert [job.id for job in jobs] == [second, first]
+
+    result = archive.compact()
+
+    assert result["segments_merged"] == 3
+    assert len(archive._segments("2024-06")) == 1
+    jobs, _ = archive.query()
+    assert [job.id for job in jobs] == [second, first]
+    assert archive.find(first).episode_id == "ep-1"
+    assert archive.compact()["segments_merged"] == 0
+
+
+def test_drop_month_forgets_its_jobs(queue, archive):
+    june = _finished(queue, "ep-june", "2024-06-10T00:00:00Z")
+    july = _finished(queue, "ep-july", "2024-07-10T00:00:00Z")
+    archive.archive(older_than_days=0)
+
+    assert archive.months_before("2024-07-15T00:00:00Z") == ["2024-06"]
+    archive.drop_month("2024-06")
+
+    assert archive.months() == ["2024-07"]
+    assert archive.find(june) is None
+    assert queue.archived_ids("2024-06") == set()
+    assert archive.find(july) is not None
+
+
+def test_archives_without_an_index_are_reindexed(queue, archive, tmp_path):
+    job_id = _finished(queue, "ep", "2024-06-10T00:00:00Z")
+    archive.archive(older_than_days=0)
+    queue.forget_archived("2024-06")
+    assert archive.find(job_id) is None
+
+    reopened = QueueArchive(tmp_path / "queue_archive")
+
+    assert queue.archived_count() == 1
+    assert reopened.find(job_id).episode_id == "ep"
@@ -0,0 +1,186 @@
+"""Leases, crash recovery and job transitions in QueueManager."""
+
+import threading
+
+from services.queue_manager import QueueManager
+
+
+def _finish_attempt_by_crashing(queue: QueueManager, owner: str) -> str:
+    """Claim the next job with a lease that has already run out, then recover it."""
+    job = queue.claim(owner, lease_seconds=-1)
+    assert job is not None
+    assert queue.requeue_expired() == 1
+    return job.id
+
+
+def test_claimers_never_get_the_same_job(queue, tmp_path):
+    created = {queue.create_job("t", f"ep-{i}", {}).id for i in range(40)}
+    claimed: list[str] = []
+    claimed_lock = threading.Lock()
+
+    def worker(n: int):
+        # Each worker has its own connection, as separate processes would
+        manager = QueueManager(tmp_path / "queue.db", legacy_dir=tmp_path / "queue")
+        while True:
+            job = manager.claim(f"worker-{n}", lease_seconds=60)
+            if job is None:
+                return
+            with claimed_lock:
+                claimed.append(job.id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == len(set(claimed))
+    assert set(claimed) == created
+    assert queue.status_counts() == {"processing": 40}
+
+
+def test_claim_records_owner_and_attempt(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+
+    job = queue.claim("worker-1", lease_seconds=60)
+
+    assert job.id == job_id
+    assert job.status == "processing"
+    assert job.lease_owner == "worker-1"
+    assert job.attempts == 1
+    assert queue.claim("worker-2", lease_seconds=60) is None
+
+
+def test_expired_lease_is_requeued_then_dead_lettered(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+
+    for attempt in (1, 2):
+        assert _finish_attempt_by_crashing(queue, f"worker-{attempt}") == job_id
+        job = queue.get_job(job_id)
+        assert job.status == "queued"
+        assert job.attempts == attempt
+        assert job.lease_owner is None
+        assert "Lease expired" in job.error
+
+    _finish_attempt_by_crashing(queue, "worker-3")
+    job = queue.get_job(job_id)
+    assert job.status == "dead"
+    assert job.attempts == job.max_attempts == 3
+    assert job.completed_at is not None
+    assert queue.claim("worker-4", lease_seconds=60) is None
+
+
+def test_live_lease_is_not_requeued(queue):
+    queue.create_job("t", "ep", {})
+    job = queue.claim("worker-1", lease_seconds=60)
+
+    assert queue.requeue_expired() == 0
+    assert queue.heartbeat(job.id, "worker-1", lease_seconds=60)
+    assert queue.get_status(job.id) == "processing"
+
+
+def test_complete_is_refused_after_the_lease_is_lost(queue):
+    job_id = queue.create_job("t", "ep", {}, source="api").id
+    _finish_attempt_by_crashing(queue, "worker-1")
+    assert queue.claim("worker-2", lease_seconds=60).id == job_id
+
+    outputs = [{"filename": "ep-t.png"}]
+    assert not queue.heartbeat(job_id, "worker-1", lease_seconds=60)
+    assert not queue.complete_job(job_id, outputs, "worker-1")
+    assert queue.fail_job(job_id, "late failure", "worker-1") is None
+    assert queue.get_job(job_id).lease_owner == "worker-2"
+
+    assert queue.complete_job(job_id, outputs, "worker-2")
+    job = queue.get_job(job_id)
+    assert job.status == "pending"
+    assert job.output_names() == ["ep-t.png"]
+
+
+def test_complete_is_refused_after_cancel(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+    queue.claim("worker-1", lease_seconds=60)
+
+    assert queue.cancel_job(job_id).status == "cancelled"
+    assert not queue.heartbeat(job_id, "worker-1", lease_seconds=60)
+    assert not queue.complete_job(job_id, [], "worker-1")
+    assert queue.get_status(job_id) == "cancelled"
+
+
+def test_cancel_queued_and_processing_but_not_finished(queue):
+    running = queue.create_job("t", "ep-1", {}).id
+    queue.claim("worker-1", lease_seconds=60)
+    waiting = queue.create_job("t", "ep-2", {}).id
+
+    assert queue.cancel_job(waiting).error == "Cancelled"
+    job = queue.cancel_job(running)
+    assert job.status == "cancelled"
+    assert job.lease_owner is None
+    assert queue.cancel_job(running) is None
+    assert queue.cancel_job("missing") is None
+
+
+def test_release_returns_the_job_without_using_an_attempt(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+    queue.claim("worker-1", lease_seconds=60)
+
+    assert not queue.release(job_id, "worker-2")
+    assert queue.release(job_id, "worker-1")
+    job = queue.get_job(job_id)
+    assert job.status == "queued"
+    assert job.attempts == 0
+    assert job.lease_owner is None
+    assert not queue.release(job_id, "worker-1")
+
+    assert queue.claim("worker-2", lease_seconds=60).attempts == 1
+
+
+def test_retryable_failure_requeues_until_dead(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+
+    for _ in range(2):
+        queue.claim("worker", lease_seconds=60)
+        assert queue.fail_job(job_id, "Imagen timed out", "worker", retryable=True).status == "queued"
+    queue.claim("worker", lease_seconds=60)
+    job = queue.fail_job(job_id, "Imagen timed out", "worker", retryable=True)
+    assert job.status == "dead"
+    assert job.error == "Imagen timed out"
+
+
+def test_permanent_failure_skips_the_retries(queue):
+    job_id = queue.create_job("t", "ep", {}).id
+    queue.claim("worker", lease_seconds=60)
+
+    job = queue.fail_job(job_id, "Template not found", "worker")
+    assert job.status == "failed"
+    assert job.attempts == 1
+
+
+def test_retry_requeues_finished_failures_with_fresh_attempts(queue):
+    failed = queue.create_job("t", "ep-1", {}).id
+    queue.claim("worker", lease_seconds=60)
+    queue.fail_job(failed, "boom", "worker")
+    cancelled = queue.create_job("t", "ep-2", {}).id
+    queue.cancel_job(cancelled)
+    pending = queue.create_job("t", "ep-3", {}, source="api").id
+    queue.claim("worker", lease_seconds=60)
+    queue.complete_job(pending, [], "worker")
+
+    assert queue.retryable_counts([failed, cancelled, pending]) == {"anonymous": 2}
+    retried = queue.retry_jobs([failed, cancelled, pending, "missing"])
+
+    assert sorted(job.id for job in retried) == sorted([failed, cancelled])
+    for job_id in (failed, cancelled):
+        job = queue.get_job(job_id)
+        assert (job.status, job.attempts, job.error, job.completed_at) == ("queued", 0, None, None)
+    assert queue.get_status(pending) == "pending"
+
+
+def test_processing_jobs_are_not_deleted(queue):
+    running = queue.create_job("t", "ep-1", {}).id
+    queue.claim("worker", lease_seconds=60)
+    queued = queue.create_job("t", "ep-2", {}).id
+
+    assert not queue.delete_job(running)
+    assert queue.delete_jobs([running, queued]) == [queued]
+    assert queue.get_status(running) == "processing"
+    assert queue.get_job(queued) is None
@@ -0,0 +1,126 @@
+"""Keyset pagination of the queue (QueueManager.query)."""
+
+import json
+
+import pytest
+
+from conftest import set_created
+from services.output_catalog import encode_cursor
+from services.queue_manager import QueueManager
+
+
+def _all_pages(queue: QueueManager, limit: int, **filters) -> list[list[str]]:
+    pages, cursor = [], None
+    while True:
+        jobs, cursor = queue.query(limit=limit, cursor=cursor, **filters)
+        pages.append([job.id for job in jobs])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_job_once_newest_first(queue):
+    ids = []
+    for i in range(23):
+        job_id = queue.create_job("t", f"ep-{i}", {}).id
+        set_created(queue, job_id, f"2024-06-01T00:00:{i:02d}Z")
+        ids.append(job_id)
+
+    pages = _all_pages(queue, limit=5)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [job_id for page in pages for job_id in page] == ids[::-1]
+
+
+def test_jobs_created_at_the_same_instant_are_split_by_id(queue):
+    ids = [queue.create_job("t", f"ep-{i}", {}).id for i in range(10)]
+    for job_id in ids:
+        set_created(queue, job_id, "2024-06-01T00:00:00Z")
+
+    pages = _all_pages(queue, limit=3)
+
+    assert [job_id for page in pages for job_id in page] == sorted(ids, reverse=True)
+
+
+def test_new_jobs_do_not_shift_later_pages(queue):
+    ids = []
+    for i in range(6):
+        job_id = queue.create_job("t", f"ep-{i}", {}).id
+        set_created(queue, job_id, f"2024-06-01T00:00:{i:02d}Z")
+        ids.append(job_id)
+
+    first, cursor = queue.query(limit=3)
+    queue.create_job("t", "late", {})
+    second, cursor = queue.query(limit=3, cursor=cursor)
+
+    assert [job.id for job in first] == ids[:2:-1]
+    assert [job.id for job in second] == ids[2::-1]
+    assert cursor is None
+
+
+def test_filters_apply_across_pages(queue):
+    wanted = []
+    for i in range(12):
+        template_id = "keeper" if i % 3 == 0 else "other"
+        job_id = queue.create_job(template_id, f"ep-{i}", {}, source="api").id
+        set_created(queue, job_id, f"2024-06-01T00:00:{i:02d}Z")
+        if template_id == "keeper":
+            wanted.append(job_id)
+    cancelled = queue.create_job("keeper", "ep-c", {}, source="api").id
+    queue.cancel_job(cancelled)
+
+    pages = _all_pages(queue, limit=2, status=["queued"], template_id="keeper", source="api")
+
+    assert [job_id for page in pages for job_id in page] == wanted[::-1]
+    jobs, _ = queue.query(status=["cancelled"])
+    assert [job.id for job in jobs] == [cancelled]
+
+
+def test_date_range(queue):
+    for day in (1, 2, 3, 4):
+        job_id = queue.create_job("t", f"ep-{day}", {}).id
+        set_created(queue, job_id, f"2024-06-0{day}T12:00:00Z")
+
+    jobs, _ = queue.query(created_after="2024-06-02", created_before="2024-06-04")
+
+    assert [job.episode_id for job in jobs] == ["ep-3", "ep-2"]
+
+
+def test_last_page_has_no_cursor(queue):
+    for i in range(4):
+        queue.create_job("t", f"ep-{i}", {})
+
+    jobs, cursor = queue.query(limit=4)
+
+    assert len(jobs) == 4
+    assert cursor is None
+
+
+def test_malformed_cursor_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.query(cursor="not a cursor")
+    # A well-formed cursor past every job is just an empty page
+    assert queue.query(cursor=encode_cursor("0000", "")) == ([], None)
+
+
+def test_legacy_json_jobs_are_imported_once(tmp_path):
+    legacy = tmp_path / "queue"
+    legacy.mkdir()
+    for i in range(3):
+        record = {
+            "id": f"legacy-{i}",
+            "template_id": "t",
+            "episode_id": f"ep-{i}",
+            "data": {},
+            "status": "pending",
+            "source": "api",
+            "created_at": f"2024-01-0{i + 1}T00:00:00Z",
+        }
+        (legacy / f"legacy-{i}.json").write_text(json.dumps(record))
+    (legacy / "broken.json").write_text("{")
+
+    queue = QueueManager(tmp_path / "queue.db", legacy_dir=legacy)
+    assert [job.id for job in queue.get_pending_jobs()] == ["legacy-2", "legacy-1", "legacy-0"]
+
+    # Only a new database imports
+    reopened = QueueManager(tmp_path / "queue.db", legacy_dir=legacy)
+    assert reopened.status_counts() == {"pending": 3}
@@ -0,0 +1,127 @@
+"""Token buckets, circuit breakers and RateLimiter.limit()."""
+
+import asyncio
+import time
+
+import pytest
+
+from services.rate_limiter import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimiter,
+    RateLimitExceeded,
+    SQLiteDailyBudget,
+    SQLiteTokenBucket,
+    TokenBucket,
+)
+
+
+def test_bucket_goes_into_debt_and_reports_the_wait():
+    bucket = TokenBucket("m:rpm", per_minute=60)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    bucket.refund(1)
+    assert bucket.available() == pytest.approx(0.0, abs=0.05)
+
+
+def test_sqlite_buckets_share_their_budget(tmp_path):
+    db_path = str(tmp_path / "ratelimit.db")
+    first = SQLiteTokenBucket("m:rpm", per_minute=10, db_path=db_path)
+    second = SQLiteTokenBucket("m:rpm", per_minute=10, db_path=db_path)
+
+    assert first.reserve(10) == 0.0
+    assert second.reserve(1) > 0
+    assert first.available() < 0
+
+
+def test_sqlite_daily_budget_is_shared(tmp_path):
+    db_path = str(tmp_path / "ratelimit.db")
+    SQLiteDailyBudget("warm_pool", 5, db_path).spend(2)
+
+    assert SQLiteDailyBudget("warm_pool", 5, db_path).remaining() == 3
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setenv("GEMINI_MAX_WAIT_SECONDS", "0.5")
+    monkeypatch.setenv("GEMINI_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("GEMINI_BREAKER_RESET_SECONDS", "60")
+    limiter = RateLimiter()
+    limiter.budgets = {"m": {"rpm": 2, "tpm": 1000}}
+    return limiter
+
+
+def test_limit_waits_for_budget_then_gives_up(limiter):
+    async def calls():
+        for _ in range(2):
+            async with limiter.limit("m", tokens=100):
+                pass
+        with pytest.raises(RateLimitExceeded):
+            async with limiter.limit("m", tokens=100):
+                pass
+
+    asyncio.run(calls())
+
+    metrics = limiter.metrics()["models"]["m"]
+    assert (metrics["calls"], metrics["rejected"]) == (2, 1)
+    # The rejected call's reservation was refunded
+    assert metrics["tpm_available"] == pytest.approx(800, abs=5)
+
+
+def test_limit_fails_fast_once_the_breaker_opens(limiter):
+    async def failing_call():
+        async with limiter.limit("m"):
+            raise RuntimeError("upstream 500")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            asyncio.run(failing_call())
+
+    assert limiter.is_open("m")
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(failing_call())
+    metrics = limiter.metrics()["models"]["m"]
+    assert (metrics["failures"], metrics["rejected"], metrics["breaker"]) == (2, 1, "open")
+
+
+def test_settle_tokens_corrects_the_estimate(limiter):
+    async def call():
+        async with limiter.limit("m", tokens=500):
+            pass
+        await limiter.settle_tokens("m", estimated=500, actual=200)
+
+    asyncio.run(call())
+
+    assert limiter.metrics()["models"]["m"]["tpm_available"] == pytest.approx(800, abs=5)
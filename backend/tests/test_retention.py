@@ -0,0 +1,106 @@
+"""Retention sweeps: which outputs, jobs and temp files go, and which are protected."""
+
+import asyncio
+
+import pytest
+
+from services import retention as retention_module
+from services.retention import RetentionService
+from services.storage import storage
+
+
+@pytest.fixture
+def retention(queue, archive, monkeypatch):
+    monkeypatch.setattr(retention_module, "queue_manager", queue)
+    monkeypatch.setattr(retention_module, "queue_archive", archive)
+    service = RetentionService()
+    service.min_age_seconds = 0
+    service.queue_days = 0
+    # Any output at all is over quota
+    service.max_output_bytes = 1
+    return service
+
+
+@pytest.fixture
+def saved():
+    names = []
+
+    def save(name: str, job_id: str = "none") -> str:
+        storage.save_output(name, b"png bytes", "ep-retention", "t", job_id)
+        names.append(name)
+        return name
+
+    yield save
+    for name in names:
+        storage.delete_output(name)
+
+
+def _job_with_output(queue, name: str, source: str) -> str:
+    job_id = queue.create_job("t", "ep-retention", {}, source=source).id
+    queue.claim("worker", lease_seconds=60)
+    queue.complete_job(job_id, [{"filename": name}], "worker")
+    return job_id
+
+
+def _swept(report) -> set[str]:
+    return {output["filename"] for output in report.outputs}
+
+
+def test_quota_spares_approved_and_in_flight_outputs(queue, retention, saved):
+    approved = saved("ret-approved.png")
+    assert queue.get_status(_job_with_output(queue, approved, source="ui")) == "approved"
+    pending = saved("ret-pending.png")
+    _job_with_output(queue, pending, source="api")
+    running_job = queue.create_job("t", "ep-retention", {}).id
+    running = saved("ret-running.png", job_id=running_job)
+    orphan = saved("ret-orphan.png")
+
+    report = asyncio.run(retention.sweep())
+
+    swept = _swept(report)
+    assert orphan in swept
+    assert not swept & {approved, pending, running}
+    assert storage.get_output_path(orphan) is None
+    assert storage.get_output_path(approved) is not None
+
+
+def test_dry_run_removes_nothing(retention, saved):
+    orphan = saved("ret-dry.png")
+
+    report = asyncio.run(retention.sweep(dry_run=True))
+
+    assert orphan in _swept(report)
+    assert report.bytes_reclaimed >= len(b"png bytes")
+    assert storage.get_output_path(orphan) is not None
+    assert retention.last_report is None
+
+
+def test_staging_file_gone_before_the_sweep_is_skipped(retention, tmp_path, monkeypatch):
+    leftover = tmp_path / ".upload-leftover"
+    leftover.write_bytes(b"x" * 10)
+    candidates = [("file", str(tmp_path / ".upload-finished")), ("file", str(leftover))]
+    monkeypatch.setattr(retention, "_temp_candidates", lambda: candidates)
+    retention.max_output_bytes = 0
+
+    report = asyncio.run(retention.sweep())
+
+    assert report.temp_files == [str(leftover)]
+    assert report.bytes_reclaimed == 10
+    assert not leftover.exists()
+
+
+def test_protect_approved_marks_outputs_in_batches(queue, retention, saved, monkeypatch):
+    monkeypatch.setattr(retention_module, "APPROVE_BATCH", 2)
+    names = [saved(f"ret-batch-{i}.png") for i in range(5)]
+    for name in names:
+        _job_with_output(queue, name, source="ui")
+    batches = []
+    mark = storage.output_catalog.set_approved_many
+    monkeypatch.setattr(
+        storage.output_catalog, "set_approved_many", lambda names: (batches.append(len(names)), mark(names))
+    )
+
+    retention._protect_approved()
+
+    assert sum(batches) == 5
+    assert max(batches) == 2
@@ -0,0 +1,149 @@
+"""JobScheduler: admission, fair claiming, and how a job attempt ends."""
+
+import asyncio
+
+import pytest
+
+from services.scheduler import JobCancelled, LeaseLost, QueueFullError
+
+
+def _claim(queue, scheduler, lease_seconds: float = 60):
+    queue.create_job("t", "ep", {}, source="api")
+    return queue.claim(scheduler.worker_id, lease_seconds=lease_seconds)
+
+
+def test_lost_lease_is_not_a_completion(queue, scheduler):
+    job = _claim(queue, scheduler, lease_seconds=-1)
+    queue.requeue_expired()
+    queue.claim("worker-2", lease_seconds=60)
+    cleaned = []
+
+    async def handler(job, context):
+        context.on_cancel(lambda: cleaned.append(job.id))
+        assert not queue.complete_job(job.id, [], scheduler.worker_id)
+        await context.checkpoint()  # still processing: no cancel, no lost status
+        context.stop("lost")
+        raise LeaseLost("lost")
+
+    scheduler.register("generate", handler)
+    asyncio.run(scheduler._run(job))
+
+    metrics = scheduler.metrics()
+    assert (metrics["completed"], metrics["failed"], metrics["leases_lost"]) == (0, 0, 1)
+    # The outputs share their names with the new owner's, so they stay
+    assert cleaned == []
+    assert queue.get_job(job.id).lease_owner == "worker-2"
+
+
+def test_checkpoint_raises_lease_lost_after_a_requeue(queue, scheduler):
+    job = _claim(queue, scheduler, lease_seconds=-1)
+    queue.requeue_expired()
+    raised = []
+
+    async def handler(job, context):
+        try:
+            await context.checkpoint()
+        except JobCancelled as e:
+            raised.append(type(e))
+            raise
+
+    scheduler.register("generate", handler)
+    asyncio.run(scheduler._run(job))
+
+    assert raised == [LeaseLost]
+    assert scheduler.metrics()["leases_lost"] == 1
+    assert queue.get_status(job.id) == "queued"
+
+
+def test_cancelled_job_cleans_up(queue, scheduler):
+    job = _claim(queue, scheduler)
+    cleaned = []
+
+    async def handler(job, context):
+        context.on_cancel(lambda: cleaned.append(job.id))
+        queue.cancel_job(job.id)
+        await context.checkpoint()
+
+    scheduler.register("generate", handler)
+    asyncio.run(scheduler._run(job))
+
+    assert cleaned == [job.id]
+    assert scheduler.metrics()["cancelled"] == 1
+
+
+def test_shutdown_releases_the_job(queue, scheduler):
+    job = _claim(queue, scheduler)
+
+    async def handler(job, context):
+        await asyncio.sleep(60)
+
+    async def shut_down():
+        task = asyncio.create_task(scheduler._run(job))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    scheduler.register("generate", handler)
+    asyncio.run(shut_down())
+
+    job = queue.get_job(job.id)
+    assert (job.status, job.attempts, job.lease_owner) == ("queued", 0, None)
+
+
+def _submit(scheduler, client_id: str = "a", priority: str = "api"):
+    return asyncio.run(scheduler.submit("t", "ep", {}, priority=priority, client_id=client_id))
+
+
+def test_submit_rejects_beyond_the_queue_depth(scheduler):
+    scheduler.max_depth, scheduler.max_per_client = 3, 3
+    for client in ("a", "b", "c"):
+        _submit(scheduler, client)
+
+    with pytest.raises(QueueFullError) as rejected:
+        _submit(scheduler, "d")
+
+    assert rejected.value.retry_after >= 1
+    metrics = scheduler.metrics()
+    assert (metrics["submitted"], metrics["rejected"], metrics["depth"]) == (3, 1, 3)
+
+
+def test_submit_rejects_beyond_a_clients_share(scheduler):
+    scheduler.max_depth, scheduler.max_per_client = 10, 2
+    _submit(scheduler, "noisy")
+    _submit(scheduler, "noisy")
+
+    with pytest.raises(QueueFullError):
+        _submit(scheduler, "noisy")
+    assert _submit(scheduler, "quiet").client_id == "quiet"
+
+
+def test_claims_go_by_priority_then_fewest_running_per_client(queue, scheduler):
+    backfill = _submit(scheduler, "a", "backfill").id
+    busy = [_submit(scheduler, "busy").id for _ in range(3)]
+    quiet = _submit(scheduler, "quiet").id
+    ui = _submit(scheduler, "b", "ui").id
+
+    order = [queue.claim(f"worker-{n}", lease_seconds=60).id for n in range(6)]
+
+    # "busy" has a job running after its first claim, so "quiet" goes next
+    assert order == [ui, busy[0], quiet, busy[1], busy[2], backfill]
+
+
+def test_retry_is_all_or_nothing(queue, scheduler):
+    scheduler.max_depth, scheduler.max_per_client = 3, 3
+    failed = []
+    for _ in range(2):
+        job = _submit(scheduler)
+        queue.cancel_job(job.id)
+        failed.append(job.id)
+    _submit(scheduler)
+    _submit(scheduler)
+
+    with pytest.raises(QueueFullError):
+        asyncio.run(scheduler.retry(failed))
+    assert {queue.get_status(job_id) for job_id in failed} == {"cancelled"}
+
+    assert [job.id for job in asyncio.run(scheduler.retry(failed[:1]))] == failed[:1]
@@ -0,0 +1,67 @@
+"""ETags, 304s and Cache-Control on the /static mounts."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.static_files import IMMUTABLE, REVALIDATE
+from services.storage import storage
+
+
+@pytest.fixture
+def client():
+    # Without the context manager, so startup (workers, feeds) doesn't run
+    return TestClient(app)
+
+
+@pytest.fixture
+def output():
+    saved = storage.save_output("ep-static-t.png", b"rendered", "ep-static", "t", "job-static")
+    yield saved
+    storage.delete_output(saved["filename"])
+
+
+def test_output_has_etag_and_revalidates(client, output):
+    response = client.get(f"/static/outputs/{output['filename']}")
+
+    assert response.status_code == 200
+    assert response.content == b"rendered"
+    assert response.headers["etag"] == f'"{output["hash"]}"'
+    assert response.headers["cache-control"] == REVALIDATE
+
+    again = client.get(
+        f"/static/outputs/{output['filename']}", headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_changed_output_is_not_a_304(client, output):
+    etag = client.get(f"/static/outputs/{output['filename']}").headers["etag"]
+    storage.save_output(output["filename"], b"rendered again", "ep-static", "t", "job-static-2")
+
+    response = client.get(f"/static/outputs/{output['filename']}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.content == b"rendered again"
+
+
+def test_only_the_current_version_is_immutable(client, output):
+    current = output["hash"][:16]
+    response = client.get(f"/static/outputs/{output['filename']}?v={current}")
+    assert response.headers["cache-control"] == IMMUTABLE
+
+    for version in ("0" * 16, "abc", output["hash"][:8], ""):
+        response = client.get(f"/static/outputs/{output['filename']}?v={version}")
+        assert response.headers["cache-control"] == REVALIDATE, version
+
+
+def test_blobs_are_immutable(client):
+    asset = storage.save_asset("backgrounds", "static-bg.png", b"background")
+    try:
+        response = client.get(asset["url"])
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE
+        assert response.headers["etag"] == f'"{asset["hash"]}"'
+    finally:
+        storage.delete_asset("backgrounds", "static-bg.png")
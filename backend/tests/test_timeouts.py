@@ -0,0 +1,55 @@
+"""Per-job deadlines: request validation, the scheduler's default and the render pool."""
+
+import asyncio
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from models import GenerateRequest, Template
+from services.render_pool import RenderPool, RenderTimeout
+
+
+@pytest.mark.parametrize("timeout_seconds", [0, -5])
+def test_timeout_must_be_positive(timeout_seconds):
+    with pytest.raises(ValidationError):
+        GenerateRequest(template_id="t", episode_id="ep", data={}, timeout_seconds=timeout_seconds)
+    assert GenerateRequest(template_id="t", episode_id="ep", data={}).timeout_seconds is None
+
+
+def _run_for_timeout(queue, scheduler, params: dict) -> float:
+    """Run one job through the scheduler and return the timeout its handler saw."""
+    scheduler.job_timeout = 300
+    seen = []
+
+    async def handler(job, context):
+        seen.append(context.timeout)
+        queue.complete_job(job.id, [], scheduler.worker_id)
+
+    scheduler.register("generate", handler)
+    queue.create_job("t", "ep", {}, params=params)
+    job = queue.claim(scheduler.worker_id, lease_seconds=60)
+    asyncio.run(scheduler._run(job))
+    return seen[0]
+
+
+def test_job_timeout_overrides_the_default(queue, scheduler):
+    assert _run_for_timeout(queue, scheduler, {"timeout_seconds": 7}) == pytest.approx(7, abs=1)
+
+
+def test_missing_job_timeout_uses_the_default(queue, scheduler):
+    assert _run_for_timeout(queue, scheduler, {"timeout_seconds": None}) == pytest.approx(300, abs=1)
+
+
+def test_waiting_for_a_worker_counts_against_the_deadline():
+    async def render():
+        pool = RenderPool(processes=1, timeout=60)
+        # Started, but its only worker is busy elsewhere
+        pool._idle = asyncio.Queue()
+        pool._starting = asyncio.create_task(asyncio.sleep(0))
+        started = time.monotonic()
+        with pytest.raises(RenderTimeout):
+            await pool.render(Template(id="t", name="t", pipeline="x"), {}, timeout=0.1)
+        return time.monotonic() - started
+
+    assert asyncio.run(render()) < 5
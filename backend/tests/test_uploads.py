@@ -0,0 +1,97 @@
+"""Asset uploads: staging, validation, the upload endpoint, and fonts resolved by stem."""
+
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from main import app
+from models import TemplateCreate
+from services.renderer import renderer
+from services.storage import storage
+from services.uploads import UploadRejected, UploadTooLarge, stage_upload, validate_asset
+
+FONT = b"OTTO" + b"\0" * 60
+
+
+def _image(format: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (200, 40, 40)).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def test_stage_upload_hashes_while_copying(tmp_path):
+    staged = stage_upload(io.BytesIO(b"x" * 3000), tmp_path, max_bytes=5000)
+
+    assert staged.size == 3000
+    assert staged.path.read_bytes() == b"x" * 3000
+    staged.discard()
+    assert not staged.path.exists()
+
+
+def test_stage_upload_stops_at_the_limit(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        stage_upload(io.BytesIO(b"x" * 3000), tmp_path, max_bytes=2000)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    "asset_type, filename, content",
+    [
+        ("fonts", "Font.ttf", b"not a font"),
+        ("fonts", "Font.exe", FONT),
+        ("backgrounds", "bg.png", b"not an image"),
+        ("backgrounds", "bg.gif", _image("GIF")),
+        ("backgrounds", "bg.png", _image("GIF")),
+    ],
+)
+def test_invalid_assets_are_rejected(tmp_path, asset_type, filename, content):
+    path = tmp_path / "staged"
+    path.write_bytes(content)
+
+    with pytest.raises(UploadRejected):
+        validate_asset(asset_type, filename, path)
+
+
+@pytest.mark.parametrize(
+    "asset_type, filename, content",
+    [("fonts", "Font.otf", FONT), ("backgrounds", "bg.jpg", _image("JPEG")), ("overlays", "o.webp", _image("WEBP"))],
+)
+def test_valid_assets_pass(tmp_path, asset_type, filename, content):
+    path = tmp_path / "staged"
+    path.write_bytes(content)
+
+    validate_asset(asset_type, filename, path)
+
+
+def test_upload_endpoint():
+    client = TestClient(app)
+
+    response = client.post("/api/assets/backgrounds", files={"file": ("upload-bg.png", _image(), "image/png")})
+    assert response.status_code == 200
+    assert response.json()["filename"] == "upload-bg.png"
+    # Nothing left behind in staging
+    assert not list(storage.asset_store.blobs_dir.glob(".upload-*"))
+
+    rejected = client.post("/api/assets/backgrounds", files={"file": ("bad.png", b"nope", "image/png")})
+    assert rejected.status_code == 415
+    assert client.post("/api/assets/nope", files={"file": ("a.png", _image(), "image/png")}).status_code == 400
+    assert client.post("/api/assets/backgrounds", files={"file": ("../a.png", _image(), "image/png")}).status_code == 400
+
+    storage.delete_asset("backgrounds", "upload-bg.png")
+
+
+def test_fonts_of_any_format_resolve_by_stem():
+    storage.save_asset("fonts", "StemFont.otf", FONT)
+    template = storage.create_template(TemplateCreate(name="t", pipeline="x"))
+    storage.update_template(template.id, {
+        "zones": {"title": {"type": "text", "font": "StemFont", "position": {"x": 0, "y": 0, "width": 10, "height": 10}}}
+    })
+
+    assert renderer._resolve_font("StemFont").endswith(".otf")
+    assert renderer._resolve_font("NotUploaded") == "NotUploaded"
+    assert storage.asset_references()[("fonts", "StemFont.otf")] == [template.id]
+
+    storage.delete_template(template.id)
+    storage.delete_asset("fonts", "StemFont.otf")
@@ -0,0 +1,84 @@
+"""Streaming ZIP archives: stream_zip and GET /api/outputs/export."""
+
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services import zip_stream
+from services.storage import storage
+from services.zip_stream import stream_zip
+
+
+def test_archive_is_valid_and_streamed_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_stream, "CHUNK_SIZE", 1024)
+    image = tmp_path / "a.png"
+    image.write_bytes(bytes(range(256)) * 40)
+    notes = tmp_path / "notes.txt"
+    notes.write_text("hello " * 1000)
+
+    chunks = list(stream_zip([("a.png", image), ("notes.txt", notes)], [("manifest.json", b"{}")]))
+
+    assert len(chunks) > 3
+    assert max(len(chunk) for chunk in chunks) < 4096
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.png", "notes.txt", "manifest.json"]
+        assert archive.getinfo("a.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read("a.png") == image.read_bytes()
+
+
+def test_extra_entries_see_every_file_written(tmp_path):
+    written = []
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.png"
+        path.write_bytes(b"x" * i)
+        paths.append(path)
+
+    def files():
+        for path in paths:
+            written.append(path.name)
+            yield path.name, path
+
+    def extra():
+        yield "manifest.json", json.dumps(written).encode()
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(files(), extra())))) as archive:
+        assert json.loads(archive.read("manifest.json")) == ["0.png", "1.png", "2.png"]
+
+
+@pytest.fixture
+def outputs():
+    names = [f"ep-zip-t{i}.png" for i in range(2)]
+    for name in names:
+        storage.save_output(name, name.encode(), "ep-zip", "t", "job-zip")
+    yield names
+    for name in names:
+        storage.delete_output(name)
+
+
+def test_export_streams_the_matching_outputs(outputs):
+    client = TestClient(app)
+
+    response = client.get("/api/outputs/export", params={"episode_id": "ep-zip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert 'filename="ep-zip-outputs.zip"' in response.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == sorted(outputs + ["manifest.json"])
+        manifest = json.loads(archive.read("manifest.json"))
+    assert sorted(entry["filename"] for entry in manifest["outputs"]) == sorted(outputs)
+    assert manifest["filters"]["episode_id"] == "ep-zip"
+
+
+def test_export_needs_a_filter():
+    client = TestClient(app)
+
+    assert client.get("/api/outputs/export").status_code == 400
+    assert client.get("/api/outputs/export", params={"since": "yesterday"}).status_code == 400
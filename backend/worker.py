@@ -0,0 +1,53 @@
+"""
+Standalone queue worker.
+
+Runs scheduler workers without the API, claiming jobs from the shared
+queue in data/queue.db:
+
+    cd backend && python worker.py
+
+Start as many as needed on the host that holds the data directory (the
+queue is SQLite, so it can't be shared over a network filesystem). API processes that should only enqueue can set
+SCHEDULER_WORKERS=0.
+"""
+
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import services.pipeline  # registers the "generate" job handler
+from services.async_storage import async_storage
+from services.change_feed import change_feed
+from services.gemini_client import gemini
+from services.render_pool import render_pool
+from services.scheduler import scheduler
+
+
+async def main():
+    if scheduler.worker_count < 1:
+        raise SystemExit("SCHEDULER_WORKERS must be at least 1 for a worker process")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    change_feed.start()
+    await render_pool.start()
+    await scheduler.start()
+    print(f"Worker {scheduler.worker_id}: {scheduler.worker_count} workers")
+    await stop.wait()
+
+    # Jobs still running go straight back to the queue
+    await scheduler.stop()
+    await render_pool.stop()
+    change_feed.stop()
+    await gemini.close()
+    async_storage.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,7 @@ import type {
   Template,
   Asset,
   Output,
+  OutputPage,
   GenerateRequest,
   GenerateResponse,
   AnalysisContext,
@@ -48,20 +49,36 @@ export const assets = {
     return api.post<Asset>(`/api/assets/${type}`, formData).then((r) => r.data);
   },
 
-  delete: (type: string, filename: string) =>
-    api.delete(`/api/assets/${type}/${filename}`),
+  delete: (type: string, filename: string, force = false) =>
+    api.delete(`/api/assets/${type}/${filename}`, { params: force ? { force: true } : {} }),
 
   getUrl: (type: string, filename: string) =>
     `${API_BASE}/static/assets/${type}/${filename}`,
+
+  // Small gallery thumbnail when the server has built one
+  getThumbnailUrl: (asset: Asset) =>
+    asset.thumbnail_url
+      ? `${API_BASE}${asset.thumbnail_url}`
+      : `${API_BASE}/static/assets/${asset.type}/${asset.filename}`,
 };
 
 // Outputs
 export const outputs = {
-  list: () => api.get<Output[]>("/api/outputs").then((r) => r.data),
+  list: (params: { limit?: number; cursor?: string; episode_id?: string; template_id?: string } = {}) =>
+    api
+      .get<OutputPage>("/api/outputs", { params: { limit: 200, ...params } })
+      .then((r) => r.data.items),
+
+  page: (params: { limit?: number; cursor?: string; episode_id?: string; template_id?: string } = {}) =>
+    api.get<OutputPage>("/api/outputs", { params }).then((r) => r.data),
 
   delete: (filename: string) => api.delete(`/api/outputs/${filename}`),
 
   getUrl: (filename: string) => `${API_BASE}/static/outputs/${filename}`,
+
+  // Small WebP for galleries; versioned URLs are cached by the browser
+  getThumbnailUrl: (output: Output) =>
+    `${API_BASE}${output.thumbnail_url ?? `/static/thumbs/${output.filename}`}`,
 };
 
 // Generate
@@ -72,6 +89,9 @@ export const generate = {
   status: (jobId: string) =>
     api.get<GenerateResponse>(`/api/generate/${jobId}/status`).then((r) => r.data),
 
+  cancel: (jobId: string) =>
+    api.post<GenerateResponse>(`/api/generate/${jobId}/cancel`).then((r) => r.data),
+
   preview: (templateId: string, data: Record<string, string>) =>
     api
       .post<{ image: string; format: string }>("/api/generate/preview", {
@@ -89,13 +109,65 @@ export const generate = {
       .then((r) => r.data),
 };
 
+// Events (Server-Sent Events)
+export interface JobEvent {
+  id: number;
+  topic: "generate" | "queue";
+  job_id: string;
+  event: string;
+  timestamp: number;
+  data: Record<string, unknown>;
+}
+
+const TERMINAL_GENERATE_EVENTS = ["complete", "error", "cancelled"];
+
+export const events = {
+  subscribe: (
+    params: { topic?: "generate" | "queue"; jobId?: string; lastEventId?: number },
+    onEvent: (event: JobEvent) => void,
+  ) => {
+    const query = new URLSearchParams();
+    if (params.topic) query.set("topic", params.topic);
+    if (params.jobId) query.set("job_id", params.jobId);
+    if (params.lastEventId !== undefined) query.set("last_event_id", String(params.lastEventId));
+    const source = new EventSource(`${API_BASE}/api/events?${query}`);
+    source.onmessage = (e) => onEvent(JSON.parse(e.data));
+    const eventNames = [
+      "queued", "started", "background_from_pool", "generating_background", "rendering", "saved",
+      "complete", "error", "webhook_delivered", "webhook_failed", "reset",
+      "created", "processing", "pending", "approved", "failed", "dead", "cancelled", "deleted", "archived",
+    ];
+    eventNames.forEach((name) =>
+      source.addEventListener(name, (e) => onEvent(JSON.parse((e as MessageEvent).data))),
+    );
+    return source;
+  },
+
+  // Resolves when a generate job completes, fails or is cancelled; rejects if the stream breaks
+  waitForJob: (jobId: string) =>
+    new Promise<JobEvent>((resolve, reject) => {
+      const source = events.subscribe({ topic: "generate", jobId, lastEventId: 0 }, (event) => {
+        // An error with another attempt to come isn't the end of the job
+        if (TERMINAL_GENERATE_EVENTS.includes(event.event) && !event.data.retrying) {
+          source.close();
+          resolve(event);
+        }
+      });
+      source.onerror = () => {
+        source.close();
+        reject(new Error("Event stream disconnected"));
+      };
+    }),
+};
+
 // Analyze
 export const analyze = {
-  thumbnail: (imageBase64: string, context: AnalysisContext) =>
+  thumbnail: (imageBase64: string, context: AnalysisContext, forceRefresh = false) =>
     api
       .post<AnalysisResult>("/api/analyze", {
         image: imageBase64,
         context,
+        force_refresh: forceRefresh,
       })
       .then((r) => r.data),
 };
@@ -105,5 +177,6 @@ export default {
   assets,
   outputs,
   generate,
+  events,
   analyze,
 };
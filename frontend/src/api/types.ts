@@ -116,14 +116,31 @@ export interface Asset {
   path: string;
   type: string;
   size?: number;
+  hash?: string | null;
+  url?: string | null;
+  thumbnail_url?: string | null;
+  used_by?: string[];
+  font?: { family: string; style: string; ascent: number; descent: number } | null;
 }
 
 export interface Output {
   id: string;
   filename: string;
   path: string;
+  url?: string;
+  thumbnail_url?: string;
+  hash?: string | null;
   size: number;
+  format?: string;
   created_at: string;
+  episode_id?: string | null;
+  template_id?: string | null;
+  job_id?: string | null;
+}
+
+export interface OutputPage {
+  items: Output[];
+  next_cursor: string | null;
 }
 
 export interface GenerateRequest {
@@ -132,6 +149,8 @@ export interface GenerateRequest {
   data: Record<string, string>;
   variants?: number;
   webhook_url?: string;
+  priority?: "ui" | "api" | "backfill";
+  client_id?: string;
 }
 
 export interface GenerateResponse {
@@ -178,4 +197,7 @@ export interface AnalysisResult {
   top_priorities: AnalysisPriority[];
   categories: AnalysisCategory[];
   error?: string;
+  // Served from the analysis cache (cached_at is when it was analyzed)
+  cached?: boolean;
+  cached_at?: number;
 }
@@ -127,7 +127,7 @@ export function AnalysisPanel() {
   }, []);
 
   // Handle analyze button click
-  const handleAnalyze = async () => {
+  const handleAnalyze = async (forceRefresh = false) => {
     setAnalysisError(null);
     setAnalyzing(true);
 
@@ -149,7 +149,7 @@ export function AnalysisPanel() {
       };
 
       // Call API
-      const result = await api.analyze.thumbnail(imageBase64, context);
+      const result = await api.analyze.thumbnail(imageBase64, context, forceRefresh);
       setAnalysisResult(result);
     } catch (error) {
       const message = error instanceof Error ? error.message : "Analysis failed";
@@ -290,7 +290,7 @@ export function AnalysisPanel() {
 
           {/* Analyze Button */}
           <button
-            onClick={handleAnalyze}
+            onClick={() => handleAnalyze()}
             disabled={analysisPanel.isAnalyzing}
             className="w-full py-3 bg-purple-600 hover:bg-purple-700 disabled:bg-purple-600/50 disabled:cursor-not-allowed text-white font-semibold rounded-lg transition-colors flex items-center justify-center gap-2"
           >
@@ -362,6 +362,24 @@ export function AnalysisPanel() {
           {/* Results Display Area */}
           {analysisPanel.result && (
             <div className="space-y-4">
+              {/* Cached result notice */}
+              {analysisPanel.result.cached && (
+                <div className="flex items-center justify-between text-xs text-white/40">
+                  <span>
+                    Cached result
+                    {analysisPanel.result.cached_at &&
+                      ` from ${new Date(analysisPanel.result.cached_at * 1000).toLocaleString()}`}
+                  </span>
+                  <button
+                    onClick={() => handleAnalyze(true)}
+                    disabled={analysisPanel.isAnalyzing}
+                    className="text-purple-400 hover:text-purple-300 disabled:opacity-50"
+                  >
+                    Re-analyze
+                  </button>
+                </div>
+              )}
+
               {/* Overall Score */}
               <OverallScore
                 score={analysisPanel.result.overall_score}
@@ -103,7 +103,7 @@ export function AssetLibrary() {
                 className="group relative rounded-xl overflow-hidden bg-surface-elevated border border-border hover:border-accent/50 transition-all"
               >
                 <img
-                  src={assetsApi.getUrl("backgrounds", asset.filename)}
+                  src={assetsApi.getThumbnailUrl(asset)}
                   alt={asset.filename}
                   className="w-full aspect-video object-cover"
                 />
@@ -167,7 +167,7 @@ export function AssetLibrary() {
               >
                 <div className="aspect-square flex items-center justify-center p-2">
                   <img
-                    src={assetsApi.getUrl("subjects", asset.filename)}
+                    src={assetsApi.getThumbnailUrl(asset)}
                     alt={asset.filename}
                     className="max-w-full max-h-full object-contain"
                   />
@@ -271,7 +271,7 @@ export function AssetLibrary() {
               >
                 <div className="aspect-square flex items-center justify-center p-2">
                   <img
-                    src={assetsApi.getUrl("keeper", asset.filename)}
+                    src={assetsApi.getThumbnailUrl(asset)}
                     alt={asset.filename}
                     className="max-w-full max-h-full object-contain"
                   />
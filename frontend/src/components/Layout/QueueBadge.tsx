@@ -1,10 +1,15 @@
+import { useEffect } from 'react';
 import { useStore } from '../../store';
 
 export function QueueBadge() {
-  const { toggleQueuePanel, queuePanelOpen } = useStore();
+  const { toggleQueuePanel, queuePanelOpen, queueCounts, loadQueue } = useStore();
 
-  // TODO: Replace with actual queue count from store
-  const queueCount = 0;
+  useEffect(() => {
+    loadQueue();
+  }, [loadQueue]);
+
+  // Thumbnails waiting for review, across the whole queue
+  const queueCount = queueCounts.pending ?? 0;
 
   return (
     <button
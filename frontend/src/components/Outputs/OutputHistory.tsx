@@ -42,8 +42,9 @@ export function OutputHistory() {
             >
               <div className="relative">
                 <img
-                  src={outputsApi.getUrl(output.filename)}
+                  src={outputsApi.getThumbnailUrl(output)}
                   alt={output.filename}
+                  loading="lazy"
                   className="w-full aspect-video object-cover"
                 />
                 <div className="absolute top-2 right-2 opacity-0 group-hover:opacity-100 transition-opacity">
@@ -1,23 +1,32 @@
 import { useEffect } from 'react';
 import { useStore } from '../../store';
+import api from '../../api/client';
 
 export function QueuePanel() {
   const {
     queuePanelOpen,
     setQueuePanelOpen,
     queue,
+    queueCursor,
+    queueCounts,
     loadQueue,
+    loadMoreQueue,
+    applyQueueEvent,
     approveJob,
+    approveAllPending,
     deleteJob,
+    cancelJob,
     autoApprove,
     setAutoApprove
   } = useStore();
 
   useEffect(() => {
-    if (queuePanelOpen) {
-      loadQueue();
-    }
-  }, [queuePanelOpen, loadQueue]);
+    if (!queuePanelOpen) return;
+    loadQueue();
+    // Live updates instead of re-fetching the whole queue
+    const source = api.events.subscribe({ topic: 'queue' }, applyQueueEvent);
+    return () => source.close();
+  }, [queuePanelOpen, loadQueue, applyQueueEvent]);
 
   return (
     <>
@@ -38,6 +47,14 @@ export function QueuePanel() {
         {/* Header */}
         <div className="flex items-center justify-between px-4 py-3 border-b border-border">
           <h2 className="text-lg font-semibold text-white font-display">Queue</h2>
+          {(queueCounts.pending ?? 0) > 0 && (
+            <button
+              onClick={() => approveAllPending()}
+              className="ml-auto mr-2 px-2 py-1 text-xs text-accent hover:bg-accent/10 rounded transition-colors"
+            >
+              Approve all ({queueCounts.pending})
+            </button>
+          )}
           <button
             onClick={() => setQueuePanelOpen(false)}
             className="p-2 text-white/60 hover:text-white hover:bg-surface-elevated rounded-lg transition-colors"
@@ -67,7 +84,7 @@ export function QueuePanel() {
                 <div className="flex gap-3">
                   <div className="w-16 h-9 bg-surface-elevated rounded overflow-hidden flex-shrink-0">
                     {item.output_path ? (
-                      <img src={`/static/outputs/${item.output_path}`} alt="" className="w-full h-full object-cover" />
+                      <img src={`/static/thumbs/${item.output_path}`} alt="" className="w-full h-full object-cover" />
                     ) : (
                       <div className="w-full h-full flex items-center justify-center">
                         <svg className="w-4 h-4 text-white/20" fill="none" stroke="currentColor" viewBox="0 0 24 24">
@@ -104,13 +121,25 @@ export function QueuePanel() {
                         </button>
                       </>
                     )}
-                    {item.status === 'processing' && (
-                      <svg className="w-4 h-4 text-accent animate-spin" fill="none" viewBox="0 0 24 24">
-                        <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4" />
-                        <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z" />
-                      </svg>
+                    {(item.status === 'queued' || item.status === 'processing') && (
+                      <>
+                        <svg className="w-4 h-4 text-accent animate-spin" fill="none" viewBox="0 0 24 24">
+                          <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4" />
+                          <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z" />
+                        </svg>
+                        <button
+                          onClick={() => cancelJob(item.id)}
+                          className="p-1 text-white/40 hover:text-red-400 hover:bg-red-400/10 rounded"
+                          title="Cancel"
+                        >
+                          ■
+                        </button>
+                      </>
                     )}
-                    {item.status === 'failed' && (
+                    {item.status === 'cancelled' && (
+                      <span className="text-white/40" title="Cancelled">–</span>
+                    )}
+                    {(item.status === 'failed' || item.status === 'dead') && (
                       <span className="text-red-400" title={item.error}>✗</span>
                     )}
                   </div>
@@ -118,6 +147,14 @@ export function QueuePanel() {
               </div>
             ))
           )}
+          {queueCursor && (
+            <button
+              onClick={() => loadMoreQueue()}
+              className="w-full py-2 text-xs text-white/60 hover:text-white hover:bg-surface-elevated rounded-lg transition-colors"
+            >
+              Load more
+            </button>
+          )}
         </div>
 
         {/* Settings */}
@@ -1,13 +1,15 @@
 import { create } from "zustand";
+import { isAxiosError } from "axios";
 import type { Template, Asset, Output, AnalysisResult } from "../api/types";
 import api from "../api/client";
+import type { JobEvent } from "../api/client";
 
 interface QueueJob {
   id: string;
   template_id: string;
   episode_id: string;
   data: Record<string, string>;
-  status: 'processing' | 'pending' | 'approved' | 'failed';
+  status: 'queued' | 'processing' | 'pending' | 'approved' | 'failed' | 'dead' | 'cancelled';
   source: 'ui' | 'api';
   created_at: string;
   completed_at?: string;
@@ -27,10 +29,16 @@ interface AppState {
 
   // Queue data
   queue: QueueJob[];
+  queueCursor: string | null;
+  queueCounts: Record<string, number>;
   autoApprove: boolean;
   loadQueue: () => Promise<void>;
+  loadMoreQueue: () => Promise<void>;
+  applyQueueEvent: (event: JobEvent) => void;
   approveJob: (jobId: string) => Promise<void>;
+  approveAllPending: () => Promise<void>;
   deleteJob: (jobId: string) => Promise<void>;
+  cancelJob: (jobId: string) => Promise<void>;
   setAutoApprove: (enabled: boolean) => Promise<void>;
 
   // Templates
@@ -89,6 +97,13 @@ interface AppState {
   setAnalysisError: (error: string | null) => void;
 }
 
+// Most job ids one /api/queue/bulk/* request accepts
+const BULK_MAX_IDS = 5000;
+
+// Status counts are re-read at most this often while queue events stream in
+const COUNTS_REFRESH_MS = 1000;
+let countsRefresh: ReturnType<typeof setTimeout> | null = null;
+
 export const useStore = create<AppState>((set, get) => ({
   // Mode state
   mode: 'generate',
@@ -101,18 +116,91 @@ export const useStore = create<AppState>((set, get) => ({
 
   // Queue data
   queue: [],
+  queueCursor: null,
+  queueCounts: {},
   autoApprove: true,
 
   loadQueue: async () => {
     try {
       const response = await fetch('/api/queue');
       const data = await response.json();
-      set({ queue: data.jobs || [] });
+      set({ queue: data.jobs || [], queueCursor: data.next_cursor ?? null, queueCounts: data.counts || {} });
     } catch (error) {
       console.error('Failed to load queue:', error);
     }
   },
 
+  loadMoreQueue: async () => {
+    const cursor = get().queueCursor;
+    if (!cursor) return;
+    try {
+      const response = await fetch(`/api/queue?${new URLSearchParams({ cursor })}`);
+      const data = await response.json();
+      set((state) => {
+        // Live events may already have added some of these jobs
+        const loaded = new Set(state.queue.map((j) => j.id));
+        const jobs = (data.jobs || []).filter((j: QueueJob) => !loaded.has(j.id));
+        return { queue: [...state.queue, ...jobs], queueCursor: data.next_cursor ?? null, queueCounts: data.counts || {} };
+      });
+    } catch (error) {
+      console.error('Failed to load more of the queue:', error);
+    }
+  },
+
+  applyQueueEvent: (event: JobEvent) => {
+    if (event.event === "reset") {
+      get().loadQueue();
+      return;
+    }
+    set((state) => {
+      const others = state.queue.filter((j) => j.id !== event.job_id);
+      if (event.event === "deleted" || !event.data.job) {
+        return { queue: others };
+      }
+      return { queue: [event.data.job as QueueJob, ...others] };
+    });
+    // Events don't say what a job's status was, so counts are re-read
+    if (!countsRefresh) {
+      countsRefresh = setTimeout(async () => {
+        countsRefresh = null;
+        try {
+          const data = await (await fetch('/api/queue?limit=1')).json();
+          set({ queueCounts: data.counts || {} });
+        } catch (error) {
+          console.error('Failed to refresh queue counts:', error);
+        }
+      }, COUNTS_REFRESH_MS);
+    }
+  },
+
+  approveAllPending: async () => {
+    try {
+      // Collect every pending id page by page, then approve them in as few requests as the API allows
+      const ids: string[] = [];
+      let cursor: string | null = null;
+      do {
+        const params = new URLSearchParams({ status: 'pending', limit: '500' });
+        if (cursor) params.set('cursor', cursor);
+        const page = await (await fetch(`/api/queue?${params}`)).json();
+        ids.push(...page.jobs.map((j: QueueJob) => j.id));
+        cursor = page.next_cursor;
+      } while (cursor);
+      for (let i = 0; i < ids.length; i += BULK_MAX_IDS) {
+        const response = await fetch('/api/queue/bulk/approve', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ job_ids: ids.slice(i, i + BULK_MAX_IDS) }),
+        });
+        if (!response.ok) {
+          throw new Error(`Bulk approve failed: ${response.status}`);
+        }
+      }
+      get().loadQueue();
+    } catch (error) {
+      console.error('Failed to approve pending jobs:', error);
+    }
+  },
+
   approveJob: async (jobId: string) => {
     try {
       await fetch(`/api/queue/${jobId}/approve`, { method: 'POST' });
@@ -131,6 +219,15 @@ export const useStore = create<AppState>((set, get) => ({
     }
   },
 
+  cancelJob: async (jobId: string) => {
+    try {
+      await fetch(`/api/queue/${jobId}/cancel`, { method: 'POST' });
+      get().loadQueue();
+    } catch (error) {
+      console.error('Failed to cancel job:', error);
+    }
+  },
+
   setAutoApprove: async (enabled: boolean) => {
     try {
       await fetch('/api/queue/settings', {
@@ -211,7 +308,15 @@ export const useStore = create<AppState>((set, get) => ({
   },
 
   deleteAsset: async (type, filename) => {
-    await api.assets.delete(type, filename);
+    try {
+      await api.assets.delete(type, filename);
+    } catch (error) {
+      // 409: still referenced by templates - delete only if the user confirms
+      if (!isAxiosError(error) || error.response?.status !== 409) throw error;
+      const used = error.response.data?.detail?.templates?.length ?? 0;
+      if (!confirm(`${filename} is used by ${used} template(s). Delete anyway?`)) return;
+      await api.assets.delete(type, filename, true);
+    }
     await get().loadAssets();
   },
 
@@ -263,12 +368,20 @@ export const useStore = create<AppState>((set, get) => ({
         episode_id: episodeId,
         data,
         variants: 1,
+        priority: "ui",
       });
 
-      let status = response;
-      while (status.status === "processing") {
-        await new Promise((r) => setTimeout(r, 1000));
-        status = await api.generate.status(response.job_id);
+      if (response.status === "processing") {
+        try {
+          await api.events.waitForJob(response.job_id);
+        } catch {
+          // Stream unavailable - fall back to polling
+          let status = response;
+          while (status.status === "processing") {
+            await new Promise((r) => setTimeout(r, 1000));
+            status = await api.generate.status(response.job_id);
+          }
+        }
       }
 
       await get().loadOutputs();